@@ -20,6 +20,7 @@
 import random, threading, hmac, base64, time, os, json, socket
 from gevent.pywsgi import WSGIServer, WSGIHandler
 from gevent import Timeout
+import gevent
 import flask
 from flask import request, Response, abort, send_from_directory
 import core
@@ -28,9 +29,13 @@ import onionrutils, onionrexceptions, onionrcrypto, blockimporter, onionrevents
 import httpapi
 from httpapi import friendsapi, profilesapi, configapi, miscpublicapi
 from onionrservices import httpheaders
+from daemonqueue import daemonQueue as commandChannel
+import localcommands
 import onionr
 
 config.reload()
+BLOCK_STREAM_DURATION = 45 # seconds, FDSafeHandler ends requests after 60
+
 class FDSafeHandler(WSGIHandler):
     '''Our WSGI handler. Doesn't do much non-default except timeouts'''
     def handle(self):
@@ -71,6 +76,8 @@ class PublicAPI:
         app = flask.Flask('PublicAPI')
         self.i2pEnabled = config.get('i2p.host', False)
         self.hideBlocks = [] # Blocks to be denied sharing
+        self.hashTree = None # Cached utils.reconcile.HashTree of shareable blocks
+        self.hashTreeTime = 0
         self.host = setBindIP(clientAPI._core.publicApiHostFile)
         self.torAdder = clientAPI._core.hsAddress
         self.i2pAdder = clientAPI._core.i2pAddress
@@ -116,6 +123,10 @@ class PublicAPI:
         def getBlockList():
             return httpapi.miscpublicapi.public_block_list(clientAPI, self, request)
 
+        @app.route('/getblockdigest')
+        def getBlockDigest():
+            return httpapi.miscpublicapi.public_block_digest(clientAPI, self, request)
+
         @app.route('/getdata/<name>')
         def getBlockData(name):
             # Share data for a block if we have it
@@ -152,6 +163,11 @@ class PublicAPI:
             '''
             return httpapi.miscpublicapi.upload(clientAPI, request)
 
+        @app.route('/upload/<name>', methods=['post'])
+        def uploadRaw(name):
+            '''Accept a block (named by its hash) uploaded as a raw octet-stream body'''
+            return httpapi.miscpublicapi.raw_upload(clientAPI, request, name)
+
         # Set instances, then startup our public api server
         clientAPI.setPublicAPIInstance(self)
         while self.torAdder == '':
@@ -199,8 +215,14 @@ class API:
         logger.info('Running api on %s:%s' % (self.host, self.bindPort))
         self.httpServer = ''
 
-        self.queueResponse = {}
         onionrInst.setClientAPIInst(self)
+        commandChannel.daemonRunning = True # Commands from this process can skip the http api
+
+        # Let localCommand in this process call these directly instead of over http
+        localcommands.register('ping', lambda arg, postData: self.ping())
+        localcommands.register('lastconnect', lambda arg, postData: self.lastConnect())
+        localcommands.register('waitforshare', lambda arg, postData: self.waitForShare(arg), post=True)
+        localcommands.register('queueResponseAdd', self.queueResponseAdd, post=True)
         app.register_blueprint(friendsapi.friends)
         app.register_blueprint(profilesapi.profile_BP)
         app.register_blueprint(configapi.config_BP)
@@ -303,41 +325,65 @@ class API:
 
         @app.route('/queueResponseAdd/<name>', methods=['post'])
         def queueResponseAdd(name):
-            # Responses from the daemon. TODO: change to direct var access instead of http endpoint
-            self.queueResponse[name] = request.form['data']
-            return Response('success')
+            # Responses from the daemon. The communicator sets these directly, this is kept for out of process use
+            return Response(self.queueResponseAdd(name, request.form))
         
         @app.route('/queueResponse/<name>')
         def queueResponse(name):
-            # Fetch a daemon queue response
-            resp = 'failure'
+            # Fetch a daemon queue response, optionally waiting a few seconds for it to be set
             try:
-                resp = self.queueResponse[name]
-            except KeyError:
-                pass
-            else:
-                del self.queueResponse[name]
-            if resp == 'failure':
-                return resp, 404
+                wait = min(max(float(request.args.get('wait', 0)), 0), 30)
+            except ValueError:
+                wait = 0
+            resp = commandChannel.getResponse(name)
+            waitUntil = time.time() + wait
+            while resp is None and time.time() < waitUntil:
+                gevent.sleep(0.1) # Let the server handle other requests while waiting
+                resp = commandChannel.getResponse(name)
+            if resp is None:
+                return 'failure', 404
             else:
                 return resp
+
+        @app.route('/daemoncommand', methods=['post'])
+        def daemonCommand():
+            # Commands for the communicator from other processes
+            commandChannel.put(request.form['command'], request.form.get('data', ''), request.form.get('responseID', ''))
+            return Response('success')
             
         @app.route('/ping')
         def ping():
             # Used to check if client api is working
-            return Response("pong!")
+            return Response(self.ping())
         
         @app.route('/getblocksbytype/<name>')
         def getBlocksByType(name):
             blocks = self._core.getBlocksByType(name)
             return Response(','.join(blocks))
         
+        @app.route('/blocks/stream')
+        def streamBlocks():
+            # Server-sent events of newly stored block hashes, optionally filtered by type and metadata values
+            blockType = request.args.get('type', None)
+            try:
+                meta = json.loads(request.args.get('meta', '{}'))
+                assert isinstance(meta, dict)
+            except (ValueError, AssertionError):
+                abort(400)
+            try:
+                since = int(request.headers.get('Last-Event-ID', -1))
+            except ValueError:
+                since = -1
+            if since < 0:
+                since = events.get_block_sequence()
+            return Response(self.blockStream(since, blockType, meta), mimetype='text/event-stream')
+
         @app.route('/getblockbody/<name>')
         def getBlockBodyData(name):
             resp = ''
             if self._core._utils.validateHash(name):
                 try:
-                    resp = Block(name, decrypt=True).bcontent
+                    resp = Block(name, core=self._core, decrypt=True, lazy=True).bcontent
                 except TypeError:
                     pass
             else:
@@ -366,7 +412,7 @@ class API:
 
         @app.route('/lastconnect')
         def lastConnect():
-            return Response(str(self.publicAPI.lastRequest))
+            return Response(self.lastConnect())
 
         @app.route('/site/<name>', endpoint='site')
         def site(name):
@@ -390,13 +436,7 @@ class API:
         @app.route('/waitforshare/<name>', methods=['post'])
         def waitforshare(name):
             '''Used to prevent the **public** api from sharing blocks we just created'''
-            assert name.isalnum()
-            if name in self.publicAPI.hideBlocks:
-                self.publicAPI.hideBlocks.remove(name)
-                return Response("removed")
-            else:
-                self.publicAPI.hideBlocks.append(name)
-                return Response("added")
+            return Response(self.waitForShare(name))
 
         @app.route('/shutdown')
         def shutdown():
@@ -480,6 +520,46 @@ class API:
         assert isinstance(inst, PublicAPI)
         self.publicAPI = inst
 
+    def ping(self):
+        '''Used to check if the client api is running. In process, only answer if the http server is serving'''
+        if self.httpServer == '' or self.httpServer.closed:
+            return 'failure'
+        return 'pong!'
+
+    def lastConnect(self):
+        return str(self.publicAPI.lastRequest)
+
+    def waitForShare(self, name):
+        '''Toggle if the **public** api may share a block, to avoid sharing blocks we just created'''
+        assert name.isalnum()
+        if name in self.publicAPI.hideBlocks:
+            self.publicAPI.hideBlocks.remove(name)
+            return "removed"
+        else:
+            self.publicAPI.hideBlocks.append(name)
+            return "added"
+
+    def queueResponseAdd(self, name, postData):
+        commandChannel.setResponse(name, postData['data'])
+        return 'success'
+
+    def blockStream(self, since, blockType, meta):
+        '''
+            Yield server-sent events for blocks published after since. Ends before the request
+            timeout, clients reconnect with the last event id to resume
+        '''
+        yield 'retry: 1000\n\n'
+        end = time.time() + BLOCK_STREAM_DURATION
+        keepAlive = time.time()
+        while time.time() < end:
+            for seq, blockHash in events.get_recent_blocks(since, blockType, meta):
+                since = seq
+                yield 'id: %s\ndata: %s\n\n' % (seq, blockHash)
+            if time.time() - keepAlive >= 15:
+                keepAlive = time.time()
+                yield ':\n\n'
+            gevent.sleep(0.5) # not a blocking wait, other requests are served meanwhile
+
     def validateToken(self, token):
         '''
             Validate that the client token matches the given token. Used to prevent CSRF and data exfiltration
@@ -505,7 +585,7 @@ class API:
     
     def getBlockData(self, bHash, decrypt=False, raw=False, headerOnly=False):
         assert self._core._utils.validateHash(bHash)
-        bl = Block(bHash, core=self._core)
+        bl = Block(bHash, core=self._core, lazy=True)
         if decrypt:
             bl.decrypt()
             if bl.isEncrypted and not bl.decrypted:
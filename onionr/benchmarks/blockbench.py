@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+'''
+    Onionr - Private P2P Communication
+
+    Compare listing blocks with lazy Block objects (header only) against fully loaded ones
+'''
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import sys, os, json, secrets, shutil, tempfile, time, atexit
+sys.path.append(".")
+TEST_DIR = tempfile.mkdtemp() + '/'
+atexit.register(shutil.rmtree, TEST_DIR, True) # registered first so it runs after Onionr's own exit handlers
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr
+from onionrblockapi import Block
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+
+def store_blocks(amount, contentSize):
+    # Blocks are stored directly instead of with insertBlock, to skip the proof of work
+    for i in range(amount):
+        header = {'meta': json.dumps({'type': 'bench%s' % (contentSize,), 'ch': str(i % 10)}), 'sig': '', 'signer': '', 'time': int(time.time())}
+        data = json.dumps(header) + '\n' + secrets.token_hex(contentSize // 2)
+        blockHash = c.setData(data)
+        c.addToBlockDB(blockHash, dataSaved=True)
+        c._utils.indexBlockMetadata(blockHash)
+
+def list_channel(blockType, lazy):
+    # What a channel view like flow does: read type, date and metadata of every block, content of a tenth of them
+    start = time.perf_counter()
+    for blockHash in c.getBlocksByType(blockType):
+        block = Block(blockHash, core=c, lazy=lazy)
+        block.getType()
+        block.getDate()
+        if block.getMetadata('ch') == '0':
+            block.getContent()
+    return time.perf_counter() - start
+
+def get_blocks(blockType, lazy):
+    # A page of 50 blocks showing type and date, lazy is what Block.getBlocks returns
+    start = time.perf_counter()
+    if lazy:
+        blocks = Block.getBlocks(type=blockType, limit=50, core=c)
+    else:
+        blocks = [Block(blockHash, core=c) for blockHash in c.getBlocksByMetadata(blockType=blockType, limit=50)]
+    for block in blocks:
+        block.getType()
+        block.getDate()
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    for contentSize in (1000, 100000):
+        store_blocks(500, contentSize)
+        blockType = 'bench%s' % (contentSize,)
+        print('%6s byte blocks: channel listing of 500 %.3fs eager, %.3fs lazy; page of 50 %.4fs eager, %.4fs lazy' % (contentSize,
+            list_channel(blockType, False), list_channel(blockType, True), get_blocks(blockType, False), get_blocks(blockType, True)))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+'''
+    Onionr - Private P2P Communication
+
+    Compare per block crypto cost with cached key objects against parsing keys for every operation,
+    single envelope asym blocks against sealing each field seperately, batch signature verification
+    against verifying one block at a time, and the latency of forward secrecy encryption
+'''
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import sys, os, secrets, shutil, tempfile, time, atexit
+sys.path.append(".")
+TEST_DIR = tempfile.mkdtemp() + '/'
+atexit.register(shutil.rmtree, TEST_DIR, True) # registered first so it runs after Onionr's own exit handlers
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr, onionrcrypto, config
+from onionrusers import onionrusers
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+crypto = c._crypto
+
+def _maybe_clear(cached):
+    if not cached:
+        onionrcrypto.clear_key_cache() # every operation parses and converts its key again, like before the cache
+
+def encrypt_block(peer, cached):
+    # What insertBlock does for an encrypted block: sign, then encrypt the 4 fields to the peer
+    data = secrets.token_hex(512)
+    _maybe_clear(cached)
+    signature = crypto.edSign(data, key=crypto.privKey, encodeResult=True)
+    fields = []
+    for field in ('{"type": "pm"}', data, signature, crypto.pubKey):
+        _maybe_clear(cached)
+        fields.append(crypto.pubKeyEncrypt(field, peer, encodedData=True))
+    return fields
+
+def decrypt_block(fields, cached):
+    # What Block.decrypt does: decrypt the 4 fields with our key, then verify the signature
+    plain = []
+    for field in fields:
+        _maybe_clear(cached)
+        plain.append(crypto.pubKeyDecrypt(field, encodedData=True).decode())
+    _maybe_clear(cached)
+    return crypto.edVerify(plain[1], plain[3], plain[2])
+
+def encrypt_envelope(peer):
+    # What insertBlock does now: sign, then put the 4 fields in one envelope sealed to the peer
+    data = secrets.token_hex(512)
+    signature = crypto.edSign(data, key=crypto.privKey, encodeResult=True)
+    return crypto.envelopeEncrypt(('{"type": "pm"}', signature, crypto.pubKey, data), peer)
+
+def decrypt_envelope(envelope):
+    key = crypto.getEnvelopeKey(crypto.pubKeyDecrypt(envelope[0], encodedData=True))
+    meta, signature, signer, data = crypto.envelopeDecrypt(key, envelope[1])
+    return crypto.edVerify(data, signer.decode(), signature)
+
+def run_envelope(amount=500):
+    peer = crypto.pubKey
+    start = time.perf_counter()
+    blocks = [encrypt_envelope(peer) for i in range(amount)]
+    encryptTime = time.perf_counter() - start
+    start = time.perf_counter()
+    for envelope in blocks:
+        assert decrypt_envelope(envelope)
+    decryptTime = time.perf_counter() - start
+    return (encryptTime / amount * 1000, decryptTime / amount * 1000)
+
+def run_verify(amount=4000, signers=20):
+    # Signed blocks from a few signers, like a sync from a new peer
+    keys = [crypto.generatePubKey() for i in range(signers)]
+    items = []
+    for i in range(amount):
+        pubKey, privKey = keys[i % signers]
+        data = secrets.token_hex(1000)
+        items.append((data, pubKey, crypto.edSign(data, key=privKey, encodeResult=True)))
+    start = time.perf_counter()
+    for data, key, sig in items:
+        assert crypto.edVerify(data, key, sig)
+    singleTime = time.perf_counter() - start
+    config.set('general.verify_workers', 1)
+    start = time.perf_counter()
+    assert all(crypto.edVerifyMany(items))
+    batchTime = time.perf_counter() - start
+    workers = max(2, os.cpu_count() or 1)
+    config.set('general.verify_workers', workers)
+    crypto.edVerifyMany(items[:onionrcrypto.VERIFY_PARALLEL_MIN]) # start the pool
+    start = time.perf_counter()
+    assert all(crypto.edVerifyMany(items))
+    poolTime = time.perf_counter() - start
+    return (amount, singleTime, batchTime, workers, poolTime)
+
+def run_forward(amount=500, peers=50):
+    # Peers with a forward key each, as when sending messages to contacts
+    users = []
+    for i in range(peers):
+        user = onionrusers.OnionrUser(c, crypto.generatePubKey()[0], saveUser=True)
+        user.addForwardKey(crypto.generatePubKey()[0])
+        users.append(user)
+    start = time.perf_counter()
+    for i in range(amount):
+        users[i % peers].forwardEncrypt('hello')
+    return (time.perf_counter() - start) / amount * 1000
+
+def run(cached, amount=500):
+    peer = crypto.pubKey # encrypted to ourselves so the blocks can be decrypted too
+    start = time.perf_counter()
+    blocks = [encrypt_block(peer, cached) for i in range(amount)]
+    encryptTime = time.perf_counter() - start
+    start = time.perf_counter()
+    for fields in blocks:
+        assert decrypt_block(fields, cached)
+    decryptTime = time.perf_counter() - start
+    return (encryptTime / amount * 1000, decryptTime / amount * 1000)
+
+if __name__ == '__main__':
+    for cached in (False, True):
+        name = ('keys parsed per operation', 'cached key objects')[cached]
+        print('%s: %.3fms to sign and encrypt a block, %.3fms to decrypt and verify one' % ((name,) + run(cached)))
+    print('single envelope: %.3fms to sign and encrypt a block, %.3fms to decrypt and verify one' % run_envelope())
+    amount, singleTime, batchTime, workers, poolTime = run_verify()
+    print('forwardEncrypt: %.3fms per message' % (run_forward(),))
+    print('verifying %s signatures: %.3fs one at a time, %.3fs batched, %.3fs batched over %s worker processes (%s cores)' % (amount, singleTime, batchTime, poolTime, workers, os.cpu_count()))
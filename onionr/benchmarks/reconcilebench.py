@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+'''
+    Onionr - Private P2P Communication
+
+    Compare bytes transferred by block list reconciliation against full block lists, using two simulated stores
+'''
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import sys, hashlib, secrets, time
+sys.path.append(".")
+from utils import reconcile
+
+def random_hashes(amount):
+    return [hashlib.sha3_256(secrets.token_bytes(16)).hexdigest() for i in range(amount)]
+
+def run(storeSize, difference):
+    shared = random_hashes(storeSize - difference)
+    ours = reconcile.HashTree(shared + random_hashes(difference // 2))
+    theirs = reconcile.HashTree(shared + random_hashes(difference - difference // 2))
+    transferred = [0, 0] # bytes, requests
+
+    def fetch_children(prefixes):
+        resp = theirs.serializeChildren(prefixes)
+        transferred[0] += len(resp)
+        transferred[1] += 1
+        return reconcile.parse_children(resp)
+
+    def fetch_buckets(prefixes):
+        resp = '\n'.join(h for prefix in prefixes for h in theirs.bucket(prefix))
+        transferred[0] += len(resp)
+        transferred[1] += 1
+        return resp.split('\n')
+
+    start = time.perf_counter()
+    result = reconcile.reconcile(ours, fetch_children, fetch_buckets)
+    elapsed = time.perf_counter() - start
+    fullList = len('\n'.join(theirs.hashes))
+    if result is None:
+        print('%8s blocks, %5s differ: gave up after %s requests, would fall back to the full list (%s bytes)' % (storeSize, difference, transferred[1], fullList))
+        return
+    print('%8s blocks, %5s differ: %9s bytes in %4s requests (%6.3fs) vs %9s bytes for the full list' % (storeSize, difference, transferred[0], transferred[1], elapsed, fullList))
+
+if __name__ == '__main__':
+    for storeSize in (1000, 10000, 100000):
+        for difference in (0, 10, 100, 1000):
+            run(storeSize, difference)
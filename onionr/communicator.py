@@ -19,16 +19,18 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
-import sys, os, time
+import sys, os, time, threading
 import core, config, logger, onionr
 import onionrexceptions, onionrpeers, onionrevents as events, onionrplugins as plugins, onionrblockapi as block
 from communicatorutils import servicecreator, onionrcommunicatortimers
 from communicatorutils import downloadblocks, lookupblocks, lookupadders
 from communicatorutils import servicecreator, connectnewpeers, uploadblocks
 from communicatorutils import daemonqueuehandler, announcenode, deniableinserts
-from communicatorutils import cooldownpeer, housekeeping, netcheck
+from communicatorutils import cooldownpeer, housekeeping, netcheck, blockqueue, peerselector
 from etc import humanreadabletime
-import onionrservices, onionr, onionrproofs
+from onionrusers import forwardkeypool
+import onionrservices, onionr, onionrproofs, onionrcrypto
+from daemonqueue import daemonQueue as commandChannel
 
 OnionrCommunicatorTimers = onionrcommunicatortimers.OnionrCommunicatorTimers
 
@@ -59,7 +61,9 @@ class OnionrCommunicatorDaemon:
         self.offlinePeers = []
         self.cooldownPeer = {}
         self.connectTimes = {}
+        self.peerSelector = peerselector.PeerSelector() # latency, throughput and failure rate of peers we've used
         self.peerProfiles = [] # list of peer's profiles (onionrpeers.PeerProfile instances)
+        self.peerProfileTable = onionrpeers.getProfileTable(self._core) # scores and connect times, flushed to the address db on a timer
         self.newPeers = [] # Peers merged to us. Don't add to db until we know they're reachable
         self.announceProgress = {}
         self.announceCache = {}
@@ -70,8 +74,8 @@ class OnionrCommunicatorDaemon:
         # set true when shutdown command received
         self.shutdown = False
 
-        # list of new blocks to download, added to when new block lists are fetched from peers
-        self.blockQueue = {}
+        # priority queue of new blocks to download, added to when new block lists are fetched from peers
+        self.blockQueue = blockqueue.BlockQueue()
 
         # list of blocks currently downloading, avoid s
         self.currentDownloading = []
@@ -119,8 +123,12 @@ class OnionrCommunicatorDaemon:
         # Timer to read the upload queue and upload the entries to peers
         OnionrCommunicatorTimers(self, self.uploadBlock, 5, requiresPeer=True, maxThreads=1)
 
-        # Timer to process the daemon command queue
-        OnionrCommunicatorTimers(self, self.daemonCommands, 6, maxThreads=3)
+        # Thread to run commands from clients in this process as soon as they are sent
+        threading.Thread(target=daemonqueuehandler.listen_for_daemon_commands, args=[self], daemon=True).start()
+        commandChannel.daemonRunning = True
+
+        # Timer to process commands left in the daemon queue database (by clients that could not reach the daemon)
+        OnionrCommunicatorTimers(self, self.daemonCommands, 6, maxThreads=1)
 
         # Timer that kills Onionr if the API server crashes
         OnionrCommunicatorTimers(self, self.detectAPICrash, 30, maxThreads=1)
@@ -150,12 +158,18 @@ class OnionrCommunicatorDaemon:
         else:
             logger.debug('Will not announce node.')
         
+        # Timer to write peer profile changes to the address database
+        OnionrCommunicatorTimers(self, self.flushPeerProfiles, 30, maxThreads=1)
+
         # Timer to delete malfunctioning or long-dead peers
         cleanupTimer = OnionrCommunicatorTimers(self, self.peerCleanup, 300, requiresPeer=True)
 
         # Timer to cleanup dead ephemeral forward secrecy keys 
         forwardSecrecyTimer = OnionrCommunicatorTimers(self, housekeeping.clean_keys, 15, myArgs=[self], maxThreads=1)
 
+        # Timer to generate forward secrecy keys ahead of time, so encrypted inserts don't have to
+        OnionrCommunicatorTimers(self, housekeeping.fill_forward_key_pool, 10, myArgs=[self], maxThreads=1)
+
         # Adjust initial timer triggers
         peerPoolTimer.count = (peerPoolTimer.frequency - 1)
         cleanupTimer.count = (cleanupTimer.frequency - 60)
@@ -184,6 +198,9 @@ class OnionrCommunicatorDaemon:
         else:
             for server in self.service_greenlets:
                 server.stop()
+        self.peerProfileTable.flush()
+        onionrcrypto.shutdown_verify_pool()
+        forwardkeypool.get_pool(self._core).shutdown()
         self._core._utils.localCommand('shutdown') # shutdown the api
         time.sleep(0.5)
 
@@ -207,21 +224,9 @@ class OnionrCommunicatorDaemon:
         except KeyError:
             pass
 
-    def pickOnlinePeer(self):
-        '''randomly picks peer from pool without bias (using secrets module)'''
-        retData = ''
-        while True:
-            peerLength = len(self.onlinePeers)
-            if peerLength <= 0:
-                break
-            try:
-                # get a random online peer, securely. May get stuck in loop if network is lost or if all peers in pool magically disconnect at once
-                retData = self.onlinePeers[self._core._crypto.secrets.randbelow(peerLength)]
-            except IndexError:
-                pass
-            else:
-                break
-        return retData
+    def pickOnlinePeer(self, exclude=()):
+        '''Picks a peer from the pool, weighted by measured performance with some randomness (see peerselector)'''
+        return self.peerSelector.pick(self.onlinePeers, exclude)
 
     def clearOfflinePeer(self):
         '''Removes the longest offline peer to retry later'''
@@ -242,15 +247,9 @@ class OnionrCommunicatorDaemon:
         maxPeers = int(config.get('peers.max_connect', 10))
         needed = maxPeers - len(self.onlinePeers)
 
-        for i in range(needed):
-            if len(self.onlinePeers) == 0:
-                self.connectNewPeer(useBootstrap=True)
-            else:
-                self.connectNewPeer()
-
-            if self.shutdown:
-                break
-        else:
+        if needed > 0 and not self.shutdown:
+            self.connectNewPeer(useBootstrap=len(self.onlinePeers) == 0, needed=needed)
+        if not self.shutdown:
             if len(self.onlinePeers) == 0:
                 logger.debug('Couldn\'t connect to any peers.' + (' Last node seen %s ago.' % humanreadabletime.human_readable_time(time.time() - self.lastNodeSeen) if not self.lastNodeSeen is None else ''))
             else:
@@ -266,9 +265,9 @@ class OnionrCommunicatorDaemon:
                 peerList.append(i)
                 self._core.addAddress(i)
 
-    def connectNewPeer(self, peer='', useBootstrap=False):
-        '''Adds a new random online peer to self.onlinePeers'''
-        connectnewpeers.connect_new_peer_to_communicator(self, peer, useBootstrap)
+    def connectNewPeer(self, peer='', useBootstrap=False, needed=1):
+        '''Adds new online peers to self.onlinePeers, pinging candidates concurrently'''
+        connectnewpeers.connect_new_peer_to_communicator(self, peer, useBootstrap, needed)
 
     def removeOnlinePeer(self, peer):
         '''Remove an online peer'''
@@ -285,6 +284,11 @@ class OnionrCommunicatorDaemon:
         except ValueError:
             pass
 
+    def flushPeerProfiles(self):
+        '''Write changed peer scores and connect times to the address database in one batch'''
+        self.peerProfileTable.flush()
+        self.decrementThreadCount('flushPeerProfiles')
+
     def peerCleanup(self):
         '''This just calls onionrpeers.cleanupPeers, which removes dead or bad peers (offline too long, too slow)'''
         onionrpeers.peerCleanup(self._core)
@@ -309,9 +313,11 @@ class OnionrCommunicatorDaemon:
         if len(data) > 0:
             url += '&data=' + data
 
-        self._core.setAddressInfo(peer, 'lastConnectAttempt', self._core._utils.getEpoch()) # mark the time we're trying to request this peer
+        self.peerProfileTable.set(peer, 'lastConnectAttempt', self._core._utils.getEpoch()) # mark the time we're trying to request this peer
 
+        requestStart = time.time()
         retData = self._core._utils.doGetRequest(url, port=self.proxyPort)
+        self.peerSelector.record(peer, time.time() - requestStart, len(retData) if retData != False else 0, retData != False)
         # if request failed, (error), mark peer offline
         if retData == False:
             try:
@@ -322,7 +328,7 @@ class OnionrCommunicatorDaemon:
             except ValueError:
                 pass
         else:
-            self._core.setAddressInfo(peer, 'lastConnect', self._core._utils.getEpoch())
+            self.peerProfileTable.set(peer, 'lastConnect', self._core._utils.getEpoch())
             self.getPeerProfileInstance(peer).addScore(1)
         return retData # If returnHeaders, returns tuple of data, headers. if not, just data string
 
@@ -348,7 +354,7 @@ class OnionrCommunicatorDaemon:
 
     def daemonCommands(self):
         '''
-            Process daemon commands from daemonQueue
+            Process daemon commands from the daemonQueue database
         '''
         daemonqueuehandler.handle_daemon_commands(self)
 
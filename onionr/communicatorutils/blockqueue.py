@@ -0,0 +1,139 @@
+'''
+    Onionr - Private P2P Communication
+
+    Bounded priority queue of block hashes for the communicator to download
+'''
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import heapq, itertools, threading, time
+
+MAX_QUEUE_SIZE = 100000 # most block hashes to hold at once, new hashes are dropped past this
+MAX_PEERS_PER_BLOCK = 10 # most peers to remember as sources for a single block
+MAX_ATTEMPTS = 5 # drop a block after this many downloads that were not found
+
+# Priority hints, higher is downloaded first. Block type and recipient are inside the block, so they
+# are only known when a caller has some other reason to want a hash (such as a stored block naming it as parent)
+PRIORITY_NORMAL = 0
+PRIORITY_WANTED = 1
+
+class _QueuedBlock:
+    __slots__ = ('peers', 'priority', 'firstSeen', 'attempts', 'version')
+    def __init__(self, priority):
+        self.peers = []
+        self.priority = priority
+        self.firstSeen = time.time()
+        self.attempts = 0
+        self.version = 0
+
+class BlockQueue:
+    '''
+        Download queue ordered by priority hint, then how recently the hash was first listed
+        (by minute) and then how many peers have it. Uses a heap with lazy deletion, so adding,
+        reprioritizing and popping are O(log n). Supports the dict operations the communicator
+        used on the old blockQueue dict (len, in, [hash] for the peer list, del).
+    '''
+    def __init__(self, maxSize=MAX_QUEUE_SIZE):
+        self.maxSize = maxSize
+        self._entries = {} # hash: _QueuedBlock, in insertion order so the first entry is the oldest
+        self._heap = []
+        self._counter = itertools.count() # tie breaker so the heap never compares hashes
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, blockHash):
+        return blockHash in self._entries
+
+    def __getitem__(self, blockHash):
+        return list(self._entries[blockHash].peers)
+
+    def __delitem__(self, blockHash):
+        with self._lock:
+            del self._entries[blockHash] # stale heap entry is skipped when popped
+
+    def _push(self, blockHash, entry):
+        entry.version += 1
+        recency = 0 if entry.attempts > 0 else -int(entry.firstSeen // 60) # retried blocks go after fresh ones
+        key = (-entry.priority, recency, -len(entry.peers))
+        heapq.heappush(self._heap, (key, next(self._counter), entry.version, blockHash))
+        # Rebuild the heap if stale entries make up most of it, to keep memory bounded
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [item for item in self._heap if item[3] in self._entries and self._entries[item[3]].version == item[2]]
+            heapq.heapify(self._heap)
+
+    def add(self, blockHash, peer=None, priority=PRIORITY_NORMAL):
+        '''Queue a block hash, or add a peer source/raise the priority of an already queued one. Returns False if dropped'''
+        with self._lock:
+            try:
+                entry = self._entries[blockHash]
+            except KeyError:
+                if len(self._entries) >= self.maxSize:
+                    self.dropped += 1
+                    return False
+                entry = _QueuedBlock(priority)
+                self._entries[blockHash] = entry
+            else:
+                if (peer is None or peer in entry.peers or len(entry.peers) >= MAX_PEERS_PER_BLOCK) and priority <= entry.priority:
+                    return True
+                entry.priority = max(priority, entry.priority)
+            if peer is not None and peer not in entry.peers and len(entry.peers) < MAX_PEERS_PER_BLOCK:
+                entry.peers.append(peer)
+            self._push(blockHash, entry)
+            return True
+
+    def pop(self):
+        '''Remove and return the (hash, peer list, attempts) with the highest priority, or None if empty'''
+        with self._lock:
+            while len(self._heap) > 0:
+                key, count, version, blockHash = heapq.heappop(self._heap)
+                try:
+                    entry = self._entries[blockHash]
+                except KeyError:
+                    continue
+                if entry.version != version:
+                    continue
+                del self._entries[blockHash]
+                return (blockHash, list(entry.peers), entry.attempts)
+            return None
+
+    def retry(self, blockHash, peers, attempts):
+        '''
+            Put back a popped block that could not be downloaded yet, behind hashes that have not failed.
+            Drops it once it has failed too often, returns bool of if it was queued again
+        '''
+        with self._lock:
+            attempts += 1
+            if attempts >= MAX_ATTEMPTS or blockHash in self._entries or len(self._entries) >= self.maxSize:
+                if blockHash not in self._entries:
+                    self.dropped += 1
+                return False
+            entry = _QueuedBlock(PRIORITY_NORMAL)
+            entry.peers = list(peers)[:MAX_PEERS_PER_BLOCK]
+            entry.attempts = attempts
+            self._entries[blockHash] = entry
+            self._push(blockHash, entry)
+            return True
+
+    def getStats(self):
+        '''Return a dict of queue depth, age of the oldest entry in seconds and dropped hashes'''
+        oldest = 0
+        with self._lock:
+            try:
+                oldest = time.time() - next(iter(self._entries.values())).firstSeen
+            except StopIteration:
+                pass
+            return {'depth': len(self._entries), 'oldestAge': int(oldest), 'dropped': self.dropped}
@@ -18,6 +18,7 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 import time, sys
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 import onionrexceptions, logger, onionrpeers
 from utils import networkmerger
 # secrets module was added into standard lib in 3.6+
@@ -25,7 +26,18 @@ if sys.version_info[0] == 3 and sys.version_info[1] < 6:
     from dependencies import secrets
 elif sys.version_info[0] == 3 and sys.version_info[1] >= 6:
     import secrets
-def connect_new_peer_to_communicator(comm_inst, peer='', useBootstrap=False):
+def _ping(comm_inst, address):
+    '''Ping a peer, returns the round trip time in seconds or False if it did not respond. peerAction records it for peer selection'''
+    start = time.time()
+    if comm_inst.peerAction(address, 'ping') == 'pong!':
+        return time.time() - start
+    return False
+
+def connect_new_peer_to_communicator(comm_inst, peer='', useBootstrap=False, needed=1):
+    '''
+        Connect to up to needed new peers, pinging several candidates at once.
+        Returns the last address connected to, or False if none responded
+    '''
     config = comm_inst._core.config
     retData = False
     tried = comm_inst.offlinePeers
@@ -54,6 +66,7 @@ def connect_new_peer_to_communicator(comm_inst, peer='', useBootstrap=False):
         # Avoid duplicating bootstrap addresses in peerList
         comm_inst.addBootstrapListToPeerList(peerList)
 
+    candidates = []
     for address in peerList:
         if not config.get('tor.v3onions') and len(address) == 62:
             continue
@@ -63,16 +76,31 @@ def connect_new_peer_to_communicator(comm_inst, peer='', useBootstrap=False):
         # Don't connect to invalid address or if its already been tried/connected, or if its cooled down
         if len(address) == 0 or address in tried or address in comm_inst.onlinePeers or address in comm_inst.cooldownPeer:
             continue
-        if comm_inst.shutdown:
-            return
-        # Ping a peer,
-        if comm_inst.peerAction(address, 'ping') == 'pong!':
-            time.sleep(0.1)
+        if address not in candidates:
+            candidates.append(address)
+    if len(candidates) == 0 or comm_inst.shutdown:
+        return retData
+
+    # Ping candidates in parallel (in score order), taking the first to respond until we have enough or time runs out
+    connected = 0
+    executor = ThreadPoolExecutor(max_workers=config.get('peers.parallel_connect', 8))
+    pings = {executor.submit(_ping, comm_inst, address): address for address in candidates}
+    try:
+        for ping in as_completed(pings, timeout=config.get('peers.connect_timeout', 60)):
+            if comm_inst.shutdown:
+                break
+            address = pings[ping]
+            rtt = ping.result()
+            if rtt is False:
+                # Mark a peer as tried if they failed to respond to ping
+                tried.append(address)
+                logger.debug('Failed to connect to ' + address)
+                continue
             if address not in mainPeerList:
                 # Add a peer to our list if it isn't already since it successfully connected
                 networkmerger.mergeAdders(address, comm_inst._core)
             if address not in comm_inst.onlinePeers:
-                logger.info('Connected to ' + address)
+                logger.info('Connected to %s (%sms)' % (address, int(rtt * 1000)))
                 comm_inst.onlinePeers.append(address)
                 comm_inst.connectTimes[address] = comm_inst._core._utils.getEpoch()
             retData = address
@@ -83,9 +111,14 @@ def connect_new_peer_to_communicator(comm_inst, peer='', useBootstrap=False):
                     break
             else:
                 comm_inst.peerProfiles.append(onionrpeers.PeerProfiles(address, comm_inst._core))
-            break
-        else:
-            # Mark a peer as tried if they failed to respond to ping
-            tried.append(address)
-            logger.debug('Failed to connect to ' + address)
-    return retData
\ No newline at end of file
+            connected += 1
+            if connected >= needed:
+                break
+    except FutureTimeoutError:
+        logger.debug('Timed out waiting for peers to respond to ping')
+    finally:
+        # Don't wait for slow pings still in progress
+        for ping in pings:
+            ping.cancel()
+        executor.shutdown(wait=False)
+    return retData
@@ -32,7 +32,7 @@ def cooldown_peer(comm_inst):
             del comm_inst.cooldownPeer[peer]
 
     # Cool down a peer, if we have max connections alive for long enough
-    if onlinePeerAmount >= comm_inst._core.config.get('peers.max_connect', 10, save = True):
+    if onlinePeerAmount >= comm_inst._core.config.get('peers.max_connect', 10):
         finding = True
 
         while finding:
@@ -19,37 +19,59 @@
 '''
 import logger
 import onionrevents as events
-def handle_daemon_commands(comm_inst):
-    cmd = comm_inst._core.daemonQueue()
+from daemonqueue import daemonQueue as commandChannel
+
+MAX_DB_COMMANDS = 100 # most commands to take from the queue database per timer tick
+
+def handle_daemon_command(comm_inst, cmd):
+    '''Run a single command tuple of (command, data, date, id, responseID)'''
     response = ''
-    if cmd is not False:
-        events.event('daemon_command', onionr = comm_inst._core.onionrInst, data = {'cmd' : cmd})
-        if cmd[0] == 'shutdown':
-            comm_inst.shutdown = True
-        elif cmd[0] == 'announceNode':
-            if len(comm_inst.onlinePeers) > 0:
-                comm_inst.announce(cmd[1])
-            else:
-                logger.debug("No nodes connected. Will not introduce node.")
-        elif cmd[0] == 'runCheck': # deprecated
-            logger.debug('Status check; looks good.')
-            open(comm_inst._core.dataDir + '.runcheck', 'w+').close()
-        elif cmd[0] == 'connectedPeers':
-            response = '\n'.join(list(comm_inst.onlinePeers)).strip()
-            if response == '':
-                response = 'none'
-        elif cmd[0] == 'localCommand':
-            response = comm_inst._core._utils.localCommand(cmd[1])
-        elif cmd[0] == 'pex':
-            for i in comm_inst.timers:
-                if i.timerFunction.__name__ == 'lookupAdders':
-                    i.count = (i.frequency - 1)
-        elif cmd[0] == 'uploadBlock':
-            comm_inst.blocksToUpload.append(cmd[1])
-
-        if cmd[0] not in ('', None):
-            if response != '':
-                comm_inst._core._utils.localCommand('queueResponseAdd/' + cmd[4], post=True, postData={'data': response})
-        response = ''
-
-    comm_inst.decrementThreadCount('daemonCommands')
\ No newline at end of file
+    events.event('daemon_command', onionr = comm_inst._core.onionrInst, data = {'cmd' : cmd})
+    if cmd[0] == 'shutdown':
+        comm_inst.shutdown = True
+    elif cmd[0] == 'announceNode':
+        if len(comm_inst.onlinePeers) > 0:
+            comm_inst.announce(cmd[1])
+        else:
+            logger.debug("No nodes connected. Will not introduce node.")
+    elif cmd[0] == 'runCheck': # deprecated
+        logger.debug('Status check; looks good.')
+        open(comm_inst._core.dataDir + '.runcheck', 'w+').close()
+    elif cmd[0] == 'connectedPeers':
+        response = '\n'.join(list(comm_inst.onlinePeers)).strip()
+        if response == '':
+            response = 'none'
+    elif cmd[0] == 'localCommand':
+        response = comm_inst._core._utils.localCommand(cmd[1])
+    elif cmd[0] == 'pex':
+        for i in comm_inst.timers:
+            if i.timerFunction.__name__ == 'lookupAdders':
+                i.count = (i.frequency - 1)
+    elif cmd[0] == 'uploadBlock':
+        comm_inst.blocksToUpload.append(cmd[1])
+        for i in comm_inst.timers:
+            if i.timerFunction.__name__ == 'uploadBlock':
+                i.count = (i.frequency - 1) # upload on the next timer loop instead of waiting up to 5 seconds
+
+    if cmd[0] not in ('', None):
+        if response != '' and cmd[4] not in ('', None):
+            commandChannel.setResponse(cmd[4], response)
+
+def listen_for_daemon_commands(comm_inst):
+    '''Thread to run commands from the in-process channel as soon as they arrive, in batches'''
+    while not comm_inst.shutdown:
+        for cmd in commandChannel.getBatch(timeout=1):
+            try:
+                handle_daemon_command(comm_inst, cmd)
+            except Exception as e:
+                logger.error('Failed to run daemon command %s' % (cmd[0],), error = e)
+
+def handle_daemon_commands(comm_inst):
+    '''Run commands left in the queue database by clients while the daemon could not be reached'''
+    for i in range(MAX_DB_COMMANDS):
+        cmd = comm_inst._core.daemonQueue()
+        if cmd is False:
+            break
+        handle_daemon_command(comm_inst, cmd)
+
+    comm_inst.decrementThreadCount('daemonCommands')
@@ -20,44 +20,45 @@
 import communicator, onionrexceptions
 import logger, onionrpeers
 
+PROCESS_BATCH_SIZE = 64 # saved blocks to collect before processing their metadata, so their signatures are verified together
+
 def download_blocks_from_communicator(comm_inst):
     assert isinstance(comm_inst, communicator.OnionrCommunicatorDaemon)
-    for blockHash in list(comm_inst.blockQueue):
+    retryBlocks = [] # Blocks to put back in the queue once this round is done, so they are not retried right away
+    savedBlocks = [] # Blocks saved but not processed yet
+    existingBlocks = set(comm_inst._core.getBlockList())
+    for i in range(len(comm_inst.blockQueue)):
         if len(comm_inst.onlinePeers) == 0:
             break
-        triedQueuePeers = [] # List of peers we've tried for a block
-        try:
-            blockPeers = list(comm_inst.blockQueue[blockHash])
-        except KeyError:
-            blockPeers = []
-        removeFromQueue = True
         if comm_inst.shutdown or not comm_inst.isOnline:
             # Exit loop if shutting down or offline
             break
+        if comm_inst._core._utils.storageCounter.isFull():
+            break
+        queued = comm_inst.blockQueue.pop() # highest priority block
+        if queued is None:
+            break
+        blockHash, blockPeers, attempts = queued
+        queuedPeers = list(blockPeers)
+        triedQueuePeers = [] # List of peers we've tried for a block
+        removeFromQueue = True
         # Do not download blocks being downloaded or that are already saved (edge cases)
         if blockHash in comm_inst.currentDownloading:
             #logger.debug('Already downloading block %s...' % blockHash)
             continue
-        if blockHash in comm_inst._core.getBlockList():
+        if blockHash in existingBlocks:
             #logger.debug('Block %s is already saved.' % (blockHash,))
-            try:
-                del comm_inst.blockQueue[blockHash]
-            except KeyError:
-                pass
             continue
         if comm_inst._core._blacklist.inBlacklist(blockHash):
             continue
-        if comm_inst._core._utils.storageCounter.isFull():
-            break
         comm_inst.currentDownloading.append(blockHash) # So we can avoid concurrent downloading in other threads of same block
         if len(blockPeers) == 0:
             peerUsed = comm_inst.pickOnlinePeer()
         else:
-            blockPeers = comm_inst._core._crypto.randomShuffle(blockPeers)
-            peerUsed = blockPeers.pop(0)
+            peerUsed = comm_inst.peerSelector.pick(blockPeers)
 
         if not comm_inst.shutdown and peerUsed.strip() != '':
-            logger.info("Attempting to download %s from %s..." % (blockHash[:12], peerUsed))
+            logger.info("Attempting to download %s from %s...", args = (blockHash[:12], peerUsed))
         content = comm_inst.peerAction(peerUsed, 'getdata/' + blockHash) # block content from random peer (includes metadata)
         if content != False and len(content) > 0:
             try:
@@ -76,7 +77,7 @@ def download_blocks_from_communicator(comm_inst):
                 metadata = metas[0]
                 if comm_inst._core._utils.validateMetadata(metadata, metas[2]): # check if metadata is valid, and verify nonce
                     if comm_inst._core._crypto.verifyPow(content): # check if POW is enough/correct
-                        logger.info('Attempting to save block %s...' % blockHash[:12])
+                        logger.info('Attempting to save block %s...', args = (blockHash[:12],))
                         try:
                             comm_inst._core.setData(content)
                         except onionrexceptions.DiskAllocationReached:
@@ -84,12 +85,15 @@ def download_blocks_from_communicator(comm_inst):
                             removeFromQueue = False
                         else:
                             comm_inst._core.addToBlockDB(blockHash, dataSaved=True)
-                            comm_inst._core._utils.processBlockMetadata(blockHash) # caches block metadata values to block database
+                            savedBlocks.append(blockHash)
+                            if len(savedBlocks) >= PROCESS_BATCH_SIZE:
+                                comm_inst._core._utils.processBlockMetadataMany(savedBlocks) # caches block metadata values to block database
+                                savedBlocks = []
                     else:
                         logger.warn('POW failed for block %s.' % blockHash)
                 else:
                     if comm_inst._core._blacklist.inBlacklist(realHash):
-                        logger.warn('Block %s is blacklisted.' % (realHash,))
+                        logger.warn('Block %s is blacklisted.', args = (realHash,))
                     else:
                         logger.warn('Metadata for block %s is invalid.' % blockHash)
                         comm_inst._core._blacklist.addToDB(blockHash)
@@ -107,10 +111,12 @@ def download_blocks_from_communicator(comm_inst):
                     logger.warn('Block hash validation failed for ' + blockHash + ' got ' + tempHash)
                 else:
                     removeFromQueue = False # Don't remove from queue if 404
-            if removeFromQueue:
-                try:
-                    del comm_inst.blockQueue[blockHash] # remove from block queue both if success or false
-                except KeyError:
-                    pass
+        else:
+            removeFromQueue = False # Peer did not respond, try again later
+        if not removeFromQueue:
+            retryBlocks.append((blockHash, queuedPeers, attempts))
         comm_inst.currentDownloading.remove(blockHash)
+    comm_inst._core._utils.processBlockMetadataMany(savedBlocks)
+    for blockHash, queuedPeers, attempts in retryBlocks:
+        comm_inst.blockQueue.retry(blockHash, queuedPeers, attempts)
     comm_inst.decrementThreadCount('getBlocks')
\ No newline at end of file
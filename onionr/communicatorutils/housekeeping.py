@@ -17,9 +17,8 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
-import sqlite3
 import logger
-from onionrusers import onionrusers
+from onionrusers import onionrusers, forwardkeypool
 def clean_old_blocks(comm_inst):
     '''Delete old blocks if our disk allocation is full/near full, and also expired blocks'''
 
@@ -39,21 +38,17 @@ def clean_old_blocks(comm_inst):
 
 def clean_keys(comm_inst):
     '''Delete expired forward secrecy keys'''
-    conn = sqlite3.connect(comm_inst._core.peerDB, timeout=10)
-    c = conn.cursor()
-    time = comm_inst._core._utils.getEpoch()
-    deleteKeys = []
-
-    for entry in c.execute("SELECT * FROM forwardKeys WHERE expire <= ?", (time,)):
-        logger.debug('Forward key: %s' % entry[1])
-        deleteKeys.append(entry[1])
-
-    for key in deleteKeys:
-        logger.debug('Deleting forward key %s' % key)
-        c.execute("DELETE from forwardKeys where forwardKey = ?", (key,))
-    conn.commit()
-    conn.close()
+    deleted = onionrusers.deleteTheirExpiredKeys(comm_inst._core)
+    if deleted > 0:
+        logger.debug('Deleted %s expired forward keys' % (deleted,))
 
     onionrusers.deleteExpiredKeys(comm_inst._core)
 
-    comm_inst.decrementThreadCount('clean_keys')
\ No newline at end of file
+    comm_inst.decrementThreadCount('clean_keys')
+
+def fill_forward_key_pool(comm_inst):
+    '''Generate forward secrecy keys ahead of time for contacts we send to'''
+    generated = forwardkeypool.get_pool(comm_inst._core).fill()
+    if generated > 0:
+        logger.debug('Generated %s forward keys for the key pool' % (generated,))
+    comm_inst.decrementThreadCount('fill_forward_key_pool')
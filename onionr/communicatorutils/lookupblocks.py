@@ -18,18 +18,43 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 import logger, onionrproofs
+from communicatorutils import blockqueue
+from utils import reconcile
+
+def _reconcile_with_peer(comm_inst, peer, localTree):
+    '''
+        Find the blocks a peer has that we don't by comparing bucket digests,
+        returns a newline seperated hash string like getblocklist, or False if the peer does not support it
+    '''
+    def fetch_children(prefixes):
+        resp = comm_inst.peerAction(peer, 'getblockdigest?prefix=%s' % (','.join(prefixes),))
+        if resp == False:
+            return None
+        return reconcile.parse_children(resp)
+
+    def fetch_buckets(prefixes):
+        resp = comm_inst.peerAction(peer, 'getblocklist?prefix=%s' % (','.join(prefixes),))
+        if resp == False:
+            return None
+        return resp.split('\n')
+
+    result = reconcile.reconcile(localTree, fetch_children, fetch_buckets)
+    if result is None:
+        return False
+    return '\n'.join(result[0])
+
 def lookup_blocks_from_communicator(comm_inst):
         logger.info('Looking up new blocks...')
         tryAmount = 2
         newBlocks = ''
-        existingBlocks = comm_inst._core.getBlockList()
+        existingBlocks = set(comm_inst._core.getBlockList())
+        localTree = None
         triedPeers = [] # list of peers we've tried this time around
-        maxBacklog = 1560 # Max amount of *new* block hashes to have already in queue, to avoid memory exhaustion
         lastLookupTime = 0 # Last time we looked up a particular peer's list
         for i in range(tryAmount):
             listLookupCommand = 'getblocklist' # This is defined here to reset it each time
-            if len(comm_inst.blockQueue) >= maxBacklog:
-                break
+            if len(comm_inst.blockQueue) >= comm_inst.blockQueue.maxSize:
+                break # the queue would drop any new hashes
             if not comm_inst.isOnline:
                 break
             # check if disk allocation is used
@@ -45,6 +70,16 @@ def lookup_blocks_from_communicator(comm_inst):
                     continue
             triedPeers.append(peer)
 
+            # Ask the peer for only the difference between our inventories if possible
+            if comm_inst._core.config.get('general.reconcile_block_lists', True):
+                if localTree is None:
+                    localTree = reconcile.HashTree(existingBlocks)
+                newBlocks = _reconcile_with_peer(comm_inst, peer, localTree)
+                if newBlocks != False:
+                    comm_inst.dbTimestamps[peer] = comm_inst._core._utils.getRoundedEpoch(roundS=60)
+                    _add_to_queue(comm_inst, peer, newBlocks, existingBlocks)
+                    continue
+
             # Get the last time we looked up a peer's stamp to only fetch blocks since then.
             # Saved in memory only for privacy reasons
             try:
@@ -56,24 +91,23 @@ def lookup_blocks_from_communicator(comm_inst):
             try:
                 newBlocks = comm_inst.peerAction(peer, listLookupCommand) # get list of new block hashes
             except Exception as error:
-                logger.warn('Could not get new blocks from %s.' % peer, error = error)
+                logger.warn('Could not get new blocks from %s.', error = error, args = (peer,))
                 newBlocks = False
             else:
                 comm_inst.dbTimestamps[peer] = comm_inst._core._utils.getRoundedEpoch(roundS=60)
             if newBlocks != False:
                 # if request was a success
-                for i in newBlocks.split('\n'):
-                    if comm_inst._core._utils.validateHash(i):
-                        # if newline seperated string is valid hash
-                        if not i in existingBlocks:
-                            # if block does not exist on disk and is not already in block queue
-                            if i not in comm_inst.blockQueue:
-                                if onionrproofs.hashMeetsDifficulty(i) and not comm_inst._core._blacklist.inBlacklist(i):
-                                    if len(comm_inst.blockQueue) <= 1000000:
-                                        comm_inst.blockQueue[i] = [peer] # add blocks to download queue
-                            else:
-                                if peer not in comm_inst.blockQueue[i]:
-                                    if len(comm_inst.blockQueue[i]) < 10:
-                                        comm_inst.blockQueue[i].append(peer)
+                _add_to_queue(comm_inst, peer, newBlocks, existingBlocks)
         comm_inst.decrementThreadCount('lookupBlocks')
-        return
\ No newline at end of file
+        return
+
+def _add_to_queue(comm_inst, peer, newBlocks, existingBlocks):
+    '''Add newline seperated block hashes from a peer to the download queue'''
+    # valid hashes of blocks that are not on disk
+    newBlocks = [i for i in newBlocks.split('\n') if comm_inst._core._utils.validateHash(i) and not i in existingBlocks]
+    # parents of blocks we already have are downloaded first, so threads and replies can be shown
+    wanted = comm_inst._core.getReferencedParents(newBlocks)
+    for i, blacklisted in zip(newBlocks, comm_inst._core._blacklist.inBlacklistMany(newBlocks)):
+        # add it to the queue or add the peer as a source if already queued
+        if i in comm_inst.blockQueue or (onionrproofs.hashMeetsDifficulty(i) and not blacklisted):
+            comm_inst.blockQueue.add(i, peer, blockqueue.PRIORITY_WANTED if i in wanted else blockqueue.PRIORITY_NORMAL)
\ No newline at end of file
@@ -0,0 +1,103 @@
+'''
+    Onionr - Private P2P Communication
+
+    Pick peers weighted by their measured latency, throughput and reliability
+'''
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import threading, secrets
+
+SMOOTHING = 0.3 # weight of the newest sample in the moving averages
+EXPLORATION = 0.1 # chance of picking uniformly at random, so slow or new peers still get measured
+MIN_THROUGHPUT_SIZE = 4096 # responses smaller than this (bytes) are mostly latency, don't use them for throughput
+TYPICAL_RESPONSE_SIZE = 32768 # response size (bytes) used to estimate how long a request to a peer takes
+MIN_RTT = 0.05
+
+_random = secrets.SystemRandom() # peer choice should not be predictable
+
+class PeerStats:
+    __slots__ = ('rtt', 'throughput', 'failureRate', 'samples')
+    def __init__(self):
+        self.rtt = None # seconds
+        self.throughput = None # bytes per second
+        self.failureRate = 0.0
+        self.samples = 0
+
+    def expectedTime(self):
+        '''Estimated seconds for a typical request, None if we don't know yet'''
+        if self.rtt is None:
+            return None
+        estimate = max(self.rtt, MIN_RTT)
+        if self.throughput is not None and self.throughput > 0:
+            estimate += TYPICAL_RESPONSE_SIZE / self.throughput
+        return estimate
+
+class PeerSelector:
+    '''
+        Keeps exponential moving averages of round trip time, throughput and failure rate per peer,
+        and picks peers with a weight of success chance over expected request time.
+        Peers we have no measurements for are weighted like the best known peer so they get tried.
+    '''
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _average(self, old, new):
+        if old is None:
+            return new
+        return old + SMOOTHING * (new - old)
+
+    def record(self, peer, rtt=None, size=0, success=True):
+        '''Record the outcome of a request to a peer. rtt is the seconds the request took, size the bytes received'''
+        with self._lock:
+            try:
+                stats = self._stats[peer]
+            except KeyError:
+                stats = self._stats[peer] = PeerStats()
+            stats.samples += 1
+            stats.failureRate = self._average(stats.failureRate, 0.0 if success else 1.0)
+            if success and rtt is not None:
+                if size >= MIN_THROUGHPUT_SIZE and rtt > 0:
+                    stats.throughput = self._average(stats.throughput, size / rtt)
+                else:
+                    stats.rtt = self._average(stats.rtt, rtt)
+
+    def getStats(self, peer):
+        '''Return the PeerStats for a peer, or None if it has not been measured'''
+        return self._stats.get(peer)
+
+    def weight(self, peer):
+        '''Relative chance of a peer being picked, None if unknown'''
+        stats = self._stats.get(peer)
+        if stats is None:
+            return None
+        expected = stats.expectedTime()
+        if expected is None:
+            return None
+        return max(1.0 - stats.failureRate, 0.01) / expected
+
+    def pick(self, peers, exclude=()):
+        '''Pick a peer from a list, weighted by expected performance. Returns an empty string if there are none to pick'''
+        peers = [peer for peer in list(peers) if peer not in exclude]
+        if len(peers) == 0:
+            return ''
+        if len(peers) == 1 or _random.random() < EXPLORATION:
+            return _random.choice(peers)
+        weights = [self.weight(peer) for peer in peers]
+        known = [w for w in weights if w is not None]
+        best = max(known) if len(known) > 0 else 1.0
+        weights = [best if w is None else w for w in weights]
+        return _random.choices(peers, weights=weights)[0]
+
@@ -17,36 +17,92 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
+import time
+from concurrent.futures import ThreadPoolExecutor
 import logger
 from communicatorutils import proxypicker
-import onionrblockapi as block
+import onionrstorage
+
+UPLOAD_PEERS = 6 # most peers to upload each block to
+UPLOAD_ATTEMPTS = 3 # tries per peer before giving up on it for this round
+RETRY_DELAY = 2 # seconds before the first retry, doubled after each failure
+
+def _post_block(comm_inst, peer, blockHash, raw, proxyType):
+    '''
+        Send a block as a raw body, falling back to the form upload for peers without the raw route.
+        Returns True if the peer has the block, False if it is worth trying again and None if the peer refused it
+    '''
+    utils = comm_inst._core._utils
+    resp, status = utils.doPostRequest('http://%s/upload/%s' % (peer, blockHash), data=raw, proxyType=proxyType, contentType='application/octet-stream', returnStatus=True)
+    if status in (404, 405):
+        # peer is running a version without the raw route
+        resp, status = utils.doPostRequest('http://%s/upload' % (peer,), data={'block': raw.decode()}, proxyType=proxyType, returnStatus=True)
+    if status == 200:
+        return resp in ('success', 'exists')
+    if not status is None and 400 <= status < 500:
+        return None # bad hash, blacklisted, no length or too large, sending it again won't change that
+    return False
+
+def _upload_to_peer(comm_inst, peer, blockHash, raw):
+    '''Upload a raw block (bytes) to a peer, retrying with backoff. Returns bool of success'''
+    proxyType = proxypicker.pick_proxy(peer)
+    delay = RETRY_DELAY
+    for attempt in range(UPLOAD_ATTEMPTS):
+        if comm_inst.shutdown:
+            break
+        if attempt > 0:
+            time.sleep(delay)
+            delay *= 2
+        logger.info("Uploading block %s to %s", args = (blockHash[:12], peer))
+        uploadStart = time.time()
+        success = _post_block(comm_inst, peer, blockHash, raw, proxyType)
+        if success is None:
+            logger.debug('%s refused block %s', args = (peer, blockHash[:12]))
+            break
+        comm_inst.peerSelector.record(peer, time.time() - uploadStart, len(raw), success)
+        if success:
+            return True
+    return False
+
+def _stop_hiding(comm_inst, blockHash):
+    '''Let the public API share a block we created now that it has been uploaded'''
+    # waitforshare toggles (in process when the api runs here), so undo it if the block was not hidden
+    if comm_inst._core._utils.localCommand('waitforshare/' + blockHash, post=True) == 'added':
+        comm_inst._core._utils.localCommand('waitforshare/' + blockHash, post=True)
 
 def upload_blocks_from_communicator(comm_inst):
     # when inserting a block, we try to upload it to a few peers to add some deniability
-    triedPeers = []
     finishedUploads = []
+    uploads = {} # block hash: list of futures, one per peer
     comm_inst.blocksToUpload = comm_inst._core._crypto.randomShuffle(comm_inst.blocksToUpload)
     if len(comm_inst.blocksToUpload) != 0:
-        for bl in comm_inst.blocksToUpload:
-            if not comm_inst._core._utils.validateHash(bl):
-                logger.warn('Requested to upload invalid block')
-                comm_inst.decrementThreadCount('uploadBlock')
-                return
-            for i in range(min(len(comm_inst.onlinePeers), 6)):
-                peer = comm_inst.pickOnlinePeer()
-                if peer in triedPeers:
+        with ThreadPoolExecutor(max_workers=UPLOAD_PEERS) as executor:
+            for bl in list(comm_inst.blocksToUpload):
+                if not comm_inst._core._utils.validateHash(bl):
+                    logger.warn('Requested to upload invalid block')
+                    comm_inst.blocksToUpload.remove(bl)
+                    continue
+                raw = onionrstorage.getData(comm_inst._core, bl) # load once for every peer
+                if raw is None:
+                    logger.warn('Block %s to upload is not saved' % (bl,))
+                    comm_inst.blocksToUpload.remove(bl)
                     continue
-                triedPeers.append(peer)
-                url = 'http://' + peer + '/upload'
-                data = {'block': block.Block(bl).getRaw()}
-                proxyType = proxypicker.pick_proxy(peer)
-                logger.info("Uploading block to " + peer)
-                if not comm_inst._core._utils.doPostRequest(url, data=data, proxyType=proxyType) == False:
-                    comm_inst._core._utils.localCommand('waitforshare/' + bl, post=True)
-                    finishedUploads.append(bl)
+                triedPeers = []
+                uploads[bl] = []
+                for i in range(min(len(comm_inst.onlinePeers), UPLOAD_PEERS)):
+                    peer = comm_inst.pickOnlinePeer(exclude=triedPeers)
+                    if peer == '':
+                        break
+                    triedPeers.append(peer)
+                    uploads[bl].append(executor.submit(_upload_to_peer, comm_inst, peer, bl, raw))
+        # Executor waits for every upload to finish before we get here
+        for bl in uploads:
+            if True in [upload.result() for upload in uploads[bl]]:
+                _stop_hiding(comm_inst, bl)
+                finishedUploads.append(bl)
     for x in finishedUploads:
         try:
             comm_inst.blocksToUpload.remove(x)
         except ValueError:
             pass
-    comm_inst.decrementThreadCount('uploadBlock')
\ No newline at end of file
+    comm_inst.decrementThreadCount('uploadBlock')
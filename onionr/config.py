@@ -18,7 +18,7 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
-import os, json, logger
+import os, json, threading, logger
 
 # set data dir
 dataDir = os.environ.get('ONIONR_HOME', os.environ.get('DATA_DIR', 'data/'))
@@ -27,69 +27,98 @@ if not dataDir.endswith('/'):
 
 _configfile = os.path.abspath(dataDir + 'config.json')
 _config = {}
+_snapshot = {} # every dotted key in _config (including ones for sections): value, replaced as a whole on every change
+_loadedTime = None # modification time of the config file when it was last loaded, None if _config changed since
+_subscribers = [] # (callback, tuple of keys or None for all)
+_lock = threading.RLock()
+
+def _flatten(data, prefix, flat):
+    for key, value in data.items():
+        flat[prefix + str(key)] = value
+        if type(value) == dict:
+            _flatten(value, prefix + str(key) + '.', flat)
+    return flat
+
+def _update_snapshot():
+    '''Replace the snapshot after _config changed and tell subscribers which keys changed'''
+    global _snapshot
+    oldSnapshot = _snapshot
+    newSnapshot = _flatten(_config, '', {})
+    _snapshot = newSnapshot
+    changed = [key for key in newSnapshot if not type(newSnapshot[key]) == dict and (not key in oldSnapshot or oldSnapshot[key] != newSnapshot[key])]
+    changed.extend(key for key in oldSnapshot if not key in newSnapshot and not type(oldSnapshot[key]) == dict)
+    if len(changed) == 0:
+        return
+    for callback, keys in list(_subscribers):
+        if not keys is None:
+            relevant = [key for key in changed if any(key == watched or key.startswith(watched + '.') for watched in keys)]
+            if len(relevant) == 0:
+                continue
+        else:
+            relevant = changed
+        try:
+            callback(relevant)
+        except Exception as error:
+            logger.warn('Config subscriber failed.', error = error)
+
+def subscribe(callback, keys = None):
+    '''
+        Call callback with the list of changed keys whenever the configuration changes.
+        If keys is a list of keys (or sections, like 'general'), only changes to them are reported
+    '''
+    _subscribers.append((callback, None if keys is None else tuple(keys)))
+
+def unsubscribe(callback):
+    for subscriber in list(_subscribers):
+        if subscriber[0] == callback:
+            _subscribers.remove(subscriber)
 
 def get(key, default = None, save = False):
     '''
-        Gets the key from configuration, or returns `default`
+        Gets the key from configuration, or returns `default`.
+        If save is True a missing key is set to `default` in memory, it is written with the next save()
     '''
-
-    key = str(key).split('.')
-    data = _config
-
-    last = key.pop()
-
-    for item in key:
-        if (not item in data) or (not type(data[item]) == dict):
-            return default
-        data = data[item]
-
-    if not last in data:
-        if save:
-            set(key, default, savefile = True)
-        return default
-
-    return data[last]
+    key = str(key)
+    try:
+        return _snapshot[key]
+    except KeyError:
+        pass
+    if save:
+        set(key, default)
+    return default
 
 def set(key, value = None, savefile = False):
     '''
         Sets the key in configuration to `value`
     '''
 
-    global _config
+    global _loadedTime
 
     key = str(key).split('.')
-    data = _config
 
-    last = key.pop()
+    with _lock:
+        data = _config
 
-    for item in key:
-        if (not item in data) or (not type(data[item]) == dict):
-            data[item] = dict()
-        data = data[item]
+        last = key.pop()
 
-    if value is None:
-        del data[last]
-    else:
-        data[last] = value
+        for item in key:
+            if (not item in data) or (not type(data[item]) == dict):
+                data[item] = dict()
+            data = data[item]
+
+        if value is None:
+            data.pop(last, None)
+        else:
+            data[last] = value
+
+        _loadedTime = None
+        _update_snapshot()
 
     if savefile:
         save()
 
 def is_set(key):
-    key = str(key).split('.')
-    data = _config
-
-    last = key.pop()
-
-    for item in key:
-        if (not item in data) or (not type(data[item]) == dict):
-            return False
-        data = data[item]
-
-    if not last in data:
-        return False
-
-    return True
+    return str(key) in _snapshot
 
 def check():
     '''
@@ -113,12 +142,19 @@ def save():
 
 def reload():
     '''
-        Reloads the configuration data in memory from the file
+        Reloads the configuration data in memory from the file, if it changed since it was last loaded
     '''
+    global _loadedTime
     check()
     try:
+        modifiedTime = os.stat(get_config_file()).st_mtime_ns
+        if modifiedTime == _loadedTime:
+            return
         with open(get_config_file(), 'r', encoding="utf8") as configfile:
-            set_config(json.loads(configfile.read()))
+            newConfig = json.loads(configfile.read())
+        with _lock:
+            set_config(newConfig)
+            _loadedTime = modifiedTime
     except:
         pass
         #logger.debug('Failed to parse configuration file.')
@@ -133,8 +169,11 @@ def set_config(config):
     '''
         Sets the configuration to the array in arguments
     '''
-    global _config
-    _config = config
+    global _config, _loadedTime
+    with _lock:
+        _config = config
+        _loadedTime = None
+        _update_snapshot()
 
 def get_config_file():
     '''
@@ -23,8 +23,9 @@ from onionrblockapi import Block
 import deadsimplekv as simplekv
 import onionrutils, onionrcrypto, onionrproofs, onionrevents as events, onionrexceptions
 import onionrblacklist
-from onionrusers import onionrusers
-import dbcreator, onionrstorage, serializeddata, subprocesspow
+from onionrusers import onionrusers, forwardkeypool
+import dbcreator, onionrstorage, serializeddata, subprocesspow, decryptedcache
+from daemonqueue import daemonQueue as commandChannel
 from etc import onionrvalues, powchoice
 
 if sys.version_info < (3, 6):
@@ -34,6 +35,8 @@ if sys.version_info < (3, 6):
         logger.fatal('On Python 3 versions prior to 3.6.x, you need the sha3 module')
         sys.exit(1)
 
+_indexedBlockDBs = set() # block database paths whose old blocks were indexed by this process
+
 class Core:
     def __init__(self, torPort=0):
         '''
@@ -81,14 +84,18 @@ class Core:
                 os.mkdir(self.dataDir)
             if not os.path.exists(self.dataDir + 'blocks/'):
                 os.mkdir(self.dataDir + 'blocks/')
+            self.decryptedCache = decryptedcache.DecryptedCache(self)
             if not os.path.exists(self.blockDB):
                 self.createBlockDB()
+            else:
+                self.dbCreate.upgradeBlockDB()
             if not os.path.exists(self.forwardKeysFile):
                 self.dbCreate.createForwardKeyDB()
             if not os.path.exists(self.peerDB):
                 self.createPeerDB()
             if not os.path.exists(self.addressDB):
                 self.createAddressDB()
+            self.dbCreate.indexForwardKeyDBs()
 
             if os.path.exists(self.dataDir + '/hs/hostname'):
                 with open(self.dataDir + '/hs/hostname', 'r') as hs:
@@ -163,35 +170,49 @@ class Core:
 
         if type(address) is None or len(address) == 0:
             return False
-        if self._utils.validateID(address):
-            if address == config.get('i2p.ownAddr', None) or address == self.hsAddress:
-                return False
-            conn = sqlite3.connect(self.addressDB, timeout=30)
-            c = conn.cursor()
-            # check if address is in database
+        return len(self.addAddresses([address])) > 0
+
+    def addAddresses(self, addresses, maxStored=None):
+        '''
+            Add many addresses to the address database in one transaction, skipping invalid, own and known ones.
+            If maxStored is set, stop adding once the database holds that many addresses.
+            Returns the list of addresses that were added
+        '''
+        ownAddresses = (config.get('i2p.ownAddr', None), self.hsAddress)
+        newAddresses = []
+        for address in addresses:
+            if address in ownAddresses or not self._utils.validateID(address):
+                continue
             # this is safe to do because the address is validated above, but we strip some chars here too just in case
-            address = address.replace('\'', '').replace(';', '').replace('"', '').replace('\\', '')
-            for i in c.execute("SELECT * FROM adders WHERE address = ?;", (address,)):
-                try:
-                    if i[0] == address:
-                        conn.close()
-                        return False
-                except ValueError:
-                    pass
-                except IndexError:
-                    pass
+            newAddresses.append(address.replace('\'', '').replace(';', '').replace('"', '').replace('\\', ''))
+        newAddresses = list(dict.fromkeys(newAddresses)) # remove duplicates, keeping the order
+        if len(newAddresses) == 0:
+            return []
 
-            t = (address, 1)
-            c.execute('INSERT INTO adders (address, type) VALUES(?, ?);', t)
+        conn = sqlite3.connect(self.addressDB, timeout=30)
+        try:
+            c = conn.cursor()
+            c.execute('BEGIN IMMEDIATE;') # so other processes can't add the same addresses before we insert
+            known = set()
+            for i in range(0, len(newAddresses), 500): # stay under SQLite's limit of query parameters
+                chunk = newAddresses[i:i + 500]
+                execute = 'SELECT address FROM adders WHERE address IN (%s);' % (', '.join('?' * len(chunk)),)
+                known.update(row[0] for row in c.execute(execute, chunk))
+            newAddresses = [address for address in newAddresses if address not in known]
+            if not maxStored is None and len(newAddresses) > 0:
+                stored = c.execute('SELECT COUNT(*) FROM adders;').fetchone()[0]
+                if stored + len(newAddresses) > maxStored:
+                    logger.warn('Reached the maximum amount of peers in the net database as allowed by your config.')
+                    newAddresses = newAddresses[:max(0, maxStored - stored)]
+            c.executemany('INSERT INTO adders (address, type) VALUES(?, ?);', [(address, 1) for address in newAddresses])
             conn.commit()
+        finally:
             conn.close()
 
+        for address in newAddresses:
             events.event('address_add', data = {'address': address}, onionr = self.onionrInst)
 
-            return True
-        else:
-            #logger.debug('Invalid ID: %s' % address)
-            return False
+        return newAddresses
 
     def removeAddress(self, address):
         '''
@@ -227,6 +248,7 @@ class Core:
             conn.close()
             dataSize = sys.getsizeof(onionrstorage.getData(self, block))
             self._utils.storageCounter.removeBytes(dataSize)
+            self.decryptedCache.remove(block)
         else:
             raise onionrexceptions.InvalidHexHash
 
@@ -348,37 +370,50 @@ class Core:
     def daemonQueueAdd(self, command, data='', responseID=''):
         '''
             Add a command to the daemon queue, used by the communication daemon (communicator.py)
+
+            Commands go straight to the communicator if it runs in this process, otherwise to the daemon's client API.
+            The queue database is only used when the daemon is not running
         '''
 
         retData = True
 
-        date = self._utils.getEpoch()
-        conn = sqlite3.connect(self.queueDB, timeout=30)
-        c = conn.cursor()
-        t = (command, data, date, responseID)
-        try:
-            c.execute('INSERT INTO commands (command, data, date, responseID) VALUES(?, ?, ?, ?)', t)
-            conn.commit()
-        except sqlite3.OperationalError:
-            retData = False
-            self.daemonQueue()
+        if commandChannel.daemonRunning:
+            commandChannel.put(command, data, responseID)
+        elif not os.path.exists(self.privateApiHostFile) or self._utils.localCommand('daemoncommand', post=True, postData={'command': command, 'data': data, 'responseID': responseID}, maxWait=5) != 'success':
+            date = self._utils.getEpoch()
+            conn = sqlite3.connect(self.queueDB, timeout=30)
+            c = conn.cursor()
+            t = (command, data, date, responseID)
+            try:
+                c.execute('INSERT INTO commands (command, data, date, responseID) VALUES(?, ?, ?, ?)', t)
+                conn.commit()
+            except sqlite3.OperationalError:
+                retData = False
+                self.daemonQueue()
+            conn.close()
         events.event('queue_push', data = {'command': command, 'data': data}, onionr = self.onionrInst)
-        conn.close()
         return retData
 
-    def daemonQueueGetResponse(self, responseID=''):
+    def daemonQueueGetResponse(self, responseID='', wait=0):
         '''
-            Get a response sent by communicator to the API, by requesting to the API
+            Get a response sent by communicator to the API, waiting up to wait seconds for it
         '''
         assert len(responseID) > 0
-        resp = self._utils.localCommand('queueResponse/' + responseID)
+        if commandChannel.daemonRunning:
+            resp = commandChannel.getResponse(responseID, timeout=wait)
+            if resp is None:
+                resp = 'failure'
+        else:
+            resp = self._utils.localCommand('queueResponse/%s?wait=%s' % (responseID, wait), maxWait=wait + 20)
         return resp
 
     def daemonQueueWaitForResponse(self, responseID='', checkFreqSecs=1):
         resp = 'failure'
         while resp == 'failure':
-            resp = self.daemonQueueGetResponse(responseID)
-            time.sleep(1)
+            resp = self.daemonQueueGetResponse(responseID, wait=10) # Returns as soon as the response is set
+            if resp == False:
+                time.sleep(checkFreqSecs) # API not reachable
+                resp = 'failure'
         return resp
 
     def daemonQueueSimple(self, command, data='', checkFreqSecs=1):
@@ -405,6 +440,7 @@ class Core:
             pass
 
         conn.close()
+        commandChannel.clear()
         events.event('queue_clear', onionr = self.onionrInst)
 
         return
@@ -635,6 +671,118 @@ class Core:
         conn.close()
         return rows
 
+    def getDecryptionOutcome(self, blockHash):
+        '''
+            Returns True if an encrypted block could be decrypted with our active key, False if it could not,
+            or None if that has not been tried (or was tried with another key)
+        '''
+        if blockHash is None:
+            return None
+        conn = sqlite3.connect(self.blockDB, timeout=30)
+        c = conn.cursor()
+        row = c.execute('SELECT decrypted FROM hashes WHERE hash = ? AND decryptKey = ?;', (blockHash, self._crypto.keyID())).fetchone()
+        conn.close()
+        if row is None or row[0] is None:
+            return None
+        return bool(row[0])
+
+    def setDecryptionOutcome(self, blockHash, decrypted):
+        '''Record if an encrypted block could be decrypted with our active key'''
+        if blockHash is None:
+            return
+        self.setBlockInfo(blockHash, {'decrypted': int(bool(decrypted)), 'decryptKey': self._crypto.keyID()})
+
+    def _blockFilter(self, blockType=None, signers=None, signed=None, parent=None):
+        '''Build the WHERE clause and arguments for the indexed block metadata filters'''
+        where = ['dataSaved = 1']
+        args = []
+        if not blockType is None:
+            where.append('dataType = ?')
+            args.append(blockType)
+        if not signers is None:
+            where.append('signer IN (%s)' % (', '.join('?' * len(signers)),))
+            args.extend(signers)
+        if not signed is None:
+            where.append('signed = ?')
+            args.append(int(bool(signed)))
+        if not parent is None:
+            where.append('parent = ?')
+            args.append(parent)
+        return (' AND '.join(where), args)
+
+    def getBlocksByMetadata(self, blockType=None, signers=None, signed=None, parent=None, reverse=False, limit=None, offset=0, withDates=False):
+        '''
+            Returns a list of saved block hashes, oldest first (newest first if reverse), filtered by the indexed metadata
+            columns. signers is a list of public keys, one of which must have validly signed the block.
+            If withDates, returns a list of (hash, date received) instead
+        '''
+        where, args = self._blockFilter(blockType, signers, signed, parent)
+        execute = 'SELECT hash, dateReceived FROM hashes WHERE %s ORDER BY dateReceived %s' % (where, 'DESC' if reverse else 'ASC')
+        if not limit is None:
+            execute += ' LIMIT ? OFFSET ?'
+            args += [int(limit), int(offset)]
+        elif offset:
+            execute += ' LIMIT -1 OFFSET ?'
+            args.append(int(offset))
+        conn = sqlite3.connect(self.blockDB, timeout=30)
+        c = conn.cursor()
+        if withDates:
+            rows = list(c.execute(execute + ';', args))
+        else:
+            rows = [row[0] for row in c.execute(execute + ';', args)]
+        conn.close()
+        return rows
+
+    def getBlockCount(self, blockType=None, signers=None, signed=None, parent=None):
+        '''
+            Returns the number of saved blocks matching the filters of getBlocksByMetadata
+        '''
+        where, args = self._blockFilter(blockType, signers, signed, parent)
+        conn = sqlite3.connect(self.blockDB, timeout=30)
+        c = conn.cursor()
+        count = c.execute('SELECT COUNT(*) FROM hashes WHERE %s;' % (where,), args).fetchone()[0]
+        conn.close()
+        return count
+
+    def getReferencedParents(self, hashes):
+        '''
+            Returns the set of hashes from a list that stored blocks name as their parent,
+            so blocks we are missing the parent of can be downloaded first
+        '''
+        hashes = list(hashes)
+        referenced = set()
+        conn = sqlite3.connect(self.blockDB, timeout=30)
+        c = conn.cursor()
+        for i in range(0, len(hashes), 500): # stay under SQLite's limit of query parameters
+            chunk = hashes[i:i + 500]
+            execute = 'SELECT DISTINCT parent FROM hashes WHERE parent IN (%s);' % (', '.join('?' * len(chunk)),)
+            referenced.update(row[0] for row in c.execute(execute, chunk))
+        conn.close()
+        return referenced
+
+    def indexOldBlocks(self):
+        '''
+            Index the metadata of saved blocks stored by versions without the metadata columns, so
+            getBlocksByMetadata and getBlockCount include them. Runs once per process, blocks stored
+            after that are indexed as they are processed
+        '''
+        if self.blockDB in _indexedBlockDBs:
+            return
+        _indexedBlockDBs.add(self.blockDB)
+        conn = sqlite3.connect(self.blockDB, timeout=30)
+        c = conn.cursor()
+        rows = [row[0] for row in c.execute('SELECT hash FROM hashes WHERE dataSaved = 1 AND signed IS NULL;')]
+        conn.close()
+        for blockHash in rows:
+            try:
+                indexed = self._utils.indexBlockMetadata(blockHash)
+            except Exception as e:
+                logger.warn('Could not index the metadata of block %s' % (blockHash,), error = e)
+                indexed = None
+            if indexed is None:
+                # corrupt or not for us, don't read it again
+                self.setBlockInfo(blockHash, {'signed': 0})
+
     def getExpiredBlocks(self):
         '''Returns a list of expired blocks'''
         conn = sqlite3.connect(self.blockDB, timeout=30)
@@ -664,15 +812,28 @@ class Core:
             author       - multi-round partial sha3-256 hash of authors public key
             dateClaimed  - timestamp claimed inside the block, only as trustworthy as the block author is
             expire       - expire date for a block
+            signer       - public key of the block's signer, only set if the signature is valid
+            signed       - if the block has a signature
+            parent       - hash of the block's parent block
+            decryptKey   - id of the key pair the decrypted value was found with
         '''
+        return self.setBlockInfo(hash, {key: data})
 
-        if key not in ('dateReceived', 'decrypted', 'dataType', 'dataFound', 'dataSaved', 'sig', 'author', 'dateClaimed', 'expire'):
-            return False
+    def setBlockInfo(self, hash, info):
+        '''
+            Set several of a block's info values (see updateBlockInfo) at once from a dict
+        '''
+        for key in info:
+            if key not in ('dateReceived', 'decrypted', 'dataType', 'dataFound', 'dataSaved', 'sig', 'author', 'dateClaimed', 'expire', 'signer', 'signed', 'parent', 'decryptKey'):
+                return False
+        if len(info) == 0:
+            return True
 
         conn = sqlite3.connect(self.blockDB, timeout=30)
         c = conn.cursor()
-        args = (data, hash)
-        c.execute("UPDATE hashes SET " + key + " = ? where hash = ?;", args)
+        keys = list(info)
+        args = [info[key] for key in keys] + [hash]
+        c.execute("UPDATE hashes SET " + ', '.join(key + ' = ?' for key in keys) + " where hash = ?;", args)
         conn.commit()
         conn.close()
 
@@ -745,7 +906,7 @@ class Core:
                 except onionrexceptions.InvalidPubkey:
                     pass
                     #onionrusers.OnionrUser(self, asymPeer).generateForwardKey()
-                fsKey = onionrusers.OnionrUser(self, asymPeer).generateForwardKey()
+                fsKey = forwardkeypool.get_pool(self).getKey(asymPeer)
                 #fsKey = onionrusers.OnionrUser(self, asymPeer).getGeneratedForwardKeys().reverse()
                 meta['newFSKey'] = fsKey
         jsonMeta = json.dumps(meta)
@@ -770,12 +931,18 @@ class Core:
             signer = self._crypto.symmetricEncrypt(signer, key=symKey, returnEncoded=True).decode()
         elif encryptType == 'asym':
             if self._utils.validatePubKey(asymPeer):
-                # Encrypt block data with forward secrecy key first, but not meta
-                jsonMeta = json.dumps(meta)
-                jsonMeta = self._crypto.pubKeyEncrypt(jsonMeta, asymPeer, encodedData=True).decode()
-                data = self._crypto.pubKeyEncrypt(data, asymPeer, encodedData=True).decode()
-                signature = self._crypto.pubKeyEncrypt(signature, asymPeer, encodedData=True).decode()
-                signer = self._crypto.pubKeyEncrypt(signer, asymPeer, encodedData=True).decode()
+                if config.get('general.asym_envelope', False):
+                    # Everything is encrypted under one sealed key, the sealed key goes in the meta field and sig/signer are left empty.
+                    # Off by default until recipients run a version that can read it
+                    jsonMeta, data = self._crypto.envelopeEncrypt((json.dumps(meta), signature, signer, data), asymPeer)
+                    signature = ''
+                    signer = ''
+                else:
+                    jsonMeta = json.dumps(meta)
+                    jsonMeta = self._crypto.pubKeyEncrypt(jsonMeta, asymPeer, encodedData=True).decode()
+                    data = self._crypto.pubKeyEncrypt(data, asymPeer, encodedData=True).decode()
+                    signature = self._crypto.pubKeyEncrypt(signature, asymPeer, encodedData=True).decode()
+                    signer = self._crypto.pubKeyEncrypt(signer, asymPeer, encodedData=True).decode()
                 onionrusers.OnionrUser(self, asymPeer, saveUser=True)
             else:
                 raise onionrexceptions.InvalidPubkey(asymPeer + ' is not a valid base32 encoded ed25519 key')
@@ -0,0 +1,72 @@
+'''
+    Onionr - Private P2P Communication
+
+    In-process channel for commands to the communicator daemon and its responses
+'''
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import queue, threading, time
+
+MAX_BATCH = 100 # most commands handed to the daemon at once
+MAX_RESPONSES = 1000 # responses nobody collected are dropped past this, oldest first
+
+class DaemonQueue:
+    '''
+        Commands are tuples shaped like rows of the old daemon queue database: (command, data, date, id, responseID).
+        The communicator blocks on getBatch, so commands are handled as soon as they are put
+    '''
+    def __init__(self):
+        self._commands = queue.Queue()
+        self._responses = {}
+        self._responseCondition = threading.Condition()
+        self.daemonRunning = False # set when the daemon (client API and communicator) runs in this process
+
+    def put(self, command, data='', responseID=''):
+        self._commands.put((command, data, int(time.time()), None, responseID))
+
+    def getBatch(self, timeout=1):
+        '''Wait up to timeout seconds for a command, then return it with any others waiting (up to MAX_BATCH)'''
+        try:
+            batch = [self._commands.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < MAX_BATCH:
+            try:
+                batch.append(self._commands.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def clear(self):
+        while True:
+            try:
+                self._commands.get_nowait()
+            except queue.Empty:
+                break
+
+    def setResponse(self, responseID, data):
+        with self._responseCondition:
+            if len(self._responses) >= MAX_RESPONSES:
+                del self._responses[next(iter(self._responses))]
+            self._responses[responseID] = data
+            self._responseCondition.notify_all()
+
+    def getResponse(self, responseID, timeout=0):
+        '''Return and remove the response for responseID, waiting up to timeout seconds for it. None if there is none'''
+        with self._responseCondition:
+            self._responseCondition.wait_for(lambda: responseID in self._responses, timeout=timeout)
+            return self._responses.pop(responseID, None)
+
+daemonQueue = DaemonQueue() # shared by everything in this process
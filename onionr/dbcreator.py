@@ -18,6 +18,14 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 import sqlite3, os
+
+BLOCK_INDEXES = (('hashesHash', 'hash'), ('hashesType', 'dataType, dateReceived'), ('hashesSigner', 'signer'),
+    ('hashesParent', 'parent'), ('hashesSigned', 'signed'))
+_upgradedBlockDBs = set() # block database paths already checked by this process
+FORWARD_KEY_INDEXES = (('forwardKeysPeer', 'forwardKeys', 'peerKey, expire'), ('forwardKeysExpire', 'forwardKeys', 'expire'))
+MY_FORWARD_KEY_INDEXES = (('myForwardKeysPeer', 'myForwardKeys', 'peer, expire'), ('myForwardKeysExpire', 'myForwardKeys', 'expire'))
+_indexedKeyDBs = set() # forward key database paths already checked by this process
+
 class DBCreator:
     def __init__(self, coreInst):
         self.core = coreInst
@@ -71,10 +79,30 @@ class DBCreator:
         date int not null,
         expire int not null
         );''')
+        self._createIndexes(c, FORWARD_KEY_INDEXES)
         conn.commit()
         conn.close()
+        _indexedKeyDBs.add(self.core.peerDB)
         return
 
+    def _createIndexes(self, cursor, indexes):
+        for name, table, columns in indexes:
+            cursor.execute('CREATE INDEX IF NOT EXISTS %s ON %s(%s);' % (name, table, columns))
+
+    def indexForwardKeyDBs(self):
+        '''Add the forward secrecy key indexes (and the key pool column) to peer and forward key databases made by an older version'''
+        for dbFile, indexes in ((self.core.peerDB, FORWARD_KEY_INDEXES), (self.core.forwardKeysFile, MY_FORWARD_KEY_INDEXES)):
+            if dbFile in _indexedKeyDBs or not os.path.exists(dbFile):
+                continue
+            conn = sqlite3.connect(dbFile, timeout=30)
+            c = conn.cursor()
+            if dbFile == self.core.forwardKeysFile and not 'pooled' in [row[1] for row in c.execute('PRAGMA table_info(myForwardKeys);')]:
+                c.execute('ALTER TABLE myForwardKeys ADD COLUMN pooled int default 0;')
+            self._createIndexes(c, indexes)
+            conn.commit()
+            conn.close()
+            _indexedKeyDBs.add(dbFile)
+
     def createBlockDB(self):
         '''
             Create a database for blocks
@@ -89,6 +117,10 @@ class DBCreator:
             author       - multi-round partial sha3-256 hash of authors public key
             dateClaimed  - timestamp claimed inside the block, only as trustworthy as the block author is
             expire int   - block expire date in epoch
+            signer       - public key of the block's signer, only set if the signature is valid
+            signed int   - if the block has a signature
+            parent       - hash of the block's parent block
+            decryptKey   - id of the key pair decrypted was last found with, decrypted is only valid for it
         '''
         if os.path.exists(self.core.blockDB):
             raise FileExistsError("Block database already exists")
@@ -104,12 +136,40 @@ class DBCreator:
             sig text,
             author text,
             dateClaimed int,
-            expire int
+            expire int,
+            signer text,
+            signed int,
+            parent text,
+            decryptKey text
             );
         ''')
+        self._createBlockIndexes(c)
         conn.commit()
         conn.close()
+        _upgradedBlockDBs.add(self.core.blockDB)
         return
+
+    def _createBlockIndexes(self, cursor):
+        for name, columns in BLOCK_INDEXES:
+            cursor.execute('CREATE INDEX IF NOT EXISTS %s ON hashes(%s);' % (name, columns))
+
+    def upgradeBlockDB(self):
+        '''
+            Add the block metadata columns and indexes to a block database made by an older version.
+            Metadata of blocks stored before is indexed when Block.getBlocks first needs it
+        '''
+        if self.core.blockDB in _upgradedBlockDBs:
+            return
+        conn = sqlite3.connect(self.core.blockDB, timeout=30)
+        c = conn.cursor()
+        columns = [row[1] for row in c.execute('PRAGMA table_info(hashes);')]
+        for column, columnType in (('signer', 'text'), ('signed', 'int'), ('parent', 'text'), ('decryptKey', 'text')):
+            if not column in columns:
+                c.execute('ALTER TABLE hashes ADD COLUMN %s %s;' % (column, columnType))
+        self._createBlockIndexes(c)
+        conn.commit()
+        conn.close()
+        _upgradedBlockDBs.add(self.core.blockDB)
     
     def createBlockDataDB(self):
         if os.path.exists(self.core.blockDataDB):
@@ -137,11 +197,14 @@ class DBCreator:
             publickey text not null,
             privatekey text not null,
             date int not null,
-            expire int not null
+            expire int not null,
+            pooled int default 0
             );
         ''')
+        self._createIndexes(c, MY_FORWARD_KEY_INDEXES)
         conn.commit()
         conn.close()
+        _indexedKeyDBs.add(self.core.forwardKeysFile)
         return
     
     def createDaemonDB(self):
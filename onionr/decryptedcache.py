@@ -0,0 +1,97 @@
+'''
+    Onionr - Private P2P Communication
+
+    Cache of decrypted block metadata and content, encrypted at rest
+'''
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import sqlite3, json, base64, os
+import nacl.secret, nacl.hash, nacl.encoding, nacl.exceptions
+
+MAX_CACHED_SIZE = 1000000 # bytes, blocks with more content than this are decrypted every time
+
+class DecryptedCache:
+    '''
+        Stores what Block.decrypt produces, so viewing a block again costs a lookup instead of
+        public key decryption, forward secrecy decryption and a signature check.
+        Entries are sealed with a key derived from our private key and tagged with the key pair
+        they were decrypted with, so switching or removing a key invalidates them
+    '''
+    def __init__(self, coreInst):
+        self._core = coreInst
+        self.dbFile = coreInst.dataDir + 'decrypted-cache.db'
+        self._boxes = {} # private key: SecretBox
+
+    def _box(self):
+        privKey = self._core._crypto.privKey
+        try:
+            return self._boxes[privKey]
+        except KeyError:
+            pass
+        key = nacl.hash.blake2b(privKey.encode(), digest_size = nacl.secret.SecretBox.KEY_SIZE, person = b'onionr-dcache', encoder = nacl.encoding.RawEncoder)
+        box = self._boxes[privKey] = nacl.secret.SecretBox(key)
+        return box
+
+    def _connect(self):
+        conn = sqlite3.connect(self.dbFile, timeout = 30)
+        conn.execute('CREATE TABLE IF NOT EXISTS decrypted(hash text primary key, keyID text not null, data blob not null);')
+        return conn
+
+    def get(self, blockHash):
+        '''Return the cached dict of decrypted block values (see put), or None'''
+        if not os.path.exists(self.dbFile):
+            return None
+        conn = self._connect()
+        row = conn.execute('SELECT data FROM decrypted WHERE hash = ? AND keyID = ?;', (blockHash, self._core._crypto.keyID())).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        try:
+            data = json.loads(self._box().decrypt(row[0]).decode())
+            for key in ('content', 'signature', 'signer'):
+                data[key] = base64.b64decode(data[key])
+        except (nacl.exceptions.CryptoError, ValueError, KeyError, TypeError):
+            self.remove(blockHash)
+            return None
+        return data
+
+    def put(self, blockHash, content, metadata, signature, signer, signedData, validSig):
+        '''Cache the decrypted values of a block. content, signature and signer are bytes'''
+        if len(content) > MAX_CACHED_SIZE:
+            return False
+        data = json.dumps({'content': base64.b64encode(content).decode(), 'metadata': metadata, 'signature': base64.b64encode(signature).decode(),
+            'signer': base64.b64encode(signer).decode(), 'signedData': signedData, 'validSig': bool(validSig)})
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO decrypted (hash, keyID, data) VALUES (?, ?, ?);', (blockHash, self._core._crypto.keyID(), self._box().encrypt(data.encode())))
+        conn.commit()
+        conn.close()
+        return True
+
+    def remove(self, blockHash):
+        if not os.path.exists(self.dbFile):
+            return
+        conn = self._connect()
+        conn.execute('DELETE FROM decrypted WHERE hash = ?;', (blockHash,))
+        conn.commit()
+        conn.close()
+
+    def removeKey(self, pubKey):
+        '''Forget everything decrypted with a key pair'''
+        if not os.path.exists(self.dbFile):
+            return
+        conn = self._connect()
+        conn.execute('DELETE FROM decrypted WHERE keyID = ?;', (self._core._crypto.keyID(pubKey),))
+        conn.commit()
+        conn.close()
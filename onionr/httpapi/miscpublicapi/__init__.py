@@ -20,6 +20,8 @@
 from . import announce, upload, getblocks
 
 announce = announce.handle_announce # endpoint handler for accepting peer announcements
+raw_upload = upload.accept_raw_upload # endpoint handler for accepting public uploads as a raw body
 upload = upload.accept_upload # endpoint handler for accepting public uploads
 public_block_list = getblocks.get_public_block_list # endpoint handler for getting block lists
+public_block_digest = getblocks.get_block_digest # endpoint handler for block list reconciliation summaries
 public_get_block_data = getblocks.get_block_data # endpoint handler for responding to peers requests for block data
\ No newline at end of file
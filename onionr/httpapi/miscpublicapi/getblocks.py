@@ -17,19 +17,52 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
+import time
 from flask import Response, abort
 import config
-def get_public_block_list(clientAPI, publicAPI, request):
-    # Provide a list of our blocks, with a date offset
-    dateAdjust = request.args.get('date')
+from utils import reconcile
+
+HASH_TREE_MAX_AGE = 30 # seconds to reuse a built hash tree for digest requests
+
+def _shareable_block_list(clientAPI, publicAPI, dateAdjust=None):
     bList = clientAPI._core.getBlockList(dateRec=dateAdjust)
     if config.get('general.hide_created_blocks', True):
         for b in publicAPI.hideBlocks:
             if b in bList:
                 # Don't share blocks we created if they haven't been *uploaded* yet, makes it harder to find who created a block
                 bList.remove(b)
+    return bList
+
+def get_public_block_list(clientAPI, publicAPI, request):
+    # Provide a list of our blocks, with a date offset
+    dateAdjust = request.args.get('date')
+    prefixes = reconcile.parse_prefixes(request.args.get('prefix', ''))
+    if prefixes is None:
+        abort(400)
+    if prefixes != ['']:
+        # Only the hashes in the requested buckets, for reconciliation
+        tree = _get_hash_tree(clientAPI, publicAPI)
+        bList = []
+        for prefix in set(prefixes):
+            bList.extend(tree.bucket(prefix))
+    else:
+        bList = _shareable_block_list(clientAPI, publicAPI, dateAdjust)
     return Response('\n'.join(bList))
 
+def _get_hash_tree(clientAPI, publicAPI):
+    '''Return a (briefly cached) hash tree of the blocks we are willing to share'''
+    if publicAPI.hashTree is None or time.time() - publicAPI.hashTreeTime > HASH_TREE_MAX_AGE:
+        publicAPI.hashTree = reconcile.HashTree(_shareable_block_list(clientAPI, publicAPI))
+        publicAPI.hashTreeTime = time.time()
+    return publicAPI.hashTree
+
+def get_block_digest(clientAPI, publicAPI, request):
+    '''Return the bucket summaries one level below each comma seperated prefix, for inventory reconciliation'''
+    prefixes = reconcile.parse_prefixes(request.args.get('prefix', ''))
+    if prefixes is None:
+        abort(400)
+    return Response(_get_hash_tree(clientAPI, publicAPI).serializeChildren(prefixes), mimetype='application/json')
+
 def get_block_data(clientAPI, publicAPI, data):
     '''data is the block hash in hex'''
     resp = ''
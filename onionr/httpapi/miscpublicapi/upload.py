@@ -17,9 +17,12 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
-import sys
+import sys, hashlib
 from flask import Response, abort
 import blockimporter, onionrexceptions, logger
+
+UPLOAD_CHUNK_SIZE = 65536 # bytes read from the request stream at a time
+
 def accept_upload(clientAPI, request):
     resp = 'failure'
     try:
@@ -40,4 +43,44 @@ def accept_upload(clientAPI, request):
     if resp == 'failure':
         abort(400)
     resp = Response(resp)
-    return resp
\ No newline at end of file
+    return resp
+
+def accept_raw_upload(clientAPI, request, blockHash):
+    '''
+        Accept a block sent as a raw application/octet-stream body. The hash is in the URL, so blacklisted,
+        already saved and oversized blocks are rejected before the body is read. The body is hashed as it streams in
+    '''
+    _core = clientAPI._core
+    if not _core._utils.validateHash(blockHash):
+        abort(400)
+    if _core._blacklist.inBlacklist(blockHash):
+        logger.debug('uploaded block is blacklisted')
+        abort(403)
+    if _core._utils.hasBlock(blockHash):
+        return Response('exists')
+    if request.content_length is None:
+        abort(411) # the size is checked before reading, so it has to be sent
+    if request.content_length > _core.maxBlockSize:
+        abort(413)
+
+    hasher = hashlib.sha3_256()
+    data = bytearray()
+    while True:
+        chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+        if len(chunk) == 0:
+            break
+        data.extend(chunk)
+        if len(data) > request.content_length:
+            abort(413)
+        hasher.update(chunk)
+    if hasher.hexdigest() != blockHash:
+        logger.warn('Uploaded block did not match its hash')
+        abort(400)
+
+    try:
+        if not blockimporter.importBlockFromData(bytes(data), _core):
+            logger.warn('Error encountered importing uploaded block')
+            abort(400)
+    except onionrexceptions.BlacklistedBlock:
+        abort(403)
+    return Response('success')
@@ -42,6 +42,9 @@ class KeyManager:
 
     def removeKey(self, pubKey):
         '''Remove a key pair by pubkey'''
+        privKey = self.getPrivkey(pubKey)
+        if not privKey is None:
+            onionrcrypto.forget_private_key(privKey)
         keyList = self.getPubkeyList()
         keyData = ''
         try:
@@ -52,6 +55,7 @@ class KeyManager:
             keyData = ','.join(keyList)
             with open(self.keyFile, "w") as keyFile:
                 keyFile.write(keyData)
+            self._core.decryptedCache.removeKey(pubKey)
 
     def getPubkeyList(self):
         '''Return a list of the user's keys'''
@@ -0,0 +1,41 @@
+'''
+    Onionr - Private P2P Communication
+
+    Registry of client API handlers that localCommand can call directly when the API runs in this process
+'''
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+_handlers = {} # (command name, post): function taking the rest of the path and the post data, returning a str
+
+def register(name, handler, post=False):
+    '''Register a handler for the first path segment of a local command. The http route should call the same function'''
+    _handlers[(name, post)] = handler
+
+def unregister(name, post=False):
+    _handlers.pop((name, post), None)
+
+def dispatch(command, post=False, postData={}):
+    '''
+        Run a local command in process if a handler is registered for it.
+        Returns the handler's response str, or None if the command has to go over http
+    '''
+    if '?' in command:
+        return None # handlers don't take query arguments
+    name, sep, arg = command.strip('/').partition('/')
+    try:
+        handler = _handlers[(name, post)]
+    except KeyError:
+        return None
+    return handler(arg, postData)
@@ -18,7 +18,9 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
-import re, sys, time, traceback, os
+import re, sys, time, traceback, os, threading, queue, atexit
+
+_ansiCodes = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
 
 class colors:
     '''
@@ -59,7 +61,7 @@ class colors:
         lightgrey='\033[47m'
     @staticmethod
     def filter(data):
-        return re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]').sub('', str(data))
+        return _ansiCodes.sub('', str(data))
 
 '''
     Use the bitwise operators to merge these settings
@@ -81,6 +83,21 @@ _type = OUTPUT_TO_CONSOLE | USE_ANSI # the default settings for logging
 _level = LEVEL_DEBUG # the lowest level to log
 _outputfile = 'data/onionr.log' # the file to log to
 
+MAX_QUEUE_SIZE = 10000 # messages waiting for the writer in async mode, new ones are dropped past this
+WRITE_BATCH = 500 # most messages the writer handles at once
+STOP_TIMEOUT = 5 # seconds to wait for the writer when turning async mode off
+
+_maxFileSize = 0 # rotate the log file past this size, 0 to never rotate
+_fileBackups = 3 # rotated log files to keep (onionr.log.1 is the newest)
+_fileSize = None # size of the log file as far as this process knows, None if not read yet
+_fileLock = threading.Lock()
+
+_queue = None # messages for the writer thread, None when writing synchronously
+_writer = None
+_asyncLock = threading.Lock()
+_dropped = 0 # messages dropped because the queue was full
+_droppedLock = threading.Lock()
+
 def set_settings(type):
     '''
         Set the settings for the logger using bitwise operators
@@ -116,8 +133,10 @@ def set_file(outputfile):
         Set the file to output to, if enabled
     '''
 
-    global _outputfile
-    _outputfile = outputfile
+    global _outputfile, _fileSize
+    with _fileLock:
+        _outputfile = outputfile
+        _fileSize = None
 
 def get_file():
     '''
@@ -126,30 +145,165 @@ def get_file():
 
     return _outputfile
 
-def raw(data, fd = sys.stdout, sensitive = False):
+def set_rotation(maxSize, backups = 3):
     '''
-        Outputs raw data to console without formatting
+        Rotate the log file once it grows past maxSize bytes, keeping this many old files. 0 disables rotation
+    '''
+
+    global _maxFileSize, _fileBackups
+    _maxFileSize = max(0, int(maxSize))
+    _fileBackups = max(0, int(backups))
+
+def set_async(enabled, maxQueueSize = MAX_QUEUE_SIZE):
+    '''
+        Hand messages to a background writer instead of writing them in the calling thread.
+        Messages are dropped (and counted) instead of waiting when the writer falls behind
     '''
 
-    if get_settings() & OUTPUT_TO_CONSOLE:
+    global _queue, _writer
+    with _asyncLock:
+        if enabled and _queue is None:
+            _queue = queue.Queue(maxQueueSize)
+            _writer = threading.Thread(target = _write_queued, args = (_queue,), name = 'logger', daemon = True)
+            _writer.start()
+        elif not enabled and not _queue is None:
+            oldQueue = _queue
+            _queue = None
+            try:
+                oldQueue.put(None, timeout = STOP_TIMEOUT) # writer stops once everything before this is written
+            except queue.Full:
+                pass # the writer is stuck, it is a daemon thread so it won't keep Onionr running
+            else:
+                _writer.join(STOP_TIMEOUT)
+            _writer = None
+
+def get_async():
+    '''
+        Get if messages are written by the background writer
+    '''
+
+    return not _queue is None
+
+def get_dropped():
+    '''
+        Get how many messages were dropped because the background writer fell behind
+    '''
+
+    return _dropped
+
+def flush():
+    '''
+        Wait until the background writer has written every queued message
+    '''
+
+    messages = _queue
+    if not messages is None:
+        messages.join()
+
+def _write_queued(messages):
+    reportedDropped = 0
+    running = True
+    while running:
+        batch = [messages.get()]
+        while len(batch) < WRITE_BATCH:
+            try:
+                batch.append(messages.get_nowait())
+            except queue.Empty:
+                break
+        received = len(batch)
+        if None in batch:
+            running = False
+            batch = [message for message in batch if not message is None]
+        if _dropped != reportedDropped:
+            batch.append(('%s log messages dropped, logging is falling behind' % (_dropped - reportedDropped,), sys.stderr, False))
+            reportedDropped = _dropped
         try:
-            ts = fd.write('%s\n' % data)
-        except OSError:
-            pass
-    if get_settings() & OUTPUT_TO_FILE and not sensitive:
+            _write(batch)
+        except Exception:
+            # the writer has to keep running, or flush would wait forever
+            try:
+                traceback.print_exc()
+            except Exception:
+                pass
+        finally:
+            for i in range(received):
+                messages.task_done()
+
+def _write(messages):
+    '''
+        Write a list of (data, fd, sensitive) to the console and log file, depending on the settings
+    '''
+
+    settings = get_settings()
+    if settings & OUTPUT_TO_CONSOLE:
+        for data, fd, sensitive in messages:
+            try:
+                fd.write('%s\n' % data)
+            except OSError:
+                pass
+    if settings & OUTPUT_TO_FILE:
+        lines = ''.join(colors.filter(data) + '\n' for data, fd, sensitive in messages if not sensitive)
+        if len(lines) > 0:
+            _write_file(lines)
+
+def _write_file(lines):
+    global _fileSize
+    with _fileLock:
         try:
+            if _maxFileSize > 0:
+                if _fileSize is None:
+                    try:
+                        _fileSize = os.path.getsize(_outputfile)
+                    except FileNotFoundError:
+                        _fileSize = 0
+                # Sizes are counted in characters, close enough to bytes for log output
+                if _fileSize > 0 and _fileSize + len(lines) > _maxFileSize:
+                    _rotate_file()
+                    _fileSize = 0
             with open(_outputfile, "a+") as f:
-                f.write(colors.filter(data) + '\n')
+                f.write(lines)
+            if not _fileSize is None:
+                _fileSize += len(lines)
         except OSError:
             pass
 
-def log(prefix, data, color = '', timestamp=True, fd = sys.stdout, prompt = True, sensitive = False):
+def _rotate_file():
+    for i in range(_fileBackups - 1, 0, -1):
+        try:
+            os.replace('%s.%s' % (_outputfile, i), '%s.%s' % (_outputfile, i + 1))
+        except FileNotFoundError:
+            pass
+    if _fileBackups > 0:
+        os.replace(_outputfile, _outputfile + '.1')
+    else:
+        os.remove(_outputfile)
+
+def raw(data, fd = sys.stdout, sensitive = False):
+    '''
+        Outputs raw data to console without formatting
+    '''
+
+    global _dropped
+    messages = _queue
+    if messages is None:
+        _write([(data, fd, sensitive)])
+    else:
+        try:
+            messages.put_nowait((data, fd, sensitive))
+        except queue.Full:
+            with _droppedLock:
+                _dropped += 1
+
+def log(prefix, data, color = '', timestamp=True, fd = sys.stdout, prompt = True, sensitive = False, args = None):
     '''
         Logs the data
         prefix : The prefix to the output
         data   : The actual data to output
         color  : The color to output before the data
+        args   : Values to format data with (data % args), so callers don't format messages that are not logged
     '''
+    if not args is None:
+        data = str(data) % args
     curTime = ''
     if timestamp:
         curTime = time.strftime("%m-%d %H:%M:%S") + ' '
@@ -172,6 +326,7 @@ def readline(message = ''):
     if not get_settings() & USE_ANSI:
         output = colors.filter(output)
 
+    flush()
     sys.stdout.write(output)
 
     return input()
@@ -198,6 +353,7 @@ def confirm(default = 'y', message = 'Are you sure %s? '):
     if not get_settings() & USE_ANSI:
         output = colors.filter(output)
 
+    flush()
     sys.stdout.write(output.replace('%s', confirm))
 
     inp = input().lower()
@@ -210,37 +366,37 @@ def confirm(default = 'y', message = 'Are you sure %s? '):
         return default == 'y'
 
 # debug: when there is info that could be useful for debugging purposes only
-def debug(data, error = None, timestamp = True, prompt = True, sensitive = False, level = LEVEL_DEBUG):
+def debug(data, error = None, timestamp = True, prompt = True, sensitive = False, level = LEVEL_DEBUG, args = None):
     if get_level() <= level:
-        log('/', data, timestamp = timestamp, prompt = prompt, sensitive = sensitive)
+        log('/', data, timestamp = timestamp, prompt = prompt, sensitive = sensitive, args = args)
     if not error is None:
         debug('Error: ' + str(error) + parse_error())
 
 # info: when there is something to notify the user of, such as the success of a process
-def info(data, timestamp = False, prompt = True, sensitive = False, level = LEVEL_INFO):
+def info(data, timestamp = False, prompt = True, sensitive = False, level = LEVEL_INFO, args = None):
     if get_level() <= level:
-        log('+', data, colors.fg.green, timestamp = timestamp, prompt = prompt, sensitive = sensitive)
+        log('+', data, colors.fg.green, timestamp = timestamp, prompt = prompt, sensitive = sensitive, args = args)
 
 # warn: when there is a potential for something bad to happen
-def warn(data, error = None, timestamp = True, prompt = True, sensitive = False, level = LEVEL_WARN):
+def warn(data, error = None, timestamp = True, prompt = True, sensitive = False, level = LEVEL_WARN, args = None):
     if not error is None:
         debug('Error: ' + str(error) + parse_error())
     if get_level() <= level:
-        log('!', data, colors.fg.orange, timestamp = timestamp, prompt = prompt, sensitive = sensitive)
+        log('!', data, colors.fg.orange, timestamp = timestamp, prompt = prompt, sensitive = sensitive, args = args)
 
 # error: when only one function, module, or process of the program encountered a problem and must stop
-def error(data, error = None, timestamp = True, prompt = True, sensitive = False, level = LEVEL_ERROR):
+def error(data, error = None, timestamp = True, prompt = True, sensitive = False, level = LEVEL_ERROR, args = None):
     if get_level() <= level:
-        log('-', data, colors.fg.red, timestamp = timestamp, fd = sys.stderr, prompt = prompt, sensitive = sensitive)
+        log('-', data, colors.fg.red, timestamp = timestamp, fd = sys.stderr, prompt = prompt, sensitive = sensitive, args = args)
     if not error is None:
         debug('Error: ' + str(error) + parse_error())
 
 # fatal: when the something so bad has happened that the program must stop
-def fatal(data, error = None, timestamp=True, prompt = True, sensitive = False, level = LEVEL_FATAL):
+def fatal(data, error = None, timestamp=True, prompt = True, sensitive = False, level = LEVEL_FATAL, args = None):
     if not error is None:
         debug('Error: ' + str(error) + parse_error(), sensitive = sensitive)
     if get_level() <= level:
-        log('#', data, colors.bg.red + colors.fg.green + colors.bold, timestamp = timestamp, fd = sys.stderr, prompt = prompt, sensitive = sensitive)
+        log('#', data, colors.bg.red + colors.fg.green + colors.bold, timestamp = timestamp, fd = sys.stderr, prompt = prompt, sensitive = sensitive, args = args)
 
 # returns a formatted error message
 def parse_error():
@@ -251,3 +407,5 @@ def parse_error():
         output += '\n    ... module %s in  %s:%i' % (line[2], line[0], line[1])
 
     return output
+
+atexit.register(set_async, False) # write out anything still queued
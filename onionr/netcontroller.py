@@ -20,7 +20,6 @@
 import subprocess, os, sys, time, signal, base64, socket
 from shutil import which
 import logger, config
-from onionrblockapi import Block
 config.reload()
 def getOpenPort():
     # taken from (but modified) https://stackoverflow.com/a/2838309 by https://stackoverflow.com/users/133374/albert ccy-by-sa-3 https://creativecommons.org/licenses/by-sa/3.0/
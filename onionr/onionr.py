@@ -25,26 +25,23 @@ MIN_PY_VERSION = 6
 if sys.version_info[0] == 2 or sys.version_info[1] < MIN_PY_VERSION:
     sys.stderr.write('Error, Onionr requires Python 3.%s+' % (MIN_PY_VERSION,))
     sys.exit(1)
-import os, base64, random, shutil, time, platform, signal
-from threading import Thread
-import api, core, config, logger, onionrplugins as plugins, onionrevents as events
-import onionrutils
-import netcontroller
-from netcontroller import NetController
-from onionrblockapi import Block
-import onionrproofs, onionrexceptions, communicator, setupconfig
+import os, base64, shutil, time, platform, signal
+import config, logger, setupconfig
 import onionrcommands as commands # Many command definitions are here
 
-try:
-    from urllib3.contrib.socks import SOCKSProxyManager
-except ImportError:
-    raise Exception("You need the PySocks module (for use with socks5 proxy to use Tor)")
+# Core, plugins and the daemon's modules (Flask, gevent, requests) are imported when a command needs them,
+# so short commands start quickly
 
 ONIONR_TAGLINE = 'Private P2P Communication - GPLv3 - https://Onionr.net'
 ONIONR_VERSION = '0.0.0' # for debugging and stuff
 ONIONR_VERSION_TUPLE = tuple(ONIONR_VERSION.split('.')) # (MAJOR, MINOR, VERSION)
 API_VERSION = '0' # increments of 1; only change when something fundamental about how the API works changes. This way other nodes know how to communicate without learning too much information about you.
 
+# Commands that run without loading plugins or checking for Tor. Core is only made if the command uses it
+LIGHT_COMMANDS = ('', 'version', 'header', 'config', 'status', 'statistics', 'stats',
+    'details', 'detail', 'show-details', 'show-detail', 'showdetails', 'showdetail', 'get-details', 'get-detail', 'getdetails', 'getdetail',
+    'getpassword', 'get-password', 'getpwd', 'get-pwd', 'getpass', 'get-pass', 'getpasswd', 'get-passwd')
+
 class Onionr:
     def __init__(self):
         '''
@@ -71,37 +68,30 @@ class Onionr:
         # Load global configuration data
         data_exists = Onionr.setupConfig(self.dataDir, self)
 
-        if netcontroller.torBinary() is None:
-            logger.error('Tor is not installed')
-            sys.exit(1)
+        command = ''
+        try:
+            command = sys.argv[1].lower()
+        except IndexError:
+            command = ''
+        light = (command[2:] if command.startswith('--') else command) in LIGHT_COMMANDS
+
+        if not light:
+            import netcontroller
+            if netcontroller.torBinary() is None:
+                logger.error('Tor is not installed')
+                sys.exit(1)
 
         # If block data folder does not exist
         if not os.path.exists(self.dataDir + 'blocks/'):
             os.mkdir(self.dataDir + 'blocks/')
 
-        # Copy default plugins into plugins folder
-        if not os.path.exists(plugins.get_plugins_folder()):
-            if os.path.exists('static-data/default-plugins/'):
-                names = [f for f in os.listdir("static-data/default-plugins/")]
-                shutil.copytree('static-data/default-plugins/', plugins.get_plugins_folder())
-
-                # Enable plugins
-                for name in names:
-                    if not name in plugins.get_enabled_plugins():
-                        plugins.enable(name, self)
-
-        for name in plugins.get_enabled_plugins():
-            if not os.path.exists(plugins.get_plugin_data_folder(name)):
-                try:
-                    os.mkdir(plugins.get_plugin_data_folder(name))
-                except:
-                    plugins.disable(name, onionr = self, stop_event = False)
+        if not light:
+            self.initPlugins()
 
         self.communicatorInst = None
-        self.onionrCore = core.Core()
-        self.onionrCore.onionrInst = self
+        self._core = None # made when first used, see onionrCore
+        self._utils = None
         #self.deleteRunFiles()
-        self.onionrUtils = onionrutils.OnionrUtils(self.onionrCore)
 
         self.clientAPIInst = '' # Client http api instance
         self.publicAPIInst = '' # Public http api instance
@@ -115,12 +105,14 @@ class Onionr:
         # Get configuration
         if type(config.get('client.webpassword')) is type(None):
             config.set('client.webpassword', base64.b16encode(os.urandom(32)).decode('utf-8'), savefile=True)
-        if type(config.get('client.client.port')) is type(None):
-            randomPort = netcontroller.getOpenPort()
-            config.set('client.client.port', randomPort, savefile=True)
-        if type(config.get('client.public.port')) is type(None):
-            randomPort = netcontroller.getOpenPort()
-            config.set('client.public.port', randomPort, savefile=True)
+        if type(config.get('client.client.port')) is type(None) or type(config.get('client.public.port')) is type(None):
+            import netcontroller
+            if type(config.get('client.client.port')) is type(None):
+                randomPort = netcontroller.getOpenPort()
+                config.set('client.client.port', randomPort, savefile=True)
+            if type(config.get('client.public.port')) is type(None):
+                randomPort = netcontroller.getOpenPort()
+                config.set('client.public.port', randomPort, savefile=True)
         if type(config.get('client.api_version')) is type(None):
             config.set('client.api_version', API_VERSION, savefile=True)
 
@@ -128,18 +120,53 @@ class Onionr:
         self.cmdhelp = commands.cmd_help
 
         # initialize plugins
-        events.event('init', onionr = self, threaded = False)
+        if not light:
+            import onionrevents as events
+            events.event('init', onionr = self, threaded = False)
 
-        command = ''
-        try:
-            command = sys.argv[1].lower()
-        except IndexError:
-            command = ''
-        finally:
-            self.execute(command)
+        self.execute(command)
 
         return
 
+    @property
+    def onionrCore(self):
+        if self._core is None:
+            import core
+            self._core = core.Core()
+            self._core.onionrInst = self
+        return self._core
+
+    @property
+    def onionrUtils(self):
+        if self._utils is None:
+            import onionrutils
+            self._utils = onionrutils.OnionrUtils(self.onionrCore)
+        return self._utils
+
+    def initPlugins(self):
+        '''
+            Copy the default plugins on the first run and make sure enabled plugins have a data folder
+        '''
+        import onionrplugins as plugins
+
+        # Copy default plugins into plugins folder
+        if not os.path.exists(plugins.get_plugins_folder()):
+            if os.path.exists('static-data/default-plugins/'):
+                names = [f for f in os.listdir("static-data/default-plugins/")]
+                shutil.copytree('static-data/default-plugins/', plugins.get_plugins_folder())
+
+                # Enable plugins
+                for name in names:
+                    if not name in plugins.get_enabled_plugins():
+                        plugins.enable(name, self)
+
+        for name in plugins.get_enabled_plugins():
+            if not os.path.exists(plugins.get_plugin_data_folder(name)):
+                try:
+                    os.mkdir(plugins.get_plugin_data_folder(name))
+                except:
+                    plugins.disable(name, onionr = self, stop_event = False)
+
     def exitSigterm(self, signum, frame):
         self.killed = True
 
@@ -200,19 +227,19 @@ class Onionr:
     '''
 
     def exportBlock(self):
-        commands.exportblocks(self)
+        commands.load('exportblocks').export_block(self)
 
     def showDetails(self):
-        commands.onionrstatistics.show_details(self)
+        commands.load('onionrstatistics').show_details(self)
 
     def openHome(self):
-        commands.openwebinterface.open_home(self)
+        commands.load('openwebinterface').open_home(self)
 
     def addID(self):
-        commands.pubkeymanager.add_ID(self)
+        commands.load('pubkeymanager').add_ID(self)
 
     def changeID(self):
-        commands.pubkeymanager.change_ID(self)
+        commands.load('pubkeymanager').change_ID(self)
 
     def getCommands(self):
         return self.cmds
@@ -221,13 +248,22 @@ class Onionr:
         '''List, add, or remove friend(s)
         Changes their peer DB entry.
         '''
-        commands.pubkeymanager.friend_command(self)
+        commands.load('pubkeymanager').friend_command(self)
 
     def banBlock(self):
-        commands.banblocks.ban_block(self)
+        commands.load('banblocks').ban_block(self)
 
     def listConn(self):
-        commands.onionrstatistics.show_peers(self)
+        commands.load('onionrstatistics').show_peers(self)
+
+    def importBlocks(self):
+        self.onionrUtils.importNewBlocks()
+
+    def introduceNode(self):
+        self.onionrCore.introduceNode()
+
+    def resetTor(self):
+        commands.load('resettor').reset_tor()
 
     def listPeers(self):
         logger.info('Peer transport address list:')
@@ -310,37 +346,37 @@ class Onionr:
         '''
             Adds a peer (?)
         '''
-        commands.keyadders.add_peer(self)
+        commands.load('keyadders').add_peer(self)
 
     def addAddress(self):
         '''
             Adds a Onionr node address
         '''
-        commands.keyadders.add_address(self)
+        commands.load('keyadders').add_address(self)
 
     def enablePlugin(self):
         '''
             Enables and starts the given plugin
         '''
-        commands.plugincommands.enable_plugin(self)
+        commands.load('plugincommands').enable_plugin(self)
 
     def disablePlugin(self):
         '''
             Disables and stops the given plugin
         '''
-        commands.plugincommands.disable_plugin(self)
+        commands.load('plugincommands').disable_plugin(self)
 
     def reloadPlugin(self):
         '''
             Reloads (stops and starts) all plugins, or the given plugin
         '''
-        commands.plugincommands.reload_plugin(self)
+        commands.load('plugincommands').reload_plugin(self)
 
     def createPlugin(self):
         '''
             Creates the directory structure for a plugin name
         '''
-        commands.plugincommands.create_plugin(self)
+        commands.load('plugincommands').create_plugin(self)
 
     def notFound(self):
         '''
@@ -360,9 +396,13 @@ class Onionr:
         '''
             Starts the Onionr daemon
         '''
+        try:
+            from urllib3.contrib.socks import SOCKSProxyManager
+        except ImportError:
+            raise Exception("You need the PySocks module (for use with socks5 proxy to use Tor)")
         if config.get('general.dev_mode', False):
             override = True
-        commands.daemonlaunch.start(self, input, override)
+        commands.load('daemonlaunch').start(self, input, override)
 
     def setClientAPIInst(self, inst):
         self.clientAPIInst = inst
@@ -376,19 +416,19 @@ class Onionr:
         '''
             Starts the Onionr communication daemon
         '''
-        commands.daemonlaunch.daemon(self)
+        commands.load('daemonlaunch').daemon(self)
 
     def killDaemon(self):
         '''
             Shutdown the Onionr daemon
         '''
-        commands.daemonlaunch.kill_daemon(self)
+        commands.load('daemonlaunch').kill_daemon(self)
 
     def showStats(self):
         '''
             Displays statistics and exits
         '''
-        commands.onionrstatistics.show_stats(self)
+        commands.load('onionrstatistics').show_stats(self)
 
     def showHelp(self, command = None):
         '''
@@ -400,7 +440,7 @@ class Onionr:
         '''
             Get a file from onionr blocks
         '''
-        commands.filecommands.getFile(self)
+        commands.load('filecommands').getFile(self)
 
     def addWebpage(self):
         '''
@@ -412,7 +452,7 @@ class Onionr:
         '''
             Adds a file to the onionr network
         '''
-        commands.filecommands.add_file(self, singleBlock, blockType)
+        commands.load('filecommands').add_file(self, singleBlock, blockType)
 
 if __name__ == "__main__":
     Onionr()
@@ -17,7 +17,11 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
-import sqlite3, os, logger
+import sqlite3, os, threading, logger
+
+_loaded = {} # blacklist database path: (modification time it was loaded at, set of hashes), shared by every OnionrBlackList in this process
+_loadedLock = threading.Lock()
+
 class OnionrBlackList:
     def __init__(self, coreInst):
         self.blacklistDB = coreInst.dataDir + 'blacklist.db'
@@ -27,26 +31,67 @@ class OnionrBlackList:
             self.generateDB()
         return
 
-    def inBlacklist(self, data):
+    def _hash(self, data):
         hashed = self._core._utils.bytesToStr(self._core._crypto.sha3Hash(data))
-        retData = False
-
         if not hashed.isalnum():
             raise Exception("Hashed data is not alpha numeric")
         if len(hashed) > 64:
             raise Exception("Hashed data is too large")
+        return hashed
 
-        for i in self._dbExecute("SELECT * FROM blacklist WHERE hash = ?", (hashed,)):
-            retData = True # this only executes if an entry is present by that hash
-            break
+    def _getModifiedTime(self):
+        try:
+            return os.stat(self.blacklistDB).st_mtime_ns
+        except FileNotFoundError:
+            return None
 
-        return retData
+    def _getHashes(self):
+        '''
+            Return the set of blacklisted hashes. It is loaded once, and again when the database
+            file changes (such as when another process running Onionr adds to it)
+        '''
+        mtime = self._getModifiedTime()
+        with _loadedLock:
+            try:
+                loadedTime, hashes = _loaded[self.blacklistDB]
+            except KeyError:
+                loadedTime = hashes = None
+            if hashes is None or loadedTime != mtime:
+                hashes = set(i[0] for i in self._dbExecute('SELECT hash FROM blacklist'))
+                _loaded[self.blacklistDB] = (mtime, hashes)
+            return hashes
+
+    def _updateLoaded(self, beforeWrite, added=(), removed=()):
+        '''
+            Apply our own write to the loaded set. beforeWrite is the modification time from before the write,
+            if anything else changed the database since it was loaded the set is loaded again on next use instead
+        '''
+        with _loadedLock:
+            try:
+                loadedTime, hashes = _loaded[self.blacklistDB]
+            except KeyError:
+                return
+            hashes.update(added)
+            hashes.difference_update(removed)
+            if loadedTime == beforeWrite:
+                _loaded[self.blacklistDB] = (self._getModifiedTime(), hashes)
+
+    def inBlacklist(self, data):
+        return self._hash(data) in self._getHashes()
+
+    def inBlacklistMany(self, dataList):
+        '''Check a list of data against the blacklist at once, returns a list of bools in the same order'''
+        hashes = self._getHashes()
+        return [self._hash(data) in hashes for data in dataList]
 
     def _dbExecute(self, toExec, params = ()):
         conn = sqlite3.connect(self.blacklistDB)
-        c = conn.cursor()
-        retData = c.execute(toExec, params)
-        conn.commit()
+        try:
+            c = conn.cursor()
+            retData = c.execute(toExec, params).fetchall()
+            conn.commit()
+        finally:
+            conn.close()
         return retData
 
     def deleteBeforeDate(self, date):
@@ -68,8 +113,15 @@ class OnionrBlackList:
                 if (curTime - i[2]) >= i[3]:
                     deleteList.append(i[0])
 
-        for thing in deleteList:
-            self._dbExecute("DELETE FROM blacklist WHERE hash = ?", (thing,))
+        if len(deleteList) > 0:
+            beforeWrite = self._getModifiedTime()
+            conn = sqlite3.connect(self.blacklistDB)
+            try:
+                conn.executemany("DELETE FROM blacklist WHERE hash = ?", [(thing,) for thing in deleteList])
+                conn.commit()
+            finally:
+                conn.close()
+            self._updateLoaded(beforeWrite, removed=deleteList)
 
     def generateDB(self):
         self._dbExecute('''CREATE TABLE blacklist(
@@ -83,6 +135,8 @@ class OnionrBlackList:
 
     def clearDB(self):
         self._dbExecute('''DELETE FROM blacklist;''')
+        with _loadedLock:
+            _loaded.pop(self.blacklistDB, None)
 
     def getList(self):
         data = self._dbExecute('SELECT * FROM blacklist')
@@ -98,12 +152,7 @@ class OnionrBlackList:
         2=pubkey
         '''
         # we hash the data so we can remove data entirely from our node's disk
-        hashed = self._core._utils.bytesToStr(self._core._crypto.sha3Hash(data))
-        if len(hashed) > 64:
-            raise Exception("Hashed data is too large")
-
-        if not hashed.isalnum():
-            raise Exception("Hashed data is not alpha numeric")
+        hashed = self._hash(data)
         try:
             int(dataType)
         except ValueError:
@@ -112,11 +161,12 @@ class OnionrBlackList:
             int(expire)
         except ValueError:
             raise Exception("expire is not int")
-        if self.inBlacklist(hashed):
+        if hashed in self._getHashes():
             return
-        insert = (hashed,)
         blacklistDate = self._core._utils.getEpoch()
+        beforeWrite = self._getModifiedTime()
         try:
             self._dbExecute("INSERT INTO blacklist (hash, dataType, blacklistDate, expire) VALUES(?, ?, ?, ?);", (str(hashed), dataType, blacklistDate, expire))
         except sqlite3.IntegrityError:
             pass
+        self._updateLoaded(beforeWrite, added=(hashed,))
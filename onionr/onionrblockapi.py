@@ -22,11 +22,14 @@ import core as onionrcore, logger, config, onionrexceptions, nacl.exceptions
 import json, os, sys, datetime, base64, onionrstorage
 from onionrusers import onionrusers
 
+_HEADER_ATTRIBUTES = ('bheader', 'bmetadata', 'isEncrypted', 'parent', 'btype', 'signed', 'signer', 'signature', 'claimedTime')
+_CONTENT_ATTRIBUTES = ('raw', 'bcontent', 'signedData')
+
 class Block:
     blockCacheOrder = list() # NEVER write your own code that writes to this!
     blockCache = dict() # should never be accessed directly, look at Block.getCache()
 
-    def __init__(self, hash = None, core = None, type = None, content = None, expire=None, decrypt=False, bypassReplayCheck=False):
+    def __init__(self, hash = None, core = None, type = None, content = None, expire=None, decrypt=False, bypassReplayCheck=False, lazy=False):
         # take from arguments
         # sometimes people input a bytes object instead of str in `hash`
         if (not hash is None) and isinstance(hash, bytes):
@@ -34,33 +37,84 @@ class Block:
 
         self.hash = hash
         self.core = core
-        self.btype = type
-        self.bcontent = content
         self.expire = expire
         self.bypassReplayCheck = bypassReplayCheck
 
         # initialize variables
         self.valid = True
-        self.raw = None
-        self.signed = False
-        self.signature = None
-        self.signedData = None
         self.blockFile = None
-        self.parent = None
-        self.bheader = {}
-        self.bmetadata = {}
-        self.isEncrypted = False
         self.decrypted = False
-        self.signer = None
         self.validSig = False
+        self._sigChecked = False # set when validSig came from the decrypted block cache or Block.verifySigs
         self.autoDecrypt = decrypt
 
         # handle arguments
         if self.getCore() is None:
             self.core = onionrcore.Core()
 
+        if lazy and not hash is None:
+            # Header and content values are left unset, __getattr__ loads them when first used
+            self.autoDecrypt = False
+            if decrypt:
+                self.decrypt()
+            return
+
+        self.btype = type
+        self.bcontent = content
+        self._setDefaults()
         self.update()
 
+    def _setDefaults(self):
+        for name, value in (('raw', None), ('signed', False), ('signature', None), ('signedData', None), ('parent', None),
+            ('bheader', {}), ('bmetadata', {}), ('isEncrypted', False), ('signer', None), ('btype', None), ('bcontent', None),
+            ('claimedTime', None), ('date', None)):
+            self.__dict__.setdefault(name, value)
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set, which for a lazy Block means not loaded yet
+        if name in _HEADER_ATTRIBUTES:
+            self._loadHeader()
+        elif name in _CONTENT_ATTRIBUTES:
+            if self.decrypted:
+                # decrypted values came from the cache, only the raw block still has to be read
+                self.raw = onionrstorage.getData(self.getCore(), self.getHash()).decode()
+            else:
+                self.update()
+        elif name == 'date':
+            self._loadDate()
+        else:
+            raise AttributeError(name)
+        return self.__dict__[name]
+
+    def _loadHeader(self):
+        '''Load the header values of a lazy Block from the first line of the stored block only'''
+        try:
+            header = onionrstorage.getHeader(self.getCore(), self.getHash())
+            self._parseHeader(json.loads(header.decode()))
+        except Exception:
+            self.update() # fails (and throws away the block) the same way a full load would
+
+    def _loadDate(self):
+        self.date = self.getCore().getBlockDate(self.getHash())
+        if not self.date is None:
+            self.date = datetime.datetime.fromtimestamp(self.date)
+
+    def _parseHeader(self, header):
+        self.bheader = header
+        if ('encryptType' in self.bheader) and (self.bheader['encryptType'] in ('asym', 'sym')):
+            self.bmetadata = self.getHeader('meta', None)
+            self.isEncrypted = True
+        else:
+            self.bmetadata = json.loads(self.getHeader('meta', None))
+            self.isEncrypted = False
+        self.parent = self.getMetadata('parent', None)
+        self.btype = self.getMetadata('type', None)
+        self.signed = ('sig' in self.getHeader() and self.getHeader('sig') != '')
+        # TODO: detect if signer is hash of pubkey or not
+        self.signer = self.getHeader('signer', None)
+        self.signature = self.getHeader('sig', None)
+        self.claimedTime = self.getHeader('time', None)
+
     def decrypt(self, encodedData = True):
         '''
             Decrypt a block, loading decrypted data into their vars
@@ -72,17 +126,40 @@ class Block:
         core = self.getCore()
         # decrypt data
         if self.getHeader('encryptType') == 'asym':
+            outcome = core.getDecryptionOutcome(self.getHash())
+            if outcome is False:
+                return False # already tried, not for our active key
+            if self._loadDecrypted():
+                return True
+            forwardFailed = False
             try:
-                self.bcontent = core._crypto.pubKeyDecrypt(self.bcontent, encodedData=encodedData)
-                bmeta = core._crypto.pubKeyDecrypt(self.bmetadata, encodedData=encodedData)
+                # The metadata is small, try it first so blocks for someone else are rejected without reading the content
+                # In current blocks it holds the sealed key of the envelope with the other fields
+                try:
+                    bmeta = core._crypto.pubKeyDecrypt(self.bmetadata, encodedData=encodedData)
+                except nacl.exceptions.CryptoError:
+                    core.setDecryptionOutcome(self.getHash(), False)
+                    raise
+                if outcome is None:
+                    core.setDecryptionOutcome(self.getHash(), True)
+                envelopeKey = core._crypto.getEnvelopeKey(bmeta)
+                if envelopeKey is None:
+                    # older blocks seal each field seperately
+                    self.bcontent = core._crypto.pubKeyDecrypt(self.bcontent, encodedData=encodedData)
+                    self.signature = core._crypto.pubKeyDecrypt(self.signature, encodedData=encodedData)
+                    self.signer = core._crypto.pubKeyDecrypt(self.signer, encodedData=encodedData)
+                else:
+                    try:
+                        bmeta, self.signature, self.signer, self.bcontent = core._crypto.envelopeDecrypt(envelopeKey, self.bcontent, encodedData=encodedData)
+                    except ValueError:
+                        raise onionrexceptions.DecryptionError('Envelope does not have 4 fields')
+                    self.signed = len(self.signature) > 0
                 try:
                     bmeta = bmeta.decode()
                 except AttributeError:
                     # yet another bytes fix
                     pass
                 self.bmetadata = json.loads(bmeta)
-                self.signature = core._crypto.pubKeyDecrypt(self.signature, encodedData=encodedData)
-                self.signer = core._crypto.pubKeyDecrypt(self.signer, encodedData=encodedData)
                 self.bheader['signer'] = self.signer.decode()
                 self.signedData =  json.dumps(self.bmetadata) + self.bcontent.decode()
 
@@ -108,8 +185,8 @@ class Block:
                         self.bcontent = onionrusers.OnionrUser(self.getCore(), self.signer).forwardDecrypt(self.bcontent)
                     except (onionrexceptions.DecryptionError, nacl.exceptions.CryptoError) as e:
                         logger.error(str(e))
-                        pass
-            except nacl.exceptions.CryptoError:
+                        forwardFailed = True
+            except (nacl.exceptions.CryptoError, onionrexceptions.DecryptionError):
                 pass
                 #logger.debug('Could not decrypt block. Either invalid key or corrupted data')
             except onionrexceptions.ReplayAttack:
@@ -117,10 +194,35 @@ class Block:
             else:
                 retData = True
                 self.decrypted = True
+                if not forwardFailed and not self.getHash() is None:
+                    # a later forward key could still decrypt it, so only cache complete decryptions
+                    try:
+                        core.decryptedCache.put(self.getHash(), self.bcontent, self.bmetadata, self.signature, self.signer, self.signedData, self.verifySig())
+                    except Exception as e:
+                        logger.debug('Could not cache decrypted block %s' % (self.getHash(),), error = e)
         else:
             logger.warn('symmetric decryption is not yet supported by this API')
         return retData
 
+    def _loadDecrypted(self):
+        '''Load the decrypted values of the block from the decrypted block cache, returns bool of if they were cached'''
+        if self.getHash() is None:
+            return False
+        cached = self.getCore().decryptedCache.get(self.getHash())
+        if cached is None:
+            return False
+        self.bcontent = cached['content']
+        self.bmetadata = cached['metadata']
+        self.signature = cached['signature']
+        self.signer = cached['signer']
+        self.bheader['signer'] = self.signer.decode()
+        self.signedData = cached['signedData']
+        self.signed = len(self.signature) > 0
+        self.validSig = cached['validSig']
+        self._sigChecked = True
+        self.decrypted = True
+        return True
+
     def verifySig(self):
         '''
             Verify if a block's signature is signed by its claimed signer
@@ -128,6 +230,8 @@ class Block:
 
         core = self.getCore()
 
+        if self._sigChecked:
+            return self.validSig
         if core._crypto.edVerify(data=self.signedData, key=self.signer, sig=self.signature, encodedData=True):
             self.validSig = True
         else:
@@ -164,26 +268,11 @@ class Block:
                 self.blockFile = None
             # parse block
             self.raw = str(blockdata)
-            self.bheader = json.loads(self.getRaw()[:self.getRaw().index('\n')])
             self.bcontent = self.getRaw()[self.getRaw().index('\n') + 1:]
-            if ('encryptType' in self.bheader) and (self.bheader['encryptType'] in ('asym', 'sym')):
-                self.bmetadata = self.getHeader('meta', None)
-                self.isEncrypted = True
-            else:
-                self.bmetadata = json.loads(self.getHeader('meta', None))
-            self.parent = self.getMetadata('parent', None)
-            self.btype = self.getMetadata('type', None)
-            self.signed = ('sig' in self.getHeader() and self.getHeader('sig') != '')
-            # TODO: detect if signer is hash of pubkey or not
-            self.signer = self.getHeader('signer', None)
-            self.signature = self.getHeader('sig', None)
+            self._parseHeader(json.loads(self.getRaw()[:self.getRaw().index('\n')]))
             # signed data is jsonMeta + block content (no linebreak)
             self.signedData = (None if not self.isSigned() else self.getHeader('meta') + self.getContent())
-            self.date = self.getCore().getBlockDate(self.getHash())
-            self.claimedTime = self.getHeader('time', None)
-
-            if not self.getDate() is None:
-                self.date = datetime.datetime.fromtimestamp(self.getDate())
+            self._loadDate()
 
             self.valid = True
 
@@ -203,6 +292,7 @@ class Block:
             else:
                 logger.debug('Deleted invalid block %s.' % self.getHash(), timestamp = False)
 
+        self._setDefaults()
         self.valid = False
         return False
 
@@ -362,7 +452,7 @@ class Block:
             if self.parent == self.getHash():
                 self.parent = self
             elif Block.exists(self.parent):
-                self.parent = Block(self.getMetadata('parent'), core = self.getCore())
+                self.parent = Block(self.getMetadata('parent'), core = self.getCore(), lazy = True)
             else:
                 self.parent = None
 
@@ -518,15 +608,19 @@ class Block:
 
     # static functions
 
-    def getBlocks(type = None, signer = None, signed = None, parent = None, reverse = False, limit = None, core = None):
+    def getBlocks(type = None, signer = None, signed = None, parent = None, reverse = False, limit = None, offset = 0, core = None):
         '''
-            Returns a list of Block objects based on supplied filters
+            Returns a list of Block objects based on supplied filters. Filtering and pagination
+            are done by the block database, so only the returned blocks are loaded
 
             Inputs:
             - type (str): filters by block type
             - signer (str/list): filters by signer (one in the list has to be a signer)
             - signed (bool): filters out by whether or not the block is signed
-            - reverse (bool): reverses the list if True
+            - parent (str/Block): filters by parent block
+            - reverse (bool): newest blocks first if True
+            - limit (int): the most blocks to return
+            - offset (int): how many matching blocks to skip, for pagination
             - core (Core): lets you optionally supply a core instance so one doesn't need to be started
 
             Outputs:
@@ -536,55 +630,42 @@ class Block:
         try:
             core = (core if not core is None else onionrcore.Core())
 
-            if (not parent is None) and (not isinstance(parent, Block)):
-                parent = Block(hash = parent, core = core)
+            if isinstance(parent, Block):
+                parent = parent.getHash()
+            if not signer is None:
+                if isinstance(signer, (str, bytes)):
+                    signer = [signer]
+                signer = [key.decode() if isinstance(key, bytes) else key for key in signer]
 
+            core.indexOldBlocks()
             relevant_blocks = list()
-            blocks = (core.getBlockList() if type is None else core.getBlocksByType(type))
-
-            for block in blocks:
-                if Block.exists(block):
-                    block = Block(block, core = core)
-
-                    relevant = True
-
-                    if (not signed is None) and (block.isSigned() != bool(signed)):
-                        relevant = False
-                    if not signer is None:
-                        if isinstance(signer, (str,)):
-                            signer = [signer]
-                        if isinstance(signer, (bytes,)):
-                            signer = [signer.decode()]
-
-                        isSigner = False
-                        for key in signer:
-                            if block.isSigner(key):
-                                isSigner = True
-                                break
-
-                        if not isSigner:
-                            relevant = False
-
-                    if not parent is None:
-                        blockParent = block.getParent()
-
-                        if blockParent is None:
-                            relevant = False
-                        else:
-                            relevant = parent.getHash() == blockParent.getHash()
-
-                    if relevant and (limit is None or len(relevant_Blocks) <= int(limit)):
-                        relevant_blocks.append(block)
-
-            if bool(reverse):
-                relevant_blocks.reverse()
-
+            for blockHash, dateReceived in core.getBlocksByMetadata(blockType = type, signers = signer, signed = signed, parent = parent,
+                reverse = bool(reverse), limit = limit, offset = offset, withDates = True):
+                # lazy, so only what the caller uses is read. The date is known from the query already
+                block = Block(blockHash, core = core, lazy = True)
+                block.date = None if dateReceived is None else datetime.datetime.fromtimestamp(dateReceived)
+                relevant_blocks.append(block)
             return relevant_blocks
         except Exception as e:
             logger.debug('Failed to get blocks.', error = e)
 
         return list()
 
+    def verifySigs(blocks, core = None):
+        '''
+            Verifies the signatures of many Blocks at once (see OnionrCrypto.edVerifyMany), setting
+            each one's validSig like Block.verifySig would. Used when many blocks are stored at once
+
+            Inputs:
+            - blocks (list): the Blocks to verify, ones that are not signed or already checked are skipped
+        '''
+        core = (core if not core is None else onionrcore.Core())
+        unchecked = [block for block in blocks if not block._sigChecked and block.isSigned()]
+        results = core._crypto.edVerifyMany([(block.signedData, block.signer, block.signature) for block in unchecked])
+        for block, valid in zip(unchecked, results):
+            block.validSig = valid
+            block._sigChecked = True
+
     def mergeChain(child, file = None, maximumFollows = 1000, core = None):
         '''
             Follows a child Block to its root parent Block, merging content
@@ -18,10 +18,16 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
-import webbrowser, sys
+import sys, importlib
 import logger
-from . import pubkeymanager, onionrstatistics, daemonlaunch, filecommands, plugincommands, keyadders
-from . import banblocks, exportblocks, openwebinterface, resettor
+
+def load(name):
+    '''
+        Import a command module (such as daemonlaunch) when a command needs it, so short commands don't load the daemon.
+        Core is imported first, the modules it uses import each other in an order that only works starting from it
+    '''
+    import core
+    return importlib.import_module('onionrcommands.' + name)
 
 def show_help(o_inst, command):
 
@@ -110,10 +116,10 @@ def get_commands(onionr_inst):
     'listconn': onionr_inst.listConn,
     'list-conn': onionr_inst.listConn,
 
-    'import-blocks': onionr_inst.onionrUtils.importNewBlocks,
-    'importblocks': onionr_inst.onionrUtils.importNewBlocks,
+    'import-blocks': onionr_inst.importBlocks,
+    'importblocks': onionr_inst.importBlocks,
 
-    'introduce': onionr_inst.onionrCore.introduceNode,
+    'introduce': onionr_inst.introduceNode,
     'pex': onionr_inst.doPEX,
 
     'getpassword': onionr_inst.printWebPassword,
@@ -130,7 +136,7 @@ def get_commands(onionr_inst):
     'add-id': onionr_inst.addID,
     'change-id': onionr_inst.changeID,
 
-    'reset-tor': resettor.reset_tor
+    'reset-tor': onionr_inst.resetTor
     }
 
 cmd_help = {
@@ -33,6 +33,9 @@ def daemon(o_inst):
         Starts the Onionr communication daemon
     '''
 
+    # the communicator logs per block and peer, don't let that wait on the console or log file
+    logger.set_async(o_inst.onionrCore.config.get('log.async', True))
+
     # remove runcheck if it exists
     if os.path.isfile('%s/.runcheck' % (o_inst.onionrCore.dataDir,)):
         logger.debug('Runcheck file found on daemon start, deleting in advance.')
@@ -26,7 +26,8 @@ def show_stats(o_inst):
     try:
         # define stats messages here
         totalBlocks = len(o_inst.onionrCore.getBlockList())
-        signedBlocks = len(Block.getBlocks(signed = True))
+        o_inst.onionrCore.indexOldBlocks()
+        signedBlocks = o_inst.onionrCore.getBlockCount(signed = True)
         messages = {
             # info about local client
             'Onionr Daemon Status' : ((logger.colors.fg.green + 'Online') if o_inst.onionrUtils.isCommunicatorRunning(timeout = 9) else logger.colors.fg.red + 'Offline'),
@@ -40,7 +41,7 @@ def show_stats(o_inst):
             # count stats
             'div2' : True,
             'Known Peers' : str(max(len(o_inst.onionrCore.listPeers()) - 1, 0)),
-            'Enabled Plugins' : str(len(o_inst.onionrCore.config.get('plugins.enabled', list()))) + ' / ' + str(len(os.listdir(o_inst.dataDir + 'plugins/'))),
+            'Enabled Plugins' : str(len(o_inst.onionrCore.config.get('plugins.enabled', list()))) + ' / ' + str(len(os.listdir(o_inst.dataDir + 'plugins/')) if os.path.exists(o_inst.dataDir + 'plugins/') else 0),
             'Stored Blocks' : str(totalBlocks),
             'Percent Blocks Signed' : str(round(100 * signedBlocks / max(totalBlocks, 1), 2)) + '%'
         }
@@ -97,8 +98,7 @@ def show_peers(o_inst):
     o_inst.onionrCore.daemonQueueAdd('connectedPeers', responseID=randID)
     while True:
         try:
-            time.sleep(3)
-            peers = o_inst.onionrCore.daemonQueueGetResponse(randID)
+            peers = o_inst.onionrCore.daemonQueueGetResponse(randID, wait=10)
         except KeyboardInterrupt:
             break
         if not type(peers) is None:
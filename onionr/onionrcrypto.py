@@ -17,13 +17,124 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
-import os, binascii, base64, hashlib, time, sys, hmac, secrets
+import os, binascii, base64, hashlib, time, sys, hmac, secrets, threading, collections, struct
+import concurrent.futures, multiprocessing
 import nacl.signing, nacl.encoding, nacl.public, nacl.hash, nacl.pwhash, nacl.utils, nacl.secret
 import logger, onionrproofs
 import onionrexceptions, keymanager, core
 import config
 config.reload()
 
+ENVELOPE_VERSION = 2 # first byte of the sealed key in single envelope asym blocks, older blocks seal their JSON metadata there instead
+ENVELOPE_FIELD_LENGTH = struct.Struct('>I')
+
+VERIFY_PARALLEL_MIN = 256 # signatures in a batch before it is split over worker processes, smaller batches cost more to send than to verify
+VERIFY_CHUNK_SIZE = 64 # signatures sent to a verification worker at once
+
+PUBLIC_KEY_CACHE_SIZE = 256 # parsed peer public keys to keep, least recently used are dropped
+PRIVATE_KEY_CACHE_SIZE = 8 # parsed private keys (our own) to keep
+
+_keyLock = threading.Lock()
+_publicKeys = collections.OrderedDict() # base32 ed25519 public key: [VerifyKey, curve25519 PublicKey or None]
+_privateKeys = collections.OrderedDict() # sha3 of the base32 seed: (SigningKey, curve25519 PrivateKey)
+
+def _publicKey(pubkey, curve=False):
+    '''Return the parsed VerifyKey (or curve25519 PublicKey if curve) for a base32 ed25519 public key'''
+    with _keyLock:
+        try:
+            entry = _publicKeys[pubkey]
+            _publicKeys.move_to_end(pubkey)
+        except KeyError:
+            entry = None
+    if entry is None:
+        entry = [nacl.signing.VerifyKey(pubkey, encoder=nacl.encoding.Base32Encoder), None]
+        with _keyLock:
+            _publicKeys[pubkey] = entry
+            while len(_publicKeys) > PUBLIC_KEY_CACHE_SIZE:
+                _publicKeys.popitem(last=False)
+    if not curve:
+        return entry[0]
+    if entry[1] is None:
+        entry[1] = entry[0].to_curve25519_public_key()
+    return entry[1]
+
+def _privateKeyID(seed):
+    if isinstance(seed, str):
+        seed = seed.encode()
+    return hashlib.sha3_256(seed).digest()
+
+def _privateKey(seed, curve=False):
+    '''Return the parsed SigningKey (or curve25519 PrivateKey if curve) for a base32 ed25519 seed'''
+    keyID = _privateKeyID(seed)
+    with _keyLock:
+        try:
+            entry = _privateKeys[keyID]
+            _privateKeys.move_to_end(keyID)
+        except KeyError:
+            entry = None
+    if entry is None:
+        signingKey = nacl.signing.SigningKey(seed=seed, encoder=nacl.encoding.Base32Encoder)
+        entry = (signingKey, signingKey.to_curve25519_private_key())
+        with _keyLock:
+            _privateKeys[keyID] = entry
+            while len(_privateKeys) > PRIVATE_KEY_CACHE_SIZE:
+                _privateKeys.popitem(last=False)
+    return entry[1] if curve else entry[0]
+
+def forget_private_key(seed):
+    '''Drop a private key from the key cache, such as when it is removed'''
+    with _keyLock:
+        _privateKeys.pop(_privateKeyID(seed), None)
+
+def clear_key_cache():
+    with _keyLock:
+        _publicKeys.clear()
+        _privateKeys.clear()
+
+_verifyPool = None
+_verifyPoolLock = threading.Lock()
+
+def _verify_group(key, pairs):
+    '''Verify a list of (data, raw signature) against one key (VerifyKey or raw bytes), also run by verification worker processes'''
+    if not isinstance(key, nacl.signing.VerifyKey):
+        key = nacl.signing.VerifyKey(key)
+    results = []
+    for data, sig in pairs:
+        try:
+            key.verify(data, sig)
+        except (nacl.exceptions.BadSignatureError, nacl.exceptions.ValueError):
+            results.append(False)
+        else:
+            results.append(True)
+    return results
+
+def shutdown_verify_pool(wait=False):
+    '''Stop the verification worker processes, if any were started'''
+    global _verifyPool
+    with _verifyPoolLock:
+        pool = _verifyPool
+        _verifyPool = None
+    if not pool is None:
+        pool.shutdown(wait=wait)
+
+def _verify_workers_changed(keys):
+    # The pool is made again with the new amount of workers when it is next needed
+    shutdown_verify_pool()
+
+config.subscribe(_verify_workers_changed, ['general.verify_workers'])
+
+def _get_verify_pool():
+    '''Return the verification process pool, or None if general.verify_workers is 1 (the default)'''
+    global _verifyPool
+    workers = config.get('general.verify_workers', 1)
+    if workers <= 1:
+        return None
+    with _verifyPoolLock:
+        if _verifyPool is None:
+            # spawn, not fork: forking copies the daemon's threads, locks and open sockets into the workers
+            _verifyPool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _verifyPool
+
 class OnionrCrypto:
     def __init__(self, coreInstance):
         self._core = coreInstance
@@ -52,7 +163,7 @@ class OnionrCrypto:
     def edVerify(self, data, key, sig, encodedData=True):
         '''Verify signed data (combined in nacl) to an ed25519 key'''
         try:
-            key = nacl.signing.VerifyKey(key=key, encoder=nacl.encoding.Base32Encoder)
+            key = _publicKey(key)
         except nacl.exceptions.ValueError:
             #logger.debug('Signature by unknown key (cannot reverse hash)')
             return False
@@ -83,7 +194,7 @@ class OnionrCrypto:
             data = data.encode()
         except AttributeError:
             pass
-        key = nacl.signing.SigningKey(seed=key, encoder=nacl.encoding.Base32Encoder)
+        key = _privateKey(key)
         retData = ''
         if encodeResult:
             retData = key.sign(data, encoder=nacl.encoding.Base64Encoder).signature.decode() # .encode() is not the same as nacl.encoding
@@ -91,13 +202,52 @@ class OnionrCrypto:
             retData = key.sign(data).signature
         return retData
 
+    def edVerifyMany(self, items):
+        '''
+            Verify a list of (data, key, base64 signature) tuples, returns a list of bools in the same order.
+            Signatures are grouped by key so each key is only decoded once, and large batches are spread over worker processes
+        '''
+        results = [False] * len(items)
+        groups = {}
+        for i, (data, key, sig) in enumerate(items):
+            if data is None or not key:
+                continue
+            try:
+                sig = base64.b64decode(sig)
+            except (binascii.Error, TypeError):
+                continue
+            groups.setdefault(key, []).append((i, self._core._utils.strToBytes(data), sig))
+        pool = _get_verify_pool() if len(items) >= VERIFY_PARALLEL_MIN else None
+        jobs = []
+        for key, group in groups.items():
+            try:
+                verifyKey = _publicKey(key)
+            except (nacl.exceptions.ValueError, binascii.Error, TypeError):
+                continue
+            for start in range(0, len(group), VERIFY_CHUNK_SIZE):
+                chunk = group[start:start + VERIFY_CHUNK_SIZE]
+                pairs = [(data, sig) for i, data, sig in chunk]
+                if pool is None:
+                    jobs.append((chunk, pairs, verifyKey, _verify_group(verifyKey, pairs)))
+                else:
+                    jobs.append((chunk, pairs, verifyKey, pool.submit(_verify_group, bytes(verifyKey), pairs)))
+        for chunk, pairs, verifyKey, verified in jobs:
+            if isinstance(verified, concurrent.futures.Future):
+                try:
+                    verified = verified.result()
+                except concurrent.futures.process.BrokenProcessPool:
+                    verified = _verify_group(verifyKey, pairs)
+            for (i, data, sig), valid in zip(chunk, verified):
+                results[i] = valid
+        return results
+
     def pubKeyEncrypt(self, data, pubkey, encodedData=False):
         '''Encrypt to a public key (Curve25519, taken from base32 Ed25519 pubkey)'''
         retVal = ''
         box = None
         data = self._core._utils.strToBytes(data)
         
-        pubkey = nacl.signing.VerifyKey(pubkey, encoder=nacl.encoding.Base32Encoder()).to_curve25519_public_key()
+        pubkey = _publicKey(pubkey, curve=True)
 
         if encodedData:
             encoding = nacl.encoding.Base64Encoder
@@ -118,16 +268,53 @@ class OnionrCrypto:
             encoding = nacl.encoding.RawEncoder
         if privkey == '':
             privkey = self.privKey
-        ownKey = nacl.signing.SigningKey(seed=privkey, encoder=nacl.encoding.Base32Encoder()).to_curve25519_private_key()
-
-        if self._core._utils.validatePubKey(privkey):
-            privkey = nacl.signing.SigningKey(seed=privkey, encoder=nacl.encoding.Base32Encoder()).to_curve25519_private_key()
-            anonBox = nacl.public.SealedBox(privkey)
-        else:
-            anonBox = nacl.public.SealedBox(ownKey)
+        anonBox = nacl.public.SealedBox(_privateKey(privkey, curve=True))
         decrypted = anonBox.decrypt(data, encoder=encoding)
         return decrypted
 
+    def envelopeEncrypt(self, fields, pubkey):
+        '''
+            Encrypt a list of fields (str or bytes) to a public key with a single sealed box: a random symmetric key
+            is sealed to pubkey and the packed fields are encrypted with it (Salsa20-Poly1305 MAC).
+            Returns a tuple of the base64 encoded (sealed key, encrypted fields)
+        '''
+        key = nacl.utils.random(nacl.secret.SecretBox.KEY_SIZE)
+        packed = []
+        for field in fields:
+            field = self._core._utils.strToBytes(field)
+            packed.append(ENVELOPE_FIELD_LENGTH.pack(len(field)))
+            packed.append(field)
+        sealedKey = self.pubKeyEncrypt(bytes((ENVELOPE_VERSION,)) + key, pubkey, encodedData=True)
+        body = nacl.secret.SecretBox(key).encrypt(b''.join(packed), encoder=nacl.encoding.Base64Encoder)
+        return (sealedKey.decode(), body.decode())
+
+    @staticmethod
+    def getEnvelopeKey(opened):
+        '''Return the symmetric key from a decrypted sealed envelope key, or None if it is not one (such as the metadata of an older block)'''
+        if len(opened) == nacl.secret.SecretBox.KEY_SIZE + 1 and opened[0] == ENVELOPE_VERSION:
+            return opened[1:]
+        return None
+
+    def envelopeDecrypt(self, key, body, encodedData=True):
+        '''Decrypt the fields of an envelope with the key from getEnvelopeKey, returns a list of bytes'''
+        if encodedData:
+            encoding = nacl.encoding.Base64Encoder
+        else:
+            encoding = nacl.encoding.RawEncoder
+        packed = nacl.secret.SecretBox(key).decrypt(self._core._utils.strToBytes(body), encoder=encoding)
+        fields = []
+        position = 0
+        while position < len(packed):
+            if position + ENVELOPE_FIELD_LENGTH.size > len(packed):
+                raise onionrexceptions.DecryptionError('Envelope field length is truncated')
+            length = ENVELOPE_FIELD_LENGTH.unpack_from(packed, position)[0]
+            position += ENVELOPE_FIELD_LENGTH.size
+            if position + length > len(packed):
+                raise onionrexceptions.DecryptionError('Envelope field is truncated')
+            fields.append(packed[position:position + length])
+            position += length
+        return fields
+
     def symmetricEncrypt(self, data, key, encodedKey=False, returnEncoded=True):
         '''Encrypt data to a 32-byte key (Salsa20-Poly1305 MAC)'''
         if encodedKey:
@@ -211,6 +398,12 @@ class OnionrCrypto:
         result = prev
         return result
 
+    def keyID(self, pubkey=''):
+        '''Short id of a public key (the active one by default), for data only valid while that key is in use'''
+        if pubkey == '':
+            pubkey = self.pubKey
+        return self.sha3Hash(pubkey)[:16]
+
     def sha3Hash(self, data):
         try:
             data = data.encode()
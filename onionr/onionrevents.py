@@ -18,39 +18,195 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
+import collections, itertools, json, queue, threading, time
+import requests
 import config, logger, onionrplugins as plugins, onionrpluginapi as pluginapi
 from threading import Thread
+from daemonqueue import daemonQueue
+
+BLOCK_HISTORY = 1000 # recently stored blocks kept for streaming clients and subscription queue size
+STREAM_RETRY = 5 # seconds to wait before reconnecting to the daemon's block stream
+
+EVENT_WORKERS = 4 # default size of the thread pool running plugin event handlers
+PLUGIN_QUEUE_SIZE = 1000 # events waiting per plugin before event() blocks
+PLUGIN_QUEUE_WAIT = 5 # seconds event() blocks on a full plugin queue before dropping the event
+
+_core = None # Core for events fired without an Onionr instance, made once instead of for every event
 
 def get_pluginapi(onionr, data):
+    global _core
+    if onionr is None:
+        if _core is None:
+            _core = pluginapi.onionrcore.Core()
+        return pluginapi.pluginapi(onionr, data, core = _core)
     return pluginapi.pluginapi(onionr, data)
 
-def __event_caller(event_name, data = {}, onionr = None):
+class EventHandle:
+    '''
+        Returned by threaded events, join waits for every plugin's handler to finish
+        (like the thread event() used to return)
+    '''
+    def __init__(self, pending):
+        self._pending = pending
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if pending == 0:
+            self._done.set()
+
+    def _finished(self):
+        with self._lock:
+            self._pending -= 1
+            if self._pending <= 0:
+                self._done.set()
+
+    def join(self, timeout = None):
+        self._done.wait(timeout)
+
+    def is_alive(self):
+        return not self._done.is_set()
+
+class EventBus:
     '''
-        DO NOT call this function, this is for threading code only.
-        Instead, call onionrevents.event
+        Runs plugin event handlers on a fixed pool of worker threads. Each plugin has its own bounded
+        queue, handled by one worker at a time so a plugin sees its events in order, and a slow
+        plugin fills only its own queue. When a queue is full, event() waits for room (backpressure)
+        and drops the event if there is still none after PLUGIN_QUEUE_WAIT seconds
     '''
-    for plugin in plugins.get_enabled_plugins():
+    def __init__(self, workers = None, queueSize = PLUGIN_QUEUE_SIZE):
+        self.workers = workers
+        self.queueSize = queueSize
+        self._lock = threading.Lock()
+        self._queues = {} # plugin name: queue of (event name, handler, api, data, time queued)
+        self._scheduled = set() # plugins in the ready queue or being run by a worker
+        self._ready = queue.Queue()
+        self._threads = []
+        self._handlers = {} # event name: (enabled plugins, [(plugin name, handler)])
+        self._eventStats = {} # event name: [calls, seconds running, most seconds running, seconds queued]
+        self.dropped = collections.Counter()
+
+    def getHandlers(self, event_name):
+        '''Return a list of (plugin name, handler function) of the enabled plugins that handle an event'''
+        enabled = tuple(config.get('plugins.enabled', []))
         try:
-            call(plugins.get_plugin(plugin), event_name, data, get_pluginapi(onionr, data))
-        except ModuleNotFoundError as e:
-            logger.warn('Disabling nonexistant plugin "%s"...' % plugin)
-            plugins.disable(plugin, onionr, stop_event = False)
+            cachedEnabled, handlers = self._handlers[event_name]
+            if cachedEnabled == enabled:
+                return handlers
+        except KeyError:
+            pass
+        attribute = 'on_' + str(event_name).lower()
+        handlers = []
+        for plugin in enabled:
+            try:
+                module = plugins.get_plugin(plugin)
+            except ModuleNotFoundError:
+                logger.warn('Disabling nonexistant plugin "%s"...' % plugin)
+                plugins.disable(plugin, stop_event = False)
+                return self.getHandlers(event_name)
+            if hasattr(module, attribute):
+                handlers.append((plugin, getattr(module, attribute)))
+        self._handlers[event_name] = (enabled, handlers)
+        return handlers
+
+    def _startWorkers(self):
+        with self._lock:
+            if len(self._threads) > 0:
+                return
+            workers = self.workers
+            if workers is None:
+                workers = max(1, config.get('plugins.event_workers', EVENT_WORKERS))
+            for i in range(workers):
+                thread = Thread(target = self._work, name = 'onionr-event-worker-%s' % (i,), daemon = True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self, plugin, event_name, handler, api, data, queued = None, handle = None):
+        start = time.time()
+        try:
+            handler(api, data)
         except Exception as e:
             logger.warn('Event "%s" failed for plugin "%s".' % (event_name, plugin))
             logger.debug(str(e))
+        end = time.time()
+        with self._lock:
+            try:
+                stats = self._eventStats[event_name]
+            except KeyError:
+                stats = self._eventStats[event_name] = [0, 0.0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += end - start
+            stats[2] = max(stats[2], end - start)
+            if not queued is None:
+                stats[3] += start - queued
+        if not handle is None:
+            handle._finished()
+
+    def _work(self):
+        while True:
+            plugin = self._ready.get()
+            pluginQueue = self._queues[plugin]
+            for i in range(100): # let other plugins have a turn after this many events
+                try:
+                    event_name, handler, api, data, queued, handle = pluginQueue.get_nowait()
+                except queue.Empty:
+                    break
+                self._run(plugin, event_name, handler, api, data, queued, handle)
+            with self._lock:
+                if pluginQueue.empty():
+                    self._scheduled.discard(plugin)
+                    continue
+            self._ready.put(plugin)
+
+    def dispatch(self, event_name, data = {}, onionr = None, threaded = True):
+        '''Run or queue an event's handlers. Threaded events return an EventHandle'''
+        handlers = self.getHandlers(event_name)
+        if len(handlers) == 0:
+            return EventHandle(0) if threaded else None
+        api = get_pluginapi(onionr, data)
+        if not threaded:
+            for plugin, handler in handlers:
+                self._run(plugin, event_name, handler, api, data)
+            return
+        handle = EventHandle(len(handlers))
+        self._startWorkers()
+        for plugin, handler in handlers:
+            with self._lock:
+                try:
+                    pluginQueue = self._queues[plugin]
+                except KeyError:
+                    pluginQueue = self._queues[plugin] = queue.Queue(self.queueSize)
+            try:
+                pluginQueue.put((event_name, handler, api, data, time.time(), handle), timeout = PLUGIN_QUEUE_WAIT)
+            except queue.Full:
+                handle._finished()
+                self.dropped[plugin] += 1
+                logger.debug('Dropped event "%s" for plugin "%s", its event queue is full' % (event_name, plugin))
+                continue
+            with self._lock:
+                if plugin in self._scheduled:
+                    continue
+                self._scheduled.add(plugin)
+            self._ready.put(plugin)
+        return handle
 
+    def getStats(self):
+        '''Return a dict of per event handler timings and per plugin queue depths and dropped events'''
+        with self._lock:
+            eventStats = {}
+            for event_name, (calls, running, longest, queued) in self._eventStats.items():
+                eventStats[event_name] = {'calls': calls, 'averageTime': running / calls, 'maxTime': longest, 'averageWait': queued / calls}
+            return {'events': eventStats, 'queued': {plugin: q.qsize() for plugin, q in self._queues.items()}, 'dropped': dict(self.dropped)}
+
+eventBus = EventBus()
 
 def event(event_name, data = {}, onionr = None, threaded = True):
     '''
-        Calls an event on all plugins (if defined)
+        Calls an event on all plugins (if defined). Threaded events are queued for the event worker pool,
+        and return an EventHandle that can be joined to wait for the handlers
     '''
+    return eventBus.dispatch(event_name, data, onionr, threaded)
 
-    if threaded:
-        thread = Thread(target = __event_caller, args = (event_name, data, onionr))
-        thread.start()
-        return thread
-    else:
-        __event_caller(event_name, data, onionr)
+def get_event_stats():
+    return eventBus.getStats()
 
 def call(plugin, event_name, data = None, pluginapi = None):
     '''
@@ -71,3 +227,149 @@ def call(plugin, event_name, data = None, pluginapi = None):
             return False
     else:
         return True
+
+_blockLock = threading.Lock()
+_blockSubscriptions = []
+_recentBlocks = collections.deque(maxlen = BLOCK_HISTORY) # (sequence number, hash, type, metadata)
+_blockSequence = itertools.count(1)
+_lastSequence = 0
+
+def _block_matches(blockType, meta, filterType, filterMeta):
+    if filterType is not None and blockType != filterType:
+        return False
+    for key in filterMeta:
+        if meta.get(key) != filterMeta[key]:
+            return False
+    return True
+
+class BlockSubscription:
+    '''
+        Receives the hashes of newly stored blocks of a type, optionally only those whose metadata
+        has the given values (such as {'ch': 'channel'}). Hashes are queued for get, or passed to callback
+    '''
+    def __init__(self, blockType = None, meta = None, callback = None):
+        self.blockType = blockType
+        self.meta = dict(meta or {})
+        self.callback = callback
+        self.closed = False
+        self.missed = 0 # hashes dropped because nobody read the queue
+        self.lastEventID = 0 # last daemon stream event received, to resume after reconnecting
+        self._queue = queue.Queue(BLOCK_HISTORY)
+        self._seen = collections.deque(maxlen = BLOCK_HISTORY) # the same block can come from this process and the daemon
+
+    def matches(self, blockType, meta):
+        return _block_matches(blockType, meta, self.blockType, self.meta)
+
+    def put(self, blockHash):
+        if self.closed or blockHash in self._seen:
+            return
+        self._seen.append(blockHash)
+        if not self.callback is None:
+            try:
+                self.callback(blockHash)
+            except Exception as e:
+                logger.warn('Block subscription callback failed: %s' % (e,))
+            return
+        try:
+            self._queue.put_nowait(blockHash)
+        except queue.Full:
+            self.missed += 1
+
+    def get(self, timeout = None):
+        '''Wait up to timeout seconds for a new block hash, returns None if there was none'''
+        try:
+            return self._queue.get(timeout = timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        unsubscribe_blocks(self)
+
+def subscribe_blocks(blockType = None, meta = None, callback = None):
+    '''
+        Subscribe to blocks stored by this process. Use follow_daemon_blocks to also
+        receive the blocks the daemon stores when it runs in another process
+    '''
+    subscription = BlockSubscription(blockType, meta, callback)
+    with _blockLock:
+        _blockSubscriptions.append(subscription)
+    return subscription
+
+def unsubscribe_blocks(subscription):
+    subscription.closed = True
+    with _blockLock:
+        try:
+            _blockSubscriptions.remove(subscription)
+        except ValueError:
+            pass
+
+def publish_block(blockHash, blockType, meta = None):
+    '''Called when a block has been stored and its metadata processed'''
+    global _lastSequence
+    if not isinstance(meta, dict):
+        meta = {} # metadata of encrypted blocks we could not decrypt
+    with _blockLock:
+        _lastSequence = next(_blockSequence)
+        _recentBlocks.append((_lastSequence, blockHash, blockType, meta))
+        subscribers = [sub for sub in _blockSubscriptions if sub.matches(blockType, meta)]
+    for subscription in subscribers:
+        subscription.put(blockHash)
+
+def get_block_sequence():
+    '''Sequence number of the last published block'''
+    return _lastSequence
+
+def get_recent_blocks(since = 0, blockType = None, meta = {}):
+    '''
+        Return a list of (sequence number, hash) of the remembered blocks published after since that match.
+        Only the last BLOCK_HISTORY blocks are remembered
+    '''
+    retData = []
+    with _blockLock:
+        for seq, blockHash, bType, bMeta in reversed(_recentBlocks):
+            if seq <= since:
+                break
+            if _block_matches(bType, bMeta, blockType, meta):
+                retData.append((seq, blockHash))
+    retData.reverse()
+    return retData
+
+def _read_block_stream(coreInst, subscription):
+    params = {'meta': json.dumps(subscription.meta)}
+    if not subscription.blockType is None:
+        params['type'] = subscription.blockType
+    headers = {'token': config.get('client.webpassword')}
+    if subscription.lastEventID > 0:
+        headers['Last-Event-ID'] = str(subscription.lastEventID)
+    url = 'http://%s/blocks/stream' % (coreInst._utils.getClientAPIServer(),)
+    with requests.get(url, params = params, headers = headers, stream = True, timeout = (10, 70)) as resp:
+        if resp.status_code != 200:
+            raise ValueError('block stream returned %s' % (resp.status_code,))
+        for line in resp.iter_lines(decode_unicode = True):
+            if subscription.closed:
+                break
+            if line.startswith('id: '):
+                subscription.lastEventID = int(line[4:])
+            elif line.startswith('data: '):
+                subscription.put(line[6:])
+
+def _follow_daemon(coreInst, subscription):
+    while not subscription.closed:
+        try:
+            _read_block_stream(coreInst, subscription)
+        except Exception:
+            # daemon is not running (or restarted), try again later
+            if not subscription.closed:
+                time.sleep(STREAM_RETRY)
+
+def follow_daemon_blocks(coreInst, subscription):
+    '''
+        Feed a subscription with the blocks the daemon stores, over the client API block stream.
+        Does nothing if the daemon runs in this process, as its blocks are already published here.
+        Returns the thread reading the stream, or None
+    '''
+    if daemonQueue.daemonRunning:
+        return None
+    thread = Thread(target = _follow_daemon, args = (coreInst, subscription), daemon = True)
+    thread.start()
+    return thread
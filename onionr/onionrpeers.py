@@ -1,7 +1,7 @@
 '''
     Onionr - Private P2P Communication
 
-    This file contains both the PeerProfiles class for network profiling of Onionr nodes
+    This file contains both the PeerProfiles class for network profiling of Onionr nodes, and the shared in-memory table backing it
 '''
 '''
     This program is free software: you can redistribute it and/or modify
@@ -17,9 +17,105 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
-import sqlite3
+import sqlite3, threading
 import core, config, logger
 config.reload()
+
+_profileTables = {} # address database path: PeerProfileTable
+_profileTablesLock = threading.Lock()
+
+class PeerProfileTable:
+    '''
+        In memory copy of the score and connection times of known addresses, shared by everything
+        using the same address database in this process. Changes are written back in batches by flush()
+    '''
+    FIELDS = ('success', 'lastConnect', 'lastConnectAttempt')
+
+    def __init__(self, addressDB):
+        self.addressDB = addressDB
+        self._rows = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        '''Load every address from the database (one query), keeping changes not yet flushed'''
+        rows = {}
+        conn = sqlite3.connect(self.addressDB, timeout=30)
+        for row in conn.execute('SELECT address, success, lastConnect, lastConnectAttempt FROM adders;'):
+            rows[row[0]] = dict(zip(self.FIELDS, row[1:]))
+        conn.close()
+        with self._lock:
+            for address in self._dirty:
+                if address in rows:
+                    rows[address] = self._rows[address]
+            self._dirty &= set(rows)
+            self._rows = rows
+
+    def _getRow(self, address):
+        # Must hold self._lock. Addresses added since the last reload are loaded individually
+        try:
+            return self._rows[address]
+        except KeyError:
+            row = dict.fromkeys(self.FIELDS)
+            conn = sqlite3.connect(self.addressDB, timeout=30)
+            for dbRow in conn.execute('SELECT success, lastConnect, lastConnectAttempt FROM adders WHERE address = ?;', (address,)):
+                row = dict(zip(self.FIELDS, dbRow))
+            conn.close()
+            self._rows[address] = row
+            return row
+
+    def get(self, address, key):
+        with self._lock:
+            return self._getRow(address)[key]
+
+    def set(self, address, key, value):
+        with self._lock:
+            self._getRow(address)[key] = value
+            self._dirty.add(address)
+
+    def addScore(self, address, toAdd):
+        '''Add to an address's success score, returns the new score'''
+        with self._lock:
+            row = self._getRow(address)
+            try:
+                row['success'] = int(row['success']) + toAdd
+            except (TypeError, ValueError):
+                row['success'] = toAdd
+            self._dirty.add(address)
+            return row['success']
+
+    def forget(self, address):
+        with self._lock:
+            self._rows.pop(address, None)
+            self._dirty.discard(address)
+
+    def getAll(self):
+        '''Return a copy of every loaded row, as a dict of address: row dict'''
+        with self._lock:
+            return {address: dict(row) for address, row in self._rows.items()}
+
+    def flush(self):
+        '''Write changed rows to the database in one transaction'''
+        with self._lock:
+            changes = [tuple(self._rows[address][key] for key in self.FIELDS) + (address,) for address in self._dirty]
+            self._dirty = set()
+        if len(changes) == 0:
+            return
+        conn = sqlite3.connect(self.addressDB, timeout=30)
+        conn.executemany('UPDATE adders SET success = ?, lastConnect = ?, lastConnectAttempt = ? WHERE address = ?;', changes)
+        conn.commit()
+        conn.close()
+
+def getProfileTable(coreInst):
+    '''Return the shared PeerProfileTable for a core instance's address database'''
+    with _profileTablesLock:
+        try:
+            return _profileTables[coreInst.addressDB]
+        except KeyError:
+            table = _profileTables[coreInst.addressDB] = PeerProfileTable(coreInst.addressDB)
+            return table
+
 class PeerProfiles:
     '''
         PeerProfiles
@@ -35,55 +131,58 @@ class PeerProfiles:
         if not isinstance(coreInst, core.Core):
             raise TypeError("coreInst must be a type of core.Core")
         self.coreInst = coreInst
+        self.table = getProfileTable(coreInst)
 
         self.loadScore()
         self.getConnectTime()
         return
 
     def loadScore(self):
-        '''Load the node's score from the database'''
+        '''Load the node's score from the profile table'''
         try:
-            self.success = int(self.coreInst.getAddressInfo(self.address, 'success'))
+            self.success = int(self.table.get(self.address, 'success'))
         except (TypeError, ValueError) as e:
             self.success = 0
         self.score = self.success
     
     def getConnectTime(self):
         try:
-            self.connectTime = int(self.coreInst.getAddressInfo(self.address, 'lastConnect'))
+            self.connectTime = int(self.table.get(self.address, 'lastConnect'))
         except (KeyError, ValueError, TypeError) as e:
             pass
         
     def saveScore(self):
-        '''Save the node's score to the database'''
-        self.coreInst.setAddressInfo(self.address, 'success', self.score)
+        '''Save the node's score to the profile table (written to the database on the next flush)'''
+        self.table.set(self.address, 'success', self.score)
         return
 
     def addScore(self, toAdd):
         '''Add to the peer's score (can add negative)'''
-        self.score += toAdd
-        self.saveScore()
+        self.score = self.table.addScore(self.address, toAdd)
+
+def _sortKey(row):
+    try:
+        score = int(row['success'])
+    except (TypeError, ValueError):
+        score = 0
+    try:
+        connectTime = int(row['lastConnect'])
+    except (TypeError, ValueError):
+        connectTime = 9000
+    return (score, connectTime)
 
 def getScoreSortedPeerList(coreInst):
     if not type(coreInst is core.Core):
         raise TypeError('coreInst must be instance of core.Core')
 
+    table = getProfileTable(coreInst)
     peerList = coreInst.listAdders()
-    peerScores = {}
-    peerTimes = {}
-
+    rows = {}
     for address in peerList:
-        # Load peer's profiles into a list
-        profile = PeerProfiles(address, coreInst)
-        peerScores[address] = profile.score
-        if not isinstance(profile.connectTime, type(None)):
-            peerTimes[address] = profile.connectTime
-        else:
-            peerTimes[address] = 9000
+        rows[address] = {'success': table.get(address, 'success'), 'lastConnect': table.get(address, 'lastConnect')}
 
     # Sort peers by their score, greatest to least, and then last connected time
-    peerList = sorted(peerScores, key=peerScores.get, reverse=True)
-    peerList = sorted(peerTimes, key=peerTimes.get, reverse=True)
+    peerList = sorted(peerList, key=lambda address: _sortKey(rows[address]), reverse=True)
     return peerList
 
 def peerCleanup(coreInst):
@@ -93,29 +192,33 @@ def peerCleanup(coreInst):
 
     logger.info('Cleaning peers...')
 
-    adders = getScoreSortedPeerList(coreInst)
-    adders.reverse()
+    # One query for every address, with changes not yet flushed, then sort worst first in memory
+    table = getProfileTable(coreInst)
+    table.reload()
+    rows = table.getAll()
+    adders = sorted(rows, key=lambda address: _sortKey(rows[address]))
     
     if len(adders) > 1:
 
         minScore = int(config.get('peers.minimum_score', -100))
-        maxPeers = int(config.get('peers.max_stored', 5000))
 
         for address in adders:
-            # Remove peers that go below the negative score
-            if PeerProfiles(address, coreInst).score < minScore:
-                coreInst.removeAddress(address)
-                try:
-                    if (int(coreInst._utils.getEpoch()) - int(coreInst.getPeerInfo(address, 'dateSeen'))) >= 600:
-                        expireTime = 600
-                    else:
-                        expireTime = 86400
-                    coreInst._blacklist.addToDB(address, dataType=1, expire=expireTime)
-                except sqlite3.IntegrityError: #TODO just make sure its not a unique constraint issue
-                    pass
-                except ValueError:
-                    pass
-                logger.warn('Removed address ' + address + '.')
+            # Remove peers that go below the negative score, the rest are sorted above them
+            if _sortKey(rows[address])[0] >= minScore:
+                break
+            coreInst.removeAddress(address)
+            table.forget(address)
+            try:
+                if (int(coreInst._utils.getEpoch()) - int(coreInst.getPeerInfo(address, 'dateSeen'))) >= 600:
+                    expireTime = 600
+                else:
+                    expireTime = 86400
+                coreInst._blacklist.addToDB(address, dataType=1, expire=expireTime)
+            except sqlite3.IntegrityError: #TODO just make sure its not a unique constraint issue
+                pass
+            except ValueError:
+                pass
+            logger.warn('Removed address ' + address + '.')
 
     # Unban probably not malicious peers TODO improve
     coreInst._blacklist.deleteExpired(dataType=1)
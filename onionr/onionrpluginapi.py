@@ -18,7 +18,7 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
-import onionrplugins, core as onionrcore, logger
+import onionrplugins, core as onionrcore, logger, onionrevents as events
 
 class DaemonAPI:
     def __init__(self, pluginapi):
@@ -146,11 +146,30 @@ class WebAPI:
     def get_callbacks(self, scope = None):
         return self.pluginapi.get_onionr().api.getCallbacks(scope = scope)
 
+class BlockAPI:
+    def __init__(self, pluginapi):
+        self.pluginapi = pluginapi
+
+    def subscribe(self, blockType = None, meta = None, callback = None, follow_daemon = True):
+        '''
+            Get the hashes of new blocks of a type (and optional metadata values) as they are stored,
+            including those the daemon stores if it runs in another process
+        '''
+        subscription = events.subscribe_blocks(blockType, meta, callback)
+        if follow_daemon:
+            events.follow_daemon_blocks(self.pluginapi.get_core(), subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        events.unsubscribe_blocks(subscription)
+
 class pluginapi:
-    def __init__(self, onionr, data):
+    def __init__(self, onionr, data, core = None):
         self.onionr = onionr
         self.data = data
-        if self.onionr is None:
+        if not core is None:
+            self.core = core
+        elif self.onionr is None:
             self.core = onionrcore.Core()
         else:
             self.core = self.onionr.onionrCore
@@ -159,6 +178,7 @@ class pluginapi:
         self.plugins = PluginAPI(self)
         self.commands = CommandAPI(self)
         self.web = WebAPI(self)
+        self.blocks = BlockAPI(self)
 
     def get_onionr(self):
         return self.onionr
@@ -187,5 +207,8 @@ class pluginapi:
     def get_webapi(self):
         return self.web
 
+    def get_blockapi(self):
+        return self.blocks
+
     def is_development_mode(self):
         return self.get_onionr()._developmentMode
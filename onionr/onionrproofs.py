@@ -117,7 +117,7 @@ class DataPOW:
         
         self.data = nacl.hash.blake2b(self.data)
 
-        logger.info('Computing POW (difficulty: %s)...' % self.difficulty)
+        logger.info('Computing POW (difficulty: %s)...', args = (self.difficulty,))
 
         self.mainHash = '0' * 70
         self.puzzle = self.mainHash[0:min(self.difficulty, len(self.mainHash))]
@@ -149,8 +149,8 @@ class DataPOW:
         if iFound:
             endTime = math.floor(time.time())
             if self.reporting:
-                logger.debug('Found token after %s seconds: %s' % (endTime - startTime, token), timestamp=True)
-                logger.debug('Round count: %s' % (self.rounds,))
+                logger.debug('Found token after %s seconds: %s', timestamp=True, args = (endTime - startTime, token))
+                logger.debug('Round count: %s', args = (self.rounds,))
             self.result = (token, rand)
 
     def shutdown(self):
@@ -219,7 +219,7 @@ class POW:
             self.difficulty = getDifficultyForNewBlock(bytes(json_metadata + b'\n' + self.data), coreInst=myCore)
             
         
-        logger.info('Computing POW (difficulty: %s)...' % self.difficulty)
+        logger.info('Computing POW (difficulty: %s)...', args = (self.difficulty,))
 
         self.mainHash = '0' * 64
         self.puzzle = self.mainHash[0:min(self.difficulty, len(self.mainHash))]
@@ -259,7 +259,7 @@ class POW:
         if iFound:
             endTime = math.floor(time.time())
             if self.reporting:
-                logger.debug('Found token after %s seconds: %s' % (endTime - startTime, token), timestamp=True)
+                logger.debug('Found token after %s seconds: %s', timestamp=True, args = (endTime - startTime, token))
 
     def shutdown(self):
         self.hashing = False
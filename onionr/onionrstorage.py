@@ -94,4 +94,19 @@ def getData(coreInst, bHash):
             retData = block.read()
     else:
         retData = _dbFetch(coreInst, bHash)
-    return retData
\ No newline at end of file
+    return retData
+
+def getHeader(coreInst, bHash):
+    '''Return the header line of a block as bytes, reading only that line for blocks stored as files. None if there is no block'''
+    assert isinstance(coreInst, core.Core)
+    assert coreInst._utils.validateHash(bHash)
+
+    bHash = coreInst._utils.bytesToStr(bHash)
+    fileLocation = '%s/%s.dat' % (coreInst.blockDataLocation, bHash)
+    if os.path.exists(fileLocation):
+        with open(fileLocation, 'rb') as block:
+            return block.readline().rstrip(b'\n')
+    retData = _dbFetch(coreInst, bHash)
+    if retData is None:
+        return None
+    return retData.split(b'\n', 1)[0]
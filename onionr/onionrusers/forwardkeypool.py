@@ -0,0 +1,163 @@
+'''
+    Onionr - Private P2P Communication
+
+    Forward secrecy keys generated ahead of time for the contacts we send encrypted blocks to
+'''
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import sqlite3, threading, collections
+from onionrusers import onionrusers
+
+POOL_SIZE = 4 # ready keys kept for each contact
+MAX_CONTACTS = 50 # contacts to keep keys ready for, the least recently sent to are dropped past this
+MAX_KEY_AGE = 86400 # seconds a pooled key is kept, so keys handed out still have most of their lifetime
+
+_pools = {} # forward key database path: ForwardKeyPool, shared by everything in this process
+_poolsLock = threading.Lock()
+
+def get_pool(coreInst):
+    '''Return the key pool for a core instance's forward key database'''
+    with _poolsLock:
+        try:
+            return _pools[coreInst.forwardKeysFile]
+        except KeyError:
+            pool = _pools[coreInst.forwardKeysFile] = ForwardKeyPool(coreInst)
+            return pool
+
+class ForwardKeyPool:
+    '''
+        Key pairs are generated and saved to the forward key database in batches by the communicator
+        (see fill), so getKey can hand one out without generating one.
+        Contacts get a pool when we first send to them, friends get one when the pool is filled.
+        Pooled keys are saved with pooled set and an expiry of MAX_KEY_AGE, which is only extended when
+        a key is handed out. Ones left by an earlier run are deleted on the first fill and by shutdown
+    '''
+    def __init__(self, coreInst):
+        self._core = coreInst
+        self._keys = collections.OrderedDict() # peer: deque of (public key, creation time), least recently sent to first
+        self._stale = [] # (peer, public key) of saved keys that were dropped without being handed out
+        self._lock = threading.Lock()
+        self._started = False # set once keys left by an earlier run have been deleted
+        self.hits = 0
+        self.misses = 0
+
+    def _addContact(self, peer):
+        keys = self._keys[peer] = collections.deque()
+        while len(self._keys) > MAX_CONTACTS:
+            oldPeer, oldKeys = self._keys.popitem(last=False)
+            self._stale.extend((oldPeer, key[0]) for key in oldKeys)
+        return keys
+
+    def getKey(self, peer):
+        '''Return a new forward secrecy public key for a peer, generating one if none is ready'''
+        peer = self._core._utils.bytesToStr(peer)
+        curTime = self._core._utils.getEpoch()
+        with self._lock:
+            try:
+                keys = self._keys[peer]
+                self._keys.move_to_end(peer)
+            except KeyError:
+                keys = self._addContact(peer)
+            pubKey = None
+            while len(keys) > 0:
+                key = keys.popleft()
+                if curTime - key[1] < MAX_KEY_AGE:
+                    pubKey = key[0]
+                    break
+                self._stale.append((peer, key[0]))
+        if not pubKey is None and self._issue(peer, pubKey, curTime):
+            with self._lock:
+                self.hits += 1
+            return pubKey
+        with self._lock:
+            self.misses += 1
+        return onionrusers.OnionrUser(self._core, peer).generateForwardKey()
+
+    def _issue(self, peer, pubKey, curTime):
+        '''Give a pooled key the normal lifetime of a forward key, returns False if it is no longer saved'''
+        conn = sqlite3.connect(self._core.forwardKeysFile, timeout=10)
+        try:
+            c = conn.cursor()
+            c.execute("UPDATE myForwardKeys SET pooled = 0, expire = ? WHERE peer = ? AND publickey = ? AND pooled = 1;",
+                (curTime + onionrusers.DEFAULT_KEY_EXPIRE, peer, pubKey))
+            conn.commit()
+            return c.rowcount > 0
+        finally:
+            conn.close()
+
+    def fill(self):
+        '''
+            Generate keys for every pool that is not full and delete stale ones, saving them in one transaction.
+            Returns how many keys were generated
+        '''
+        curTime = self._core._utils.getEpoch()
+        friends = self._core.listPeers(randomOrder=False, trust=1)
+        with self._lock:
+            for friend in friends:
+                if not friend in self._keys and len(self._keys) < MAX_CONTACTS:
+                    self._addContact(friend)
+            for peer, keys in self._keys.items():
+                while len(keys) > 0 and curTime - keys[0][1] >= MAX_KEY_AGE:
+                    self._stale.append((peer, keys.popleft()[0]))
+            wanted = [(peer, POOL_SIZE - len(keys)) for peer, keys in self._keys.items() if len(keys) < POOL_SIZE]
+            stale = self._stale
+            self._stale = []
+            started = self._started
+            self._started = True
+
+        newKeys = []
+        for peer, amount in wanted:
+            for i in range(amount):
+                newKeys.append((peer,) + tuple(self._core._utils.bytesToStr(key) for key in self._core._crypto.generatePubKey()))
+        if len(newKeys) == 0 and len(stale) == 0 and started:
+            return 0
+        conn = sqlite3.connect(self._core.forwardKeysFile, timeout=10)
+        try:
+            c = conn.cursor()
+            if not started:
+                c.execute("DELETE FROM myForwardKeys WHERE pooled = 1;") # never handed out, the pool that made them is gone
+            c.executemany("INSERT INTO myForwardKeys (peer, publickey, privatekey, date, expire, pooled) VALUES(?, ?, ?, ?, ?, 1);",
+                [(peer, pubKey, privKey, curTime, curTime + MAX_KEY_AGE) for peer, pubKey, privKey in newKeys])
+            c.executemany("DELETE FROM myForwardKeys WHERE peer = ? AND publickey = ? AND pooled = 1;", stale)
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            for peer, pubKey, privKey in newKeys:
+                try:
+                    self._keys[peer].append((pubKey, curTime))
+                except KeyError:
+                    self._stale.append((peer, pubKey)) # contact was dropped while generating
+        return len(newKeys)
+
+    def shutdown(self):
+        '''Delete the keys that were never handed out, so they are not left in the database'''
+        with self._lock:
+            self._keys.clear()
+            self._stale = []
+            self._started = False
+        conn = sqlite3.connect(self._core.forwardKeysFile, timeout=10)
+        try:
+            conn.execute("DELETE FROM myForwardKeys WHERE pooled = 1;")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def getStats(self):
+        '''Return a dict of contacts with a pool, ready keys, the most keys the pools can hold and getKey hits/misses'''
+        with self._lock:
+            ready = sum(len(keys) for keys in self._keys.values())
+            return {'contacts': len(self._keys), 'ready': ready, 'capacity': len(self._keys) * POOL_SIZE, 'hits': self.hits, 'misses': self.misses}
@@ -17,32 +17,46 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
-import onionrblockapi, logger, onionrexceptions, json, sqlite3, time
+import onionrblockapi, logger, onionrexceptions, json, sqlite3, time, os, threading
 import nacl.exceptions
 
+_latestKeys = {} # (peer database path, peer public key): ((forward key, expire), peer database modification time it was read at)
+_latestKeysLock = threading.Lock()
+
+def _getModifiedTime(dbFile):
+    try:
+        return os.stat(dbFile).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
 def deleteExpiredKeys(coreInst):
-    # Fetch the keys we generated for the peer, that are still around
+    # Delete the keys we generated for peers that have expired
     conn = sqlite3.connect(coreInst.forwardKeysFile, timeout=10)
     c = conn.cursor()
 
     curTime = coreInst._utils.getEpoch()
     c.execute("DELETE from myForwardKeys where expire <= ?", (curTime,))
+    deleted = c.rowcount
     conn.commit()
-    conn.execute("VACUUM")
+    if deleted > 0:
+        conn.execute("VACUUM") # so the deleted private keys are not left in free pages
     conn.close()
-    return
+    return deleted
 
-def deleteTheirExpiredKeys(coreInst, pubkey):
+def deleteTheirExpiredKeys(coreInst, pubkey=None):
+    '''Delete expired forward keys of a peer, or of every peer if pubkey is None. Returns how many were deleted'''
     conn = sqlite3.connect(coreInst.peerDB, timeout=10)
     c = conn.cursor()
 
-    # Prepare the insert
-    command = (pubkey, coreInst._utils.getEpoch())
-
-    c.execute("DELETE from forwardKeys where peerKey = ? and expire <= ?", command)
+    if pubkey is None:
+        c.execute("DELETE from forwardKeys where expire <= ?", (coreInst._utils.getEpoch(),))
+    else:
+        c.execute("DELETE from forwardKeys where peerKey = ? and expire <= ?", (pubkey, coreInst._utils.getEpoch()))
+    deleted = c.rowcount
 
     conn.commit()
     conn.close()
+    return deleted
 
 DEFAULT_KEY_EXPIRE = 604800
 #DEFAULT_KEY_EXPIRE = 600
@@ -99,8 +113,7 @@ class OnionrUser:
         return decrypted
 
     def forwardEncrypt(self, data):
-        deleteTheirExpiredKeys(self._core, self.publicKey)
-        deleteExpiredKeys(self._core)
+        # Expired keys are deleted by the communicator's housekeeping, _getLatestForwardKey skips ones not deleted yet
         retData = ''
         forwardKey = self._getLatestForwardKey()
         if self._core._utils.validatePubKey(forwardKey[0]):
@@ -124,19 +137,29 @@ class OnionrUser:
         return retData
 
     def _getLatestForwardKey(self):
-        # Get the latest forward secrecy key for a peer
-        key = ""
+        # Get the latest forward secrecy key for a peer that has not expired
+        # The result is kept until the peer database changes (such as by another process adding a key)
+        curTime = self._core._utils.getEpoch()
+        cacheKey = (self._core.peerDB, self.publicKey)
+        mtime = _getModifiedTime(self._core.peerDB)
+        with _latestKeysLock:
+            cached = _latestKeys.get(cacheKey)
+        if not cached is None and cached[1] == mtime and (cached[0][1] is None or cached[0][1] > curTime):
+            return cached[0]
+
+        key = (None, None)
         conn = sqlite3.connect(self._core.peerDB, timeout=10)
         c = conn.cursor()
 
         # TODO: account for keys created at the same time (same epoch)
-        for row in c.execute("SELECT forwardKey, max(EXPIRE) FROM forwardKeys WHERE peerKey = ? ORDER BY expire DESC", (self.publicKey,)):
+        for row in c.execute("SELECT forwardKey, expire FROM forwardKeys WHERE peerKey = ? AND expire > ? ORDER BY expire DESC LIMIT 1", (self.publicKey, curTime)):
             key = (row[0], row[1])
-            break
 
-        conn.commit()
         conn.close()
 
+        with _latestKeysLock:
+            _latestKeys[cacheKey] = (key, mtime)
+
         return key
 
     def _getForwardKeys(self):
@@ -147,7 +170,6 @@ class OnionrUser:
         for row in c.execute("SELECT forwardKey, date FROM forwardKeys WHERE peerKey = ? ORDER BY expire DESC", (self.publicKey,)):
             keyList.append((row[0], row[1]))
 
-        conn.commit()
         conn.close()
 
         return list(keyList)
@@ -165,7 +187,7 @@ class OnionrUser:
 
         command = (self.publicKey, newPub, newPriv, time, expire + time)
 
-        c.execute("INSERT INTO myForwardKeys VALUES(?, ?, ?, ?, ?);", command)
+        c.execute("INSERT INTO myForwardKeys (peer, publickey, privatekey, date, expire) VALUES(?, ?, ?, ?, ?);", command)
 
         conn.commit()
         conn.close()
@@ -182,6 +204,7 @@ class OnionrUser:
 
         for result in c.execute("SELECT * FROM myForwardKeys WHERE peer = ?", command):
             keyList.append((result[1], result[2]))
+        conn.close()
 
         if len(keyList) == 0:
             if genNew:
@@ -216,6 +239,8 @@ class OnionrUser:
 
         conn.commit()
         conn.close()
+        with _latestKeysLock:
+            _latestKeys.pop((self._core.peerDB, self.publicKey), None)
         return True
     
     @classmethod
@@ -25,7 +25,7 @@ from onionrblockapi import Block
 import onionrexceptions, config, logger
 from onionr import API_VERSION
 import onionrevents
-import storagecounter
+import storagecounter, localcommands
 from etc import pgpwords, onionrvalues
 from onionrusers import onionrusers 
 if sys.version_info < (3, 6):
@@ -83,7 +83,17 @@ class OnionrUtils:
     def localCommand(self, command, data='', silent = True, post=False, postData = {}, maxWait=20):
         '''
             Send a command to the local http API server, securely. Intended for local clients, DO NOT USE for remote peers.
+            If the API runs in this process and registered a handler for the command (see localcommands), it is called directly
         '''
+        if data == '':
+            try:
+                retData = localcommands.dispatch(command, post, postData)
+            except Exception as error:
+                if not silent:
+                    logger.error('Failed to run local command %s in process' % (command,), error = error)
+                return False
+            if retData is not None:
+                return retData
         self.getTimeBypassToken()
         # TODO: URL encode parameters, just as an extra measure. May not be needed, but should be added regardless.
         hostname = ''
@@ -152,24 +162,34 @@ class OnionrUtils:
             meta = metadata['meta']
         return (metadata, meta, data)
 
-    def processBlockMetadata(self, blockHash):
-        '''
-            Read metadata from a block and cache it to the block database
-        '''
-        curTime = self.getRoundedEpoch(roundS=60)
+    def _readBlockToIndex(self, blockHash):
         myBlock = Block(blockHash, self._core)
         if myBlock.isEncrypted:
             myBlock.decrypt()
+        return myBlock
+
+    def indexBlockMetadata(self, blockHash, myBlock=None):
+        '''
+            Read metadata from a block and cache it to the block database, including the indexed signer,
+            signed flag, parent and claimed time used by Block.getBlocks.
+            Returns the Block if it could be read (and decrypted), otherwise None
+        '''
+        curTime = self.getRoundedEpoch(roundS=60)
+        if myBlock is None:
+            myBlock = self._readBlockToIndex(blockHash)
         if (myBlock.isEncrypted and myBlock.decrypted) or (not myBlock.isEncrypted):
             blockType = myBlock.getMetadata('type') # we would use myBlock.getType() here, but it is bugged with encrypted blocks
-            signer = self.bytesToStr(myBlock.signer)
-            valid = myBlock.verifySig()
-            if myBlock.getMetadata('newFSKey') is not None:
-                onionrusers.OnionrUser(self._core, signer).addForwardKey(myBlock.getMetadata('newFSKey'))
-                
+            myBlock.verifySig()
+            info = {'signed': int(myBlock.isSigned()), 'signer': self.bytesToStr(myBlock.signer) if myBlock.validSig else ''}
+            parent = myBlock.getMetadata('parent')
+            info['parent'] = parent if isinstance(parent, str) and self.validateHash(parent) else ''
+            try:
+                info['dateClaimed'] = int(myBlock.claimedTime)
+            except (ValueError, TypeError):
+                pass
             try:
                 if len(blockType) <= 10:
-                    self._core.updateBlockInfo(blockHash, 'dataType', blockType)
+                    info['dataType'] = blockType
             except TypeError:
                 logger.warn("Missing block information")
                 pass
@@ -180,13 +200,40 @@ class OnionrUtils:
             except (AssertionError, ValueError, TypeError) as e:
                 expireTime = onionrvalues.OnionrValues().default_expire + curTime
             finally:
-                self._core.updateBlockInfo(blockHash, 'expire', expireTime)
+                info['expire'] = expireTime
             if not blockType is None:
-                self._core.updateBlockInfo(blockHash, 'dataType', blockType)
-            onionrevents.event('processblocks', data = {'block': myBlock, 'type': blockType, 'signer': signer, 'validSig': valid}, onionr = self._core.onionrInst)
+                info['dataType'] = blockType
+            self._core.setBlockInfo(blockHash, info)
+            return myBlock
         else:
-            pass
+            # Mark it indexed so it is not read again, we can't see who signed it
+            self._core.setBlockInfo(blockHash, {'signed': 0, 'signer': '', 'parent': ''})
             #logger.debug('Not processing metadata on encrypted block we cannot decrypt.')
+            return None
+
+    def processBlockMetadata(self, blockHash, myBlock=None):
+        '''
+            Read metadata from a block and cache it to the block database
+        '''
+        myBlock = self.indexBlockMetadata(blockHash, myBlock)
+        if myBlock is None:
+            return
+        blockType = myBlock.getMetadata('type')
+        signer = self.bytesToStr(myBlock.signer)
+        valid = myBlock.validSig
+        if myBlock.getMetadata('newFSKey') is not None:
+            onionrusers.OnionrUser(self._core, signer).addForwardKey(myBlock.getMetadata('newFSKey'))
+        onionrevents.event('processblocks', data = {'block': myBlock, 'type': blockType, 'signer': signer, 'validSig': valid}, onionr = self._core.onionrInst)
+        onionrevents.publish_block(blockHash, blockType, myBlock.bmetadata)
+
+    def processBlockMetadataMany(self, blockHashes):
+        '''
+            processBlockMetadata for many newly stored blocks, verifying their signatures in one batch
+        '''
+        blocks = [self._readBlockToIndex(blockHash) for blockHash in blockHashes]
+        Block.verifySigs([block for block in blocks if block.decrypted or not block.isEncrypted], core=self._core)
+        for blockHash, myBlock in zip(blockHashes, blocks):
+            self.processBlockMetadata(blockHash, myBlock)
 
     def escapeAnsi(self, line):
         '''
@@ -425,6 +472,7 @@ class OnionrUtils:
             scanDir = self._core.blockDataLocation
         if not scanDir.endswith('/'):
             scanDir += '/'
+        imported = []
         for block in glob.glob(scanDir + "*.dat"):
             if block.replace(scanDir, '').replace('.dat', '') not in blockList:
                 exist = True
@@ -434,9 +482,10 @@ class OnionrUtils:
                     if self._core._crypto.sha3Hash(newBlock.read()) == block.replace('.dat', ''):
                         self._core.addToBlockDB(block.replace('.dat', ''), dataSaved=True)
                         logger.info('Imported block %s.' % block)
-                        self._core._utils.processBlockMetadata(block)
+                        imported.append(block)
                     else:
                         logger.warn('Failed to verify hash for %s' % block)
+        self.processBlockMetadataMany(imported)
         if not exist:
             logger.info('No blocks found to import')
 
@@ -461,9 +510,10 @@ class OnionrUtils:
         '''returns epoch'''
         return math.floor(time.time())
 
-    def doPostRequest(self, url, data={}, port=0, proxyType='tor'):
+    def doPostRequest(self, url, data={}, port=0, proxyType='tor', contentType=None, returnStatus=False):
         '''
         Do a POST request through a local tor or i2p instance
+        If returnStatus is set, returns (response text, status code), the status code is None if the request failed
         '''
         if proxyType == 'tor':
             if port == 0:
@@ -472,17 +522,25 @@ class OnionrUtils:
         elif proxyType == 'i2p':
             proxies = {'http': 'http://127.0.0.1:4444'}
         else:
+            if returnStatus:
+                return (None, None)
             return
         headers = {'user-agent': 'PyOnionr', 'Connection':'close'}
+        if contentType is not None:
+            headers['Content-Type'] = contentType
+        status = None
         try:
             proxies = {'http': 'socks4a://127.0.0.1:' + str(port), 'https': 'socks4a://127.0.0.1:' + str(port)}
             r = requests.post(url, data=data, headers=headers, proxies=proxies, allow_redirects=False, timeout=(15, 30))
             retData = r.text
+            status = r.status_code
         except KeyboardInterrupt:
             raise KeyboardInterrupt
         except requests.exceptions.RequestException as e:
             logger.debug('Error: %s' % str(e))
             retData = False
+        if returnStatus:
+            return (retData, status)
         return retData
 
     def doGetRequest(self, url, port=0, proxyType='tor', ignoreAPI=False, returnHeaders=False):
@@ -18,7 +18,8 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
-import core, json
+import core, json, onionrevents
+from onionrusers import forwardkeypool
 
 class SerializedData:
     def __init__(self, coreInst):
@@ -39,5 +40,14 @@ class SerializedData:
         stats['uptime'] = self._core.onionrInst.communicatorInst.getUptime()
         stats['connectedNodes'] = '\n'.join(self._core.onionrInst.communicatorInst.onlinePeers)
         stats['blockCount'] = len(self._core.getBlockList())
-        stats['blockQueueCount'] = len(self._core.onionrInst.communicatorInst.blockQueue)
+        queueStats = self._core.onionrInst.communicatorInst.blockQueue.getStats()
+        stats['blockQueueCount'] = queueStats['depth']
+        stats['blockQueueOldest'] = queueStats['oldestAge']
+        stats['blockQueueDropped'] = queueStats['dropped']
+        eventStats = onionrevents.get_event_stats()
+        stats['pluginEventsQueued'] = sum(eventStats['queued'].values())
+        stats['pluginEventsDropped'] = sum(eventStats['dropped'].values())
+        poolStats = forwardkeypool.get_pool(self._core).getStats()
+        stats['forwardKeyPoolReady'] = poolStats['ready']
+        stats['forwardKeyPoolCapacity'] = poolStats['capacity']
         return json.dumps(stats)
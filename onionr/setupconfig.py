@@ -46,6 +46,7 @@ def setup_config(dataDir, o_inst = None):
     if config.get('log.file.output', True):
         settings = settings | logger.OUTPUT_TO_FILE
     logger.set_settings(settings)
+    logger.set_rotation(config.get('log.file.max_size', 10000000), config.get('log.file.backups', 3))
 
     if not o_inst is None:
         if str(config.get('general.dev_mode', True)).lower() == 'true':
@@ -34,7 +34,7 @@ PLUGIN_VERSION = '0.0.1'
 class OnionrFlow:
     def __init__(self):
         self.myCore = pluginapi.get_core()
-        self.alreadyOutputed = []
+        self.alreadyOutputed = set()
         self.flowRunning = False
         self.channel = None
         return
@@ -69,27 +69,35 @@ class OnionrFlow:
     def showOutput(self):
         while type(self.channel) is type(None) and self.flowRunning:
             time.sleep(1)
+        blockAPI = pluginapi.get_blockapi()
+        # Subscribe before listing stored posts so none are missed in between, duplicates are skipped
+        subscription = blockAPI.subscribe('txt', meta={'ch': self.channel})
         try:
+            for blockHash in self.myCore.getBlocksByType('txt'):
+                if not self.flowRunning:
+                    break
+                self.showBlock(blockHash)
             while self.flowRunning:
-                for block in self.myCore.getBlocksByType('txt'):
-                    block = Block(block)
-                    if block.getMetadata('ch') != self.channel:
-                        #print('not chan', block.getMetadata('ch'))
-                        continue
-                    if block.getHash() in self.alreadyOutputed:
-                        #print('already')
-                        continue
-                    if not self.flowRunning:
-                        break
-                    logger.info('\n------------------------', prompt = False)
-                    content = block.getContent()
-                    # Escape new lines, remove trailing whitespace, and escape ansi sequences
-                    content = self.myCore._utils.escapeAnsi(content.replace('\n', '\\n').replace('\r', '\\r').strip())
-                    logger.info(block.getDate().strftime("%m/%d %H:%M") + ' - ' + logger.colors.reset + content, prompt = False)
-                    self.alreadyOutputed.append(block.getHash())
-                time.sleep(5)
+                blockHash = subscription.get(timeout=1)
+                if not blockHash is None:
+                    self.showBlock(blockHash)
         except KeyboardInterrupt:
             self.flowRunning = False
+        finally:
+            blockAPI.unsubscribe(subscription)
+
+    def showBlock(self, blockHash):
+        if blockHash in self.alreadyOutputed:
+            return
+        self.alreadyOutputed.add(blockHash)
+        block = Block(blockHash, core=self.myCore, lazy=True) # content is only read for posts in our channel
+        if block.getMetadata('ch') != self.channel:
+            return
+        logger.info('\n------------------------', prompt = False)
+        content = block.getContent()
+        # Escape new lines, remove trailing whitespace, and escape ansi sequences
+        content = self.myCore._utils.escapeAnsi(content.replace('\n', '\\n').replace('\r', '\\r').strip())
+        logger.info(block.getDate().strftime("%m/%d %H:%M") + ' - ' + logger.colors.reset + content, prompt = False)
 
 def on_init(api, data = None):
     '''
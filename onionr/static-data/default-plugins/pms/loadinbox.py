@@ -1,13 +1,20 @@
 import onionrblockapi
+_decrypted = {} # (block hash, our public key): bool of if the block could be decrypted, so each block is only decrypted once per key
+
 def load_inbox(myCore):
     inbox_list = []
     deleted = myCore.keyStore.get('deleted_mail')
     if deleted is None:
         deleted = []
 
+    pubKey = myCore._crypto.pubKey # blocks we could not decrypt are tried again after changing or importing keys
     for blockHash in myCore.getBlocksByType('pm'):
-        block = onionrblockapi.Block(blockHash, core=myCore)
-        block.decrypt()
-        if block.decrypted and blockHash not in deleted:
+        try:
+            decrypted = _decrypted[(blockHash, pubKey)]
+        except KeyError:
+            block = onionrblockapi.Block(blockHash, core=myCore, lazy=True)
+            block.decrypt()
+            decrypted = _decrypted[(blockHash, pubKey)] = block.decrypted
+        if decrypted and blockHash not in deleted:
             inbox_list.append(blockHash)
     return inbox_list
\ No newline at end of file
@@ -66,6 +66,7 @@ class OnionrMail:
         self.sentboxTools = sentboxdb.SentBox(self.myCore)
         self.sentboxList = []
         self.sentMessages = {}
+        self.pmBlockCache = {} # decrypted inbox blocks by hash, kept between listings
         self.doSigs = True
         return
 
@@ -80,9 +81,11 @@ class OnionrMail:
 
         # this could use a lot of memory if someone has received a lot of messages
         for blockHash in self.myCore.getBlocksByType('pm'):
-            pmBlocks[blockHash] = Block(blockHash, core=self.myCore)
-            pmBlocks[blockHash].decrypt()
-            blockCount = 0
+            # Only decrypt messages we have not seen in an earlier listing
+            if not blockHash in self.pmBlockCache:
+                self.pmBlockCache[blockHash] = Block(blockHash, core=self.myCore, lazy=True)
+                self.pmBlockCache[blockHash].decrypt()
+            pmBlocks[blockHash] = self.pmBlockCache[blockHash]
         for blockHash in pmBlocks:
             if not pmBlocks[blockHash].decrypted:
                 continue
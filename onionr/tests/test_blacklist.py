@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid, sqlite3
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr, onionrblacklist
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+
+class OnionrBlacklistTests(unittest.TestCase):
+    def test_blacklist(self):
+        blacklist = c._blacklist
+        blacklist.addToDB('bad block')
+        blacklist.addToDB('bad peer', dataType=1, expire=0)
+        self.assertTrue(blacklist.inBlacklist('bad block'))
+        self.assertFalse(blacklist.inBlacklist('good block'))
+        self.assertEqual(blacklist.inBlacklistMany(['good block', 'bad block', 'bad peer']), [False, True, True])
+        self.assertTrue(onionrblacklist.OnionrBlackList(c).inBlacklist('bad block')) # shared by other instances
+
+        blacklist.deleteExpired(dataType=1)
+        self.assertFalse(blacklist.inBlacklist('bad peer'))
+        self.assertTrue(blacklist.inBlacklist('bad block'))
+
+        # Changes from other processes are picked up
+        hashed = c._crypto.sha3Hash('added elsewhere')
+        conn = sqlite3.connect(blacklist.blacklistDB)
+        conn.execute('INSERT INTO blacklist (hash, dataType, blacklistDate, expire) VALUES(?, 0, 0, 0);', (hashed,))
+        conn.commit()
+        conn.close()
+        os.utime(blacklist.blacklistDB, ns=(0, 1)) # make sure the modification time differs even on coarse clocks
+        self.assertTrue(blacklist.inBlacklist('added elsewhere'))
+
+        blacklist.clearDB()
+        self.assertFalse(blacklist.inBlacklist('bad block'))
+
+unittest.main()
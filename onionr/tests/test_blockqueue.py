@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest
+from communicatorutils import blockqueue
+
+class OnionrBlockQueueTests(unittest.TestCase):
+
+    def test_dict_compatibility(self):
+        queue = blockqueue.BlockQueue()
+        queue.add('a', 'peer1')
+        queue.add('a', 'peer2')
+        queue.add('a', 'peer1')
+        self.assertEqual(len(queue), 1)
+        self.assertIn('a', queue)
+        self.assertEqual(queue['a'], ['peer1', 'peer2'])
+        del queue['a']
+        self.assertNotIn('a', queue)
+        self.assertIsNone(queue.pop())
+
+    def test_priority_order(self):
+        queue = blockqueue.BlockQueue()
+        queue.add('few', 'peer1')
+        queue.add('many', 'peer1')
+        queue.add('many', 'peer2')
+        queue.add('wanted', priority=blockqueue.PRIORITY_WANTED)
+        self.assertEqual([queue.pop()[0] for i in range(3)], ['wanted', 'many', 'few'])
+
+    def test_bounds(self):
+        queue = blockqueue.BlockQueue(maxSize=2)
+        for i in range(3):
+            queue.add(str(i))
+        for i in range(20):
+            queue.add('0', 'peer%s' % (i,))
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(len(queue['0']), blockqueue.MAX_PEERS_PER_BLOCK)
+        self.assertEqual(queue.getStats()['dropped'], 1)
+
+    def test_retry(self):
+        queue = blockqueue.BlockQueue()
+        queue.add('failing', 'peer1')
+        failed = queue.pop()
+        queue.add('fresh')
+        self.assertTrue(queue.retry(*failed))
+        # Blocks that failed go behind ones that have not been tried
+        self.assertEqual(queue.pop()[0], 'fresh')
+        failed = queue.pop()
+        self.assertEqual(failed, ('failing', ['peer1'], 1))
+        for i in range(blockqueue.MAX_ATTEMPTS - 2):
+            self.assertTrue(queue.retry(*failed))
+            failed = queue.pop()
+        self.assertFalse(queue.retry(*failed))
+        self.assertEqual(len(queue), 0)
+
+unittest.main()
@@ -1,19 +1,101 @@
 #!/usr/bin/env python3
 import sys, os
 sys.path.append(".")
-import unittest, uuid, hashlib
+import unittest, uuid, hashlib, json, time
 import nacl.exceptions
 import nacl.signing, nacl.hash, nacl.encoding
 TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
 print("Test directory:", TEST_DIR)
 os.environ["ONIONR_HOME"] = TEST_DIR
-import core, onionr
+import core, onionr, sqlite3, config
+from onionrblockapi import Block
+from communicatorutils import blockqueue, lookupblocks
 
 c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
 
 class OnionrBlockTests(unittest.TestCase):
     def test_plaintext_insert(self):
         message = 'hello world'
         c.insertBlock(message)
 
+    def test_get_blocks(self):
+        signedHash = c.insertBlock('signed', header='bin', sign=True)
+        childHash = c.insertBlock('child', header='bin', meta={'parent': signedHash})
+        self.assertEqual([b.getHash() for b in Block.getBlocks(type='bin', signed=True, core=c)], [signedHash])
+        self.assertEqual([b.getHash() for b in Block.getBlocks(type='bin', signer=c._crypto.pubKey, core=c)], [signedHash])
+        self.assertEqual([b.getHash() for b in Block.getBlocks(parent=signedHash, core=c)], [childHash])
+        # dateReceived is randomized a bit, so only compare the pages with each other
+        ordered = [b.getHash() for b in Block.getBlocks(type='bin', core=c)]
+        self.assertEqual(sorted(ordered), sorted([signedHash, childHash]))
+        self.assertEqual([b.getHash() for b in Block.getBlocks(type='bin', reverse=True, limit=1, core=c)], ordered[-1:])
+        self.assertEqual([b.getHash() for b in Block.getBlocks(type='bin', limit=1, offset=1, core=c)], ordered[1:])
+        self.assertEqual(c.getBlockCount(blockType='bin'), 2)
+        self.assertEqual(c.getBlockCount(blockType='bin', signed=False), 1)
+
+        # Blocks stored before the metadata columns existed are indexed when needed
+        conn = sqlite3.connect(c.blockDB)
+        conn.execute('UPDATE hashes SET signed = NULL, signer = NULL, parent = NULL;')
+        conn.commit()
+        conn.close()
+        # One that can't be read does not stop the others from being indexed, and is not read again
+        corruptHash = c.setData('not a block')
+        c.addToBlockDB(corruptHash, dataSaved=True)
+        core._indexedBlockDBs.discard(c.blockDB) # indexing runs once per process
+        self.assertEqual(c.getBlockCount(blockType='bin', signed=True), 0)
+        self.assertEqual([b.getHash() for b in Block.getBlocks(type='bin', signed=True, core=c)], [signedHash])
+        self.assertEqual(c.getBlockCount(parent=signedHash), 1)
+        conn = sqlite3.connect(c.blockDB)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM hashes WHERE dataSaved = 1 AND signed IS NULL;').fetchone(), (0,))
+        conn.close()
+
+        # Lazy blocks read the header first, and the content only when it is used
+        block = Block(childHash, core=c, lazy=True)
+        self.assertEqual(block.getType(), 'bin')
+        self.assertEqual(block.getMetadata('parent'), signedHash)
+        self.assertNotIn('bcontent', block.__dict__)
+        self.assertEqual(block.getContent(), 'child')
+        self.assertTrue(Block(signedHash, core=c, lazy=True).isSigner(c._crypto.pubKey))
+        blocks = [Block(signedHash, core=c), Block(childHash, core=c)]
+        Block.verifySigs(blocks, core=c)
+        self.assertEqual([b.validSig for b in blocks], [True, False])
+        self.assertEqual(block.getParent().getHash(), signedHash)
+
+    def test_asym_envelope(self):
+        # Each field is sealed seperately unless the envelope format is turned on, so older versions can read it
+        oldHash = c.insertBlock('old format', header='pm', encryptType='asym', asymPeer=c._crypto.pubKey, sign=True, disableForward=True)
+        block = Block(oldHash, core=c)
+        self.assertNotEqual(block.getHeader('sig'), '')
+        self.assertTrue(block.decrypt())
+        self.assertEqual(block.bcontent, b'old format')
+        self.assertTrue(block.verifySig())
+
+        config.set('general.asym_envelope', True)
+        try:
+            blockHash = c.insertBlock('hello envelope', header='pm', encryptType='asym', asymPeer=c._crypto.pubKey, sign=True, disableForward=True)
+        finally:
+            config.set('general.asym_envelope', False)
+        block = Block(blockHash, core=c)
+        self.assertEqual(block.getHeader('sig'), '') # sig and signer are inside the envelope
+        self.assertTrue(block.decrypt())
+        self.assertEqual(block.bcontent, b'hello envelope')
+        self.assertEqual(block.getMetadata('type'), 'pm')
+        self.assertTrue(block.isSigned())
+        self.assertTrue(block.verifySig())
+
+    def test_lookup_wants_parents(self):
+        class FakeCommunicator:
+            _core = c
+            blockQueue = blockqueue.BlockQueue()
+        # hashes with enough leading zeros to pass the pow check
+        hashes = ['0' * 16 + hashlib.sha3_256(str(i).encode()).hexdigest()[16:] for i in range(3)]
+        childHash = hashlib.sha3_256(b'child of a missing block').hexdigest()
+        c.addToBlockDB(childHash, dataSaved=True)
+        c.setBlockInfo(childHash, {'parent': hashes[2]})
+        self.assertEqual(c.getReferencedParents(hashes), {hashes[2]})
+
+        lookupblocks._add_to_queue(FakeCommunicator, 'peer', '\n'.join(hashes), set())
+        self.assertEqual(FakeCommunicator.blockQueue.pop()[0], hashes[2])
+        self.assertEqual(sorted([FakeCommunicator.blockQueue.pop()[0] for i in range(2)]), sorted(hashes[:2]))
+
 unittest.main()
\ No newline at end of file
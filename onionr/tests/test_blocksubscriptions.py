@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr, onionrevents
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+
+class OnionrBlockSubscriptionTests(unittest.TestCase):
+
+    def test_filter(self):
+        chanSub = onionrevents.subscribe_blocks('txt', {'ch': 'a'})
+        txtSub = onionrevents.subscribe_blocks('txt')
+        onionrevents.publish_block('1' * 64, 'txt', {'ch': 'a'})
+        onionrevents.publish_block('2' * 64, 'txt', {'ch': 'b'})
+        onionrevents.publish_block('3' * 64, 'pm', None)
+        self.assertEqual(chanSub.get(0), '1' * 64)
+        self.assertIsNone(chanSub.get(0))
+        self.assertEqual([txtSub.get(0), txtSub.get(0), txtSub.get(0)], ['1' * 64, '2' * 64, None])
+        chanSub.close()
+        onionrevents.unsubscribe_blocks(txtSub)
+        onionrevents.publish_block('4' * 64, 'txt', {'ch': 'a'})
+        self.assertIsNone(chanSub.get(0))
+
+    def test_recent(self):
+        since = onionrevents.get_block_sequence()
+        onionrevents.publish_block('5' * 64, 'txt', {'ch': 'c'})
+        onionrevents.publish_block('6' * 64, 'pm', {})
+        recent = onionrevents.get_recent_blocks(since, 'txt', {'ch': 'c'})
+        self.assertEqual([h for seq, h in recent], ['5' * 64])
+        self.assertEqual(len(onionrevents.get_recent_blocks(since)), 2)
+        self.assertEqual(onionrevents.get_recent_blocks(onionrevents.get_block_sequence()), [])
+
+    def test_insert_publishes(self):
+        received = []
+        sub = onionrevents.subscribe_blocks('txt', {'ch': 'test'}, callback=received.append)
+        # A block seen again (such as from the daemon stream) is only delivered once
+        blockHash = c.insertBlock('subscription test', header='txt', meta={'ch': 'test'})
+        sub.put(blockHash)
+        c.insertBlock('other channel', header='txt', meta={'ch': 'other'})
+        sub.close()
+        self.assertEqual(received, [blockHash])
+
+unittest.main()
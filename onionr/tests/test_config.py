@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid, json
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr, config
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+
+class OnionrConfigTests(unittest.TestCase):
+    def test_get_set(self):
+        config.set('test.nested.value', 5)
+        self.assertEqual(config.get('test.nested.value'), 5)
+        self.assertEqual(config.get('test.nested'), {'value': 5})
+        self.assertTrue(config.is_set('test.nested.value'))
+        self.assertEqual(config.get('test.nested.missing', 'default'), 'default')
+        self.assertEqual(config.get('test.nested.value.deeper', 'default'), 'default')
+        config.set('test.nested.value', None)
+        self.assertIsNone(config.get('test.nested.value'))
+        self.assertFalse(config.is_set('test.nested.value'))
+
+    def test_get_does_not_write(self):
+        config.save()
+        with open(config.get_config_file()) as configFile:
+            before = configFile.read()
+        self.assertEqual(config.get('test.saved_default', 7, save = True), 7)
+        self.assertEqual(config.get('test.saved_default'), 7)
+        with open(config.get_config_file()) as configFile:
+            self.assertEqual(configFile.read(), before)
+
+    def test_subscribers(self):
+        changes = []
+        config.subscribe(changes.append, ['test.watched'])
+        try:
+            config.set('test.watched.a', 1)
+            config.set('test.unwatched', 1)
+            config.set('test.watched.a', 1) # no change
+            self.assertEqual(changes, [['test.watched.a']])
+
+            # Reloading the file swaps in the new values and reports what changed
+            config.save()
+            with open(config.get_config_file()) as configFile:
+                data = json.load(configFile)
+            data['test']['watched']['a'] = 2
+            with open(config.get_config_file(), 'w') as configFile:
+                json.dump(data, configFile)
+            os.utime(config.get_config_file(), ns=(0, 1)) # make sure the modification time differs even on coarse clocks
+            config.reload()
+            self.assertEqual(config.get('test.watched.a'), 2)
+            self.assertEqual(changes, [['test.watched.a'], ['test.watched.a']])
+            config.reload() # file did not change
+            self.assertEqual(len(changes), 2)
+        finally:
+            config.unsubscribe(changes.append)
+
+unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid, time, threading
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr, config
+from communicatorutils import connectnewpeers
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+
+class FakeCommunicator:
+    '''Just what connect_new_peer_to_communicator uses, with peerAction answering from a function'''
+    def __init__(self, ping):
+        self._core = c
+        self.ping = ping
+        self.pinged = []
+        self.shutdown = False
+        self.onlinePeers = []
+        self.offlinePeers = []
+        self.cooldownPeer = {}
+        self.connectTimes = {}
+        self.newPeers = []
+        self.peerProfiles = []
+        self._lock = threading.Lock()
+
+    def addBootstrapListToPeerList(self, peerList):
+        pass
+
+    def peerAction(self, peer, action):
+        with self._lock:
+            self.pinged.append(peer)
+        return self.ping(self, peer)
+
+class OnionrConnectNewPeersTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.addresses = ['%sbcdefghijklmnop.onion' % (char,) for char in 'abcdef']
+        c.addAddresses(cls.addresses)
+
+    def setUp(self):
+        config.set('peers.parallel_connect', 8)
+        config.set('peers.connect_timeout', 60)
+
+    def test_stops_at_needed(self):
+        comm = FakeCommunicator(lambda comm, peer: 'pong!')
+        self.assertIn(connectnewpeers.connect_new_peer_to_communicator(comm, needed=2), self.addresses)
+        self.assertEqual(len(comm.onlinePeers), 2)
+        self.assertEqual(comm.offlinePeers, [])
+
+        # Peers that don't answer are marked as tried
+        comm = FakeCommunicator(lambda comm, peer: False)
+        self.assertFalse(connectnewpeers.connect_new_peer_to_communicator(comm, needed=2))
+        self.assertEqual(comm.onlinePeers, [])
+        self.assertEqual(sorted(comm.offlinePeers), sorted(comm.pinged))
+
+    def test_timeout(self):
+        config.set('peers.connect_timeout', 0.5)
+        release = threading.Event()
+        def slow_ping(comm, peer):
+            release.wait(5)
+            return 'pong!'
+        comm = FakeCommunicator(slow_ping)
+        start = time.time()
+        try:
+            self.assertFalse(connectnewpeers.connect_new_peer_to_communicator(comm, needed=2))
+            self.assertLess(time.time() - start, 3)
+            self.assertEqual(comm.onlinePeers, [])
+        finally:
+            release.set()
+
+    def test_shutdown(self):
+        config.set('peers.parallel_connect', 1)
+        def ping_then_shutdown(comm, peer):
+            comm.shutdown = True
+            return 'pong!'
+        comm = FakeCommunicator(ping_then_shutdown)
+        self.assertFalse(connectnewpeers.connect_new_peer_to_communicator(comm, needed=len(self.addresses)))
+        self.assertEqual(comm.onlinePeers, [])
+        self.assertLess(len(comm.pinged), len(self.addresses))
+
+unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid, threading, time
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr
+from daemonqueue import daemonQueue
+
+c = core.Core()
+c.daemonQueue() # creates the queue database
+
+class OnionrDaemonQueueTests(unittest.TestCase):
+
+    def test_database_fallback(self):
+        # Without a running daemon, commands are kept in the queue database
+        daemonQueue.daemonRunning = False
+        c.daemonQueueAdd('pex')
+        self.assertEqual(c.daemonQueue()[0], 'pex')
+        self.assertFalse(c.daemonQueue())
+
+    def test_in_process(self):
+        daemonQueue.daemonRunning = True
+        try:
+            c.daemonQueueAdd('uploadBlock', 'a')
+            c.daemonQueueAdd('connectedPeers', responseID='test')
+            self.assertFalse(c.daemonQueue()) # nothing went to the database
+            batch = daemonQueue.getBatch(timeout=1)
+            self.assertEqual([(cmd[0], cmd[1], cmd[4]) for cmd in batch], [('uploadBlock', 'a', ''), ('connectedPeers', '', 'test')])
+            self.assertEqual(daemonQueue.getBatch(timeout=0.01), [])
+
+            threading.Timer(0.1, daemonQueue.setResponse, args=['test', 'none']).start()
+            start = time.time()
+            self.assertEqual(c.daemonQueueWaitForResponse('test'), 'none')
+            self.assertLess(time.time() - start, 1)
+            self.assertEqual(c.daemonQueueGetResponse('test'), 'failure')
+        finally:
+            daemonQueue.daemonRunning = False
+
+unittest.main()
@@ -7,6 +7,7 @@ print("Test directory:", TEST_DIR)
 os.environ["ONIONR_HOME"] = TEST_DIR
 from urllib.request import pathname2url
 import core, onionr
+from utils import networkmerger
 
 c = core.Core()
 
@@ -30,6 +31,20 @@ class OnionrTests(unittest.TestCase):
         for address in invalidAddresses:
             self.assertNotIn(address, dbAddresses) 
     
+    def test_address_add_many(self):
+        addresses = ['%sbcdefghijklmnop.onion' % (char,) for char in 'qrstuvw']
+        c.addAddress(addresses[0])
+        added = c.addAddresses(addresses + [addresses[1], 'fake.onion', c.hsAddress])
+        self.assertEqual(added, addresses[1:])
+        self.assertEqual(c.addAddresses(addresses), [])
+        self.assertEqual(len([address for address in c.listAdders() if address in addresses]), len(addresses))
+
+        # The address database is not filled past maxStored
+        stored = len(c.listAdders())
+        more = ['%sbcdefghijklmnop.onion' % (char,) for char in 'xyz']
+        self.assertEqual(networkmerger.mergeAdders(','.join(more), c), True)
+        self.assertEqual(c.addAddresses(['abcdefghijklmnop.onion', 'bbcdefghijklmnop.onion'], maxStored=stored + 4), ['abcdefghijklmnop.onion'])
+
     def test_address_info(self):
         adder = 'nytimes3xbfgragh.onion'
         c.addAddress(adder)
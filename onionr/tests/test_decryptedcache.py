@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr
+from onionrblockapi import Block
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+
+class OnionrDecryptedCacheTests(unittest.TestCase):
+
+    def test_cache(self):
+        cache = c.decryptedCache
+        fakeHash = 'a' * 64
+        cache.put(fakeHash, b'secret content', {'type': 'pm'}, b'sig', b'signer', 'signed', True)
+        cached = cache.get(fakeHash)
+        self.assertEqual(cached['content'], b'secret content')
+        self.assertEqual(cached['metadata'], {'type': 'pm'})
+        self.assertTrue(cached['validSig'])
+        with open(cache.dbFile, 'rb') as dbFile:
+            self.assertNotIn(b'secret content', dbFile.read())
+
+        # Entries can only be read with the key pair that made them
+        oldKeys = (c._crypto.pubKey, c._crypto.privKey)
+        c._crypto.pubKey, c._crypto.privKey = c._crypto.generatePubKey()
+        try:
+            self.assertIsNone(cache.get(fakeHash))
+        finally:
+            c._crypto.pubKey, c._crypto.privKey = oldKeys
+        self.assertIsNotNone(cache.get(fakeHash))
+        cache.removeKey(c._crypto.pubKey)
+        self.assertIsNone(cache.get(fakeHash))
+
+    def test_block_decrypt(self):
+        blockHash = c.insertBlock('hello me', header='pm', encryptType='asym', asymPeer=c._crypto.pubKey, sign=True, disableForward=True)
+        block = Block(blockHash, core=c)
+        self.assertTrue(block.decrypt())
+        self.assertTrue(block.verifySig())
+        self.assertIsNotNone(c.decryptedCache.get(blockHash))
+
+        cachedBlock = Block(blockHash, core=c, decrypt=True, lazy=True)
+        self.assertTrue(cachedBlock.decrypted)
+        self.assertNotIn('raw', cachedBlock.__dict__) # no block data was read or decrypted
+        self.assertEqual(cachedBlock.bcontent, block.bcontent)
+        self.assertEqual(cachedBlock.getMetadata('type'), 'pm')
+        self.assertTrue(cachedBlock.verifySig())
+        self.assertEqual(cachedBlock.signer, block.signer)
+        self.assertEqual(cachedBlock.getRaw(), block.getRaw())
+
+        c.removeBlock(blockHash)
+        self.assertIsNone(c.decryptedCache.get(blockHash))
+
+    def test_decryption_outcome(self):
+        otherKeys = c._crypto.generatePubKey()
+        blockHash = c.insertBlock('not for me', header='pm', encryptType='asym', asymPeer=otherKeys[0], disableForward=True)
+        self.assertFalse(c.getDecryptionOutcome(blockHash))
+        block = Block(blockHash, core=c, lazy=True)
+        self.assertFalse(block.decrypt())
+        self.assertNotIn('bcontent', block.__dict__) # rejected without reading the content
+
+        # A different key has not been tried yet
+        oldKeys = (c._crypto.pubKey, c._crypto.privKey)
+        c._crypto.pubKey, c._crypto.privKey = otherKeys
+        try:
+            self.assertIsNone(c.getDecryptionOutcome(blockHash))
+            block = Block(blockHash, core=c, lazy=True)
+            self.assertTrue(block.decrypt())
+            self.assertEqual(block.bcontent, b'not for me')
+            self.assertTrue(c.getDecryptionOutcome(blockHash))
+        finally:
+            c._crypto.pubKey, c._crypto.privKey = oldKeys
+        self.assertFalse(c.getDecryptionOutcome(blockHash))
+
+unittest.main()
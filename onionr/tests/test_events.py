@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid, types, threading, time
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr, config, onionrplugins, onionrevents
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+
+received = []
+release = threading.Event()
+testPlugin = types.ModuleType('testplugin')
+testPlugin.on_testevent = lambda api, data: received.append((data['n'], api.get_data()['n']))
+testPlugin.on_slowevent = lambda api, data: release.wait(5)
+onionrplugins._instances['testplugin'] = testPlugin
+config.set('plugins.enabled', ['testplugin'])
+
+def wait_for(check):
+    for i in range(100):
+        if check():
+            return True
+        time.sleep(0.05)
+    return False
+
+class OnionrEventTests(unittest.TestCase):
+
+    def test_ordered_dispatch(self):
+        for i in range(50):
+            onionrevents.event('testevent', {'n': i})
+        self.assertTrue(wait_for(lambda: len(received) == 50))
+        self.assertEqual(received, [(i, i) for i in range(50)])
+        stats = onionrevents.get_event_stats()
+        self.assertEqual(stats['events']['testevent']['calls'], 50)
+        onionrevents.event('testevent', {'n': 50}, threaded=False)
+        self.assertEqual(received[-1], (50, 50))
+        self.assertEqual(onionrevents.eventBus.getHandlers('unhandledevent'), [])
+
+        # Threaded events return a handle to wait for the handlers, like the thread they used to return
+        handle = onionrevents.event('testevent', {'n': 51})
+        handle.join(5)
+        self.assertFalse(handle.is_alive())
+        self.assertEqual(received[-1], (51, 51))
+        self.assertFalse(onionrevents.event('unhandledevent').is_alive())
+
+    def test_pluginapi_per_event(self):
+        first = onionrevents.get_pluginapi(None, {'n': 1})
+        second = onionrevents.get_pluginapi(None, {'n': 2})
+        self.assertIs(first.get_core(), second.get_core())
+        self.assertEqual((first.get_data(), second.get_data()), ({'n': 1}, {'n': 2}))
+        self.assertEqual(first.plugins.pluginapi.get_data(), {'n': 1})
+
+    def test_backpressure(self):
+        bus = onionrevents.EventBus(workers=1, queueSize=2)
+        waitTime = onionrevents.PLUGIN_QUEUE_WAIT
+        onionrevents.PLUGIN_QUEUE_WAIT = 0.1
+        try:
+            bus.dispatch('slowevent', {})
+            self.assertTrue(wait_for(lambda: bus.getStats()['queued']['testplugin'] == 0))
+            for i in range(3): # one running, two queued, one dropped
+                bus.dispatch('slowevent', {})
+        finally:
+            onionrevents.PLUGIN_QUEUE_WAIT = waitTime
+            release.set()
+        self.assertEqual(bus.getStats()['dropped'], {'testplugin': 1})
+        self.assertTrue(wait_for(lambda: bus.getStats()['events'].get('slowevent', {}).get('calls') == 3))
+
+unittest.main()
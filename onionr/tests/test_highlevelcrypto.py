@@ -7,7 +7,7 @@ import nacl.signing, nacl.hash, nacl.encoding
 TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
 print("Test directory:", TEST_DIR)
 os.environ["ONIONR_HOME"] = TEST_DIR
-import core, onionr, onionrexceptions
+import core, onionr, onionrexceptions, onionrcrypto, config
 
 c = core.Core()
 crypto = c._crypto
@@ -98,6 +98,55 @@ class OnionrCryptoTests(unittest.TestCase):
         # Try to encrypt arbitrary bytes
         crypto.pubKeyEncrypt(os.urandom(32), keyPair2[0])
         
+    def test_key_cache(self):
+        keyPair = crypto.generatePubKey()
+        message = "hello world"
+        signature = crypto.edSign(message, key=keyPair[1], encodeResult=True)
+        self.assertTrue(crypto.edVerify(message, keyPair[0], signature))
+        self.assertTrue(crypto.edVerify(message, keyPair[0], signature)) # cached VerifyKey
+        self.assertFalse(crypto.edVerify(message + '!', keyPair[0], signature))
+        self.assertFalse(crypto.edVerify(message, 'invalid', signature))
+        encrypted = crypto.pubKeyEncrypt(message, keyPair[0], encodedData=True)
+        self.assertEqual(crypto.pubKeyDecrypt(encrypted, privkey=keyPair[1], encodedData=True).decode(), message)
+
+        # Peer keys are bounded, least recently used first
+        for i in range(onionrcrypto.PUBLIC_KEY_CACHE_SIZE + 1):
+            crypto.pubKeyEncrypt(message, crypto.generatePubKey()[0])
+        self.assertTrue(len(onionrcrypto._publicKeys) <= onionrcrypto.PUBLIC_KEY_CACHE_SIZE)
+        self.assertNotIn(keyPair[0], onionrcrypto._publicKeys)
+
+        # Removed keys are dropped from the cache
+        self.assertIn(onionrcrypto._privateKeyID(keyPair[1]), onionrcrypto._privateKeys)
+        onionrcrypto.forget_private_key(keyPair[1])
+        self.assertNotIn(onionrcrypto._privateKeyID(keyPair[1]), onionrcrypto._privateKeys)
+        self.assertEqual(crypto.pubKeyDecrypt(encrypted, privkey=keyPair[1], encodedData=True).decode(), message)
+
+    def test_verify_many(self):
+        keyPair = crypto.generatePubKey()
+        keyPair2 = crypto.generatePubKey()
+        items = []
+        for i in range(10):
+            message = 'message %s' % (i,)
+            items.append((message, keyPair[0], crypto.edSign(message, key=keyPair[1], encodeResult=True)))
+        items.append(('forged', keyPair2[0], crypto.edSign('forged', key=keyPair[1], encodeResult=True)))
+        items.append(('bad key', 'invalid', items[0][2]))
+        items.append(('bad sig', keyPair[0], 'not base64!'))
+        items.append((None, keyPair[0], items[0][2]))
+        expected = [True] * 10 + [False] * 4
+        self.assertEqual(crypto.edVerifyMany(items), expected)
+        self.assertEqual(crypto.edVerifyMany(items[:12]), [bool(crypto.edVerify(*item)) for item in items[:12]])
+
+        # Large batches go to worker processes
+        config.set('general.verify_workers', 2)
+        oldMin = onionrcrypto.VERIFY_PARALLEL_MIN
+        onionrcrypto.VERIFY_PARALLEL_MIN = 1
+        try:
+            self.assertEqual(crypto.edVerifyMany(items), expected)
+            self.assertIsNotNone(onionrcrypto._verifyPool)
+        finally:
+            onionrcrypto.VERIFY_PARALLEL_MIN = oldMin
+            config.set('general.verify_workers', 1)
+
     def test_symmetric(self):
         dataString = "this is a secret message"
         dataBytes = dataString.encode()
@@ -153,4 +202,5 @@ class OnionrCryptoTests(unittest.TestCase):
         self.assertTrue(gen1 == gen2)
         self.assertTrue(c._utils.validatePubKey(gen1[0]))
 
-unittest.main()
\ No newline at end of file
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr, localcommands
+
+c = core.Core()
+
+class OnionrLocalCommandTests(unittest.TestCase):
+
+    def test_dispatch(self):
+        calls = []
+        localcommands.register('testcmd', lambda arg, postData: calls.append((arg, postData)) or 'ok', post=True)
+        try:
+            self.assertEqual(c._utils.localCommand('/testcmd/abc', post=True, postData={'data': 1}), 'ok')
+            self.assertEqual(calls, [('abc', {'data': 1})])
+            # Only registered commands and methods are handled in process
+            self.assertIsNone(localcommands.dispatch('testcmd/abc'))
+            self.assertIsNone(localcommands.dispatch('testcmd/abc?x=1', post=True))
+            self.assertIsNone(localcommands.dispatch('othercmd', post=True))
+        finally:
+            localcommands.unregister('testcmd', post=True)
+        self.assertIsNone(localcommands.dispatch('testcmd/abc', post=True))
+
+    def test_handler_error(self):
+        def broken(arg, postData):
+            raise AttributeError
+        localcommands.register('brokencmd', broken)
+        try:
+            self.assertFalse(c._utils.localCommand('brokencmd'))
+        finally:
+            localcommands.unregister('brokencmd')
+
+unittest.main()
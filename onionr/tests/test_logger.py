@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr, logger
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+
+class Counted:
+    formatted = 0
+    def __str__(self):
+        Counted.formatted += 1
+        return 'counted'
+
+class OnionrLoggerTests(unittest.TestCase):
+    def setUp(self):
+        self.logFile = TEST_DIR + '%s.log' % (uuid.uuid4(),)
+        logger.set_file(self.logFile)
+        logger.set_settings(logger.OUTPUT_TO_FILE)
+        logger.set_level(logger.LEVEL_INFO)
+
+    def tearDown(self):
+        logger.set_async(False)
+        logger.set_rotation(0)
+
+    def readLog(self, path=None):
+        with open(path or self.logFile) as logFile:
+            return logFile.read()
+
+    def test_lazy_format(self):
+        logger.debug('not logged %s', args = (Counted(),))
+        self.assertEqual(Counted.formatted, 0)
+        logger.info('logged %s', args = (Counted(),))
+        self.assertEqual(Counted.formatted, 1)
+        self.assertIn('logged counted', self.readLog())
+
+    def test_async(self):
+        logger.set_async(True)
+        self.assertTrue(logger.get_async())
+        for i in range(100):
+            logger.info('message %s', args = (i,))
+        logger.flush()
+        self.assertEqual(self.readLog().count('message'), 100)
+        logger.info('last message')
+        logger.set_async(False) # everything queued is written before it returns
+        self.assertIn('last message', self.readLog())
+
+    def test_dropped(self):
+        logger.set_async(True, maxQueueSize = 1)
+        dropped = logger.get_dropped()
+        with logger._fileLock: # hold up the writer
+            for i in range(10):
+                logger.info('message %s', args = (i,))
+        logger.flush()
+        self.assertGreater(logger.get_dropped(), dropped)
+        self.assertIn('log messages dropped', self.readLog())
+
+    def test_writer_error(self):
+        logger.set_async(True)
+        writeFile = logger._write_file
+        def broken(lines):
+            logger._write_file = writeFile
+            raise ValueError('broken output')
+        logger._write_file = broken
+        try:
+            logger.info('lost message')
+            logger.flush() # returns even though the write failed
+        finally:
+            logger._write_file = writeFile
+        logger.info('after the error')
+        logger.flush()
+        self.assertIn('after the error', self.readLog())
+
+    def test_rotation(self):
+        logger.set_rotation(1000, backups = 2)
+        for i in range(300):
+            logger.info('message %s' % (i,))
+        self.assertLessEqual(os.path.getsize(self.logFile), 1000)
+        self.assertTrue(os.path.exists(self.logFile + '.1'))
+        self.assertTrue(os.path.exists(self.logFile + '.2'))
+        self.assertFalse(os.path.exists(self.logFile + '.3'))
+        self.assertIn('message 299', self.readLog())
+
+unittest.main()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 import sys, os
 sys.path.append(".")
-import unittest, uuid
+import unittest, uuid, sqlite3, collections
 import json
 TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
 print("Test directory:", TEST_DIR)
@@ -11,7 +11,7 @@ import core, onionr
 c = core.Core()
 import onionrexceptions
 from onionrusers import onionrusers
-from onionrusers import contactmanager
+from onionrusers import contactmanager, forwardkeypool
 
 class OnionrUserTests(unittest.TestCase):
     '''
@@ -65,6 +65,87 @@ class OnionrUserTests(unittest.TestCase):
         decrypted = c._crypto.pubKeyDecrypt(encrypted, privkey=contactPair[1], encodedData=True).decode()
         self.assertEqual('test', decrypted)
     
+    def test_forward_keys(self):
+        friendPair = c._crypto.generatePubKey()
+        friend = onionrusers.OnionrUser(c, friendPair[0], saveUser=True)
+        self.assertRaises(onionrexceptions.InvalidPubkey, friend.forwardEncrypt, 'test')
+
+        forwardPair = c._crypto.generatePubKey()
+        self.assertTrue(friend.addForwardKey(forwardPair[0]))
+        encrypted = friend.forwardEncrypt('test')
+        self.assertEqual(encrypted[1], forwardPair[0])
+        self.assertEqual(c._crypto.pubKeyDecrypt(encrypted[0], privkey=forwardPair[1], encodedData=True), b'test')
+
+        # Expired keys are not used, even before they are deleted
+        self.assertTrue(friend.addForwardKey(c._crypto.generatePubKey()[0], expire=-1))
+        self.assertEqual(friend.forwardEncrypt('test')[1], forwardPair[0])
+        self.assertEqual(onionrusers.deleteTheirExpiredKeys(c), 1)
+        self.assertEqual(len(friend._getForwardKeys()), 1)
+
+        # A key added by another process is noticed
+        newerKey = c._crypto.generatePubKey()[0]
+        conn = sqlite3.connect(c.peerDB)
+        conn.execute('INSERT INTO forwardKeys VALUES(?, ?, ?, ?);', (friendPair[0], newerKey, 0, c._utils.getEpoch() + onionrusers.DEFAULT_KEY_EXPIRE + 10))
+        conn.commit()
+        conn.close()
+        os.utime(c.peerDB, ns=(0, 1)) # make sure the modification time differs even on coarse clocks
+        self.assertEqual(friend.forwardEncrypt('test')[1], newerKey)
+
+    def test_forward_key_pool(self):
+        pool = forwardkeypool.get_pool(c)
+        self.assertIs(pool, forwardkeypool.get_pool(core.Core()))
+        contact = c._crypto.generatePubKey()[0]
+        user = onionrusers.OnionrUser(c, contact)
+        firstKey = pool.getKey(contact) # nothing ready yet, generated right away
+        self.assertEqual(pool.getStats()['misses'], 1)
+        self.assertIn(firstKey, [key[0] for key in user.getGeneratedForwardKeys(False)])
+
+        self.assertTrue(pool.fill() >= forwardkeypool.POOL_SIZE)
+        self.assertEqual(pool.fill(), 0)
+        stats = pool.getStats()
+        self.assertEqual(stats['ready'], stats['capacity'])
+        pooledKey = pool.getKey(contact)
+        self.assertEqual(pool.getStats()['hits'], 1)
+        self.assertIn(pooledKey, [key[0] for key in user.getGeneratedForwardKeys(False)]) # already saved, so replies can be decrypted
+
+        # Keys that were never handed out are deleted once too old
+        staleKeys = [key[0] for key in pool._keys[contact]]
+        pool._keys[contact] = collections.deque((key[0], key[1] - forwardkeypool.MAX_KEY_AGE) for key in pool._keys[contact])
+        pool.fill()
+        savedKeys = [key[0] for key in user.getGeneratedForwardKeys(False)]
+        for key in staleKeys:
+            self.assertNotIn(key, savedKeys)
+        self.assertIn(pooledKey, savedKeys)
+        self.assertEqual(len(pool._keys[contact]), forwardkeypool.POOL_SIZE)
+
+        # Only keys that were handed out get the normal lifetime and outlive the pool
+        conn = sqlite3.connect(c.forwardKeysFile)
+        expires = dict(conn.execute('SELECT publickey, expire - date FROM myForwardKeys WHERE peer = ?;', (contact,)).fetchall())
+        conn.close()
+        self.assertTrue(expires[pooledKey] > forwardkeypool.MAX_KEY_AGE)
+        for key in pool._keys[contact]:
+            self.assertEqual(expires[key[0]], forwardkeypool.MAX_KEY_AGE)
+        readyKeys = [key[0] for key in pool._keys[contact]]
+        pool.shutdown()
+        savedKeys = [key[0] for key in user.getGeneratedForwardKeys(False)]
+        self.assertIn(pooledKey, savedKeys)
+        self.assertIn(firstKey, savedKeys)
+        for key in readyKeys:
+            self.assertNotIn(key, savedKeys)
+
+        # Keys left by a run that did not shut down are deleted when the next one starts filling
+        pool.getKey(contact)
+        pool.fill()
+        leftKeys = [key[0] for key in pool._keys[contact]]
+        forwardkeypool._pools.clear()
+        forwardkeypool.get_pool(c).fill()
+        savedKeys = [key[0] for key in user.getGeneratedForwardKeys(False)]
+        for key in leftKeys:
+            self.assertNotIn(key, savedKeys)
+        self.assertIn(pooledKey, savedKeys)
+        pool.getKey(contact) # a key the old pool still holds is not handed out
+        self.assertEqual(pool.getStats()['hits'], 1)
+
     def test_delete_contact(self):
         contact = c._crypto.generatePubKey()[0]
         contact = contactmanager.ContactManager(c, contact, saveUser=True)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr, onionrpeers
+
+c = core.Core()
+
+class OnionrPeerProfileTests(unittest.TestCase):
+
+    def test_write_behind(self):
+        adder = 'nytimes3xbfgragh.onion'
+        c.addAddress(adder)
+        profile = onionrpeers.PeerProfiles(adder, c)
+        profile.addScore(5)
+        onionrpeers.PeerProfiles(adder, c).addScore(-2)
+        # Profiles share one table, the database is only written on flush
+        self.assertEqual(onionrpeers.PeerProfiles(adder, c).score, 3)
+        self.assertIn(c.getAddressInfo(adder, 'success'), (None, '', 0))
+        onionrpeers.getProfileTable(c).flush()
+        self.assertEqual(c.getAddressInfo(adder, 'success'), 3)
+
+    def test_cleanup_and_sort(self):
+        good = 'facebookcorewwwi.onion'
+        bad = 'duskgytldkxiuqc6.onion'
+        c.addAddress(good)
+        c.addAddress(bad)
+        onionrpeers.PeerProfiles(good, c).addScore(10)
+        onionrpeers.PeerProfiles(bad, c).addScore(-1000)
+        sortedPeers = onionrpeers.getScoreSortedPeerList(c)
+        self.assertLess(sortedPeers.index(good), sortedPeers.index(bad))
+        onionrpeers.peerCleanup(c)
+        self.assertIn(good, c.listAdders())
+        self.assertNotIn(bad, c.listAdders())
+
+unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest
+from communicatorutils import peerselector
+
+class OnionrPeerSelectorTests(unittest.TestCase):
+
+    def test_empty(self):
+        selector = peerselector.PeerSelector()
+        self.assertEqual(selector.pick([]), '')
+        self.assertEqual(selector.pick(['a'], exclude=['a']), '')
+        self.assertEqual(selector.pick(['a', 'b'], exclude=['a']), 'b')
+
+    def test_moving_averages(self):
+        selector = peerselector.PeerSelector()
+        selector.record('a', rtt=1.0)
+        selector.record('a', rtt=2.0)
+        selector.record('a', rtt=10.0, size=100000)
+        selector.record('a', success=False)
+        stats = selector.getStats('a')
+        self.assertAlmostEqual(stats.rtt, 1.3)
+        self.assertAlmostEqual(stats.throughput, 10000)
+        self.assertAlmostEqual(stats.failureRate, 0.3)
+        self.assertIsNone(selector.getStats('b'))
+
+    def test_weighted_pick(self):
+        selector = peerselector.PeerSelector()
+        selector.record('fast', rtt=0.5)
+        selector.record('slow', rtt=20.0)
+        for i in range(5):
+            selector.record('unreliable', rtt=0.5)
+            selector.record('unreliable', success=False)
+        picks = [selector.pick(['fast', 'slow', 'unreliable', 'new']) for i in range(2000)]
+        self.assertGreater(picks.count('fast'), picks.count('unreliable'))
+        self.assertGreater(picks.count('unreliable'), picks.count('slow'))
+        # Unmeasured peers are tried as often as the best known one, slow peers still get explored
+        self.assertGreater(picks.count('new'), picks.count('unreliable'))
+        self.assertGreater(picks.count('slow'), 0)
+
+unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, hashlib, secrets
+from utils import reconcile
+
+def random_hashes(amount):
+    return [hashlib.sha3_256(secrets.token_bytes(16)).hexdigest() for i in range(amount)]
+
+def make_remote(tree):
+    fetch_children = lambda prefixes: reconcile.parse_children(tree.serializeChildren(prefixes))
+    fetch_buckets = lambda prefixes: [h for prefix in prefixes for h in tree.bucket(prefix)]
+    return (fetch_children, fetch_buckets)
+
+class OnionrReconcileTests(unittest.TestCase):
+
+    def test_identical_stores(self):
+        hashes = random_hashes(500)
+        ours = reconcile.HashTree(hashes)
+        theirs = reconcile.HashTree(list(reversed(hashes)))
+        calls = []
+        fetch_children, fetch_buckets = make_remote(theirs)
+        def counting_children(prefixes):
+            calls.append(prefixes)
+            return fetch_children(prefixes)
+        self.assertEqual(reconcile.reconcile(ours, counting_children, fetch_buckets), ([], []))
+        self.assertEqual(calls, [['']])
+
+    def test_symmetric_difference(self):
+        shared = random_hashes(2000)
+        onlyTheirs = random_hashes(7)
+        onlyOurs = random_hashes(3)
+        ours = reconcile.HashTree(shared + onlyOurs)
+        theirs = reconcile.HashTree(shared + onlyTheirs)
+        missing, extra = reconcile.reconcile(ours, *make_remote(theirs))
+        self.assertEqual(sorted(missing), sorted(onlyTheirs))
+        self.assertEqual(sorted(extra), sorted(onlyOurs))
+
+    def test_empty_local(self):
+        theirs = random_hashes(100)
+        missing, extra = reconcile.reconcile(reconcile.HashTree([]), *make_remote(reconcile.HashTree(theirs)))
+        self.assertEqual(sorted(missing), sorted(theirs))
+        self.assertEqual(extra, [])
+
+    def test_unsupported_peer(self):
+        self.assertIsNone(reconcile.parse_children('<html>404</html>'))
+        self.assertIsNone(reconcile.parse_children('{"zz": [1, "abc"]}'))
+        self.assertIsNone(reconcile.reconcile(reconcile.HashTree(random_hashes(5)), lambda prefixes: None, lambda prefixes: []))
+
+    def test_large_difference_batched(self):
+        shared = random_hashes(5000)
+        onlyTheirs = random_hashes(500)
+        calls = []
+        fetch_children, fetch_buckets = make_remote(reconcile.HashTree(shared + onlyTheirs))
+        def counting_children(prefixes):
+            calls.append(prefixes)
+            return fetch_children(prefixes)
+        missing, extra = reconcile.reconcile(reconcile.HashTree(shared), counting_children, fetch_buckets)
+        self.assertEqual(sorted(missing), sorted(onlyTheirs))
+        self.assertLessEqual(len(calls), reconcile.MAX_REQUESTS)
+
+    def test_validate_prefix(self):
+        self.assertTrue(reconcile.validate_prefix(''))
+        self.assertTrue(reconcile.validate_prefix('0af'))
+        self.assertFalse(reconcile.validate_prefix('0AF'))
+        self.assertFalse(reconcile.validate_prefix('x'))
+        self.assertFalse(reconcile.validate_prefix('0' * (reconcile.MAX_DEPTH + 1)))
+
+unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid, subprocess
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+
+HEAVY_MODULES = ('core', 'api', 'communicator', 'flask', 'gevent', 'requests', 'onionrplugins')
+IMPORT_FRACTION = 0.5 # short commands may spend at most this much of the time it takes to import core on imports
+
+def run_imports(*args):
+    '''Run python with -X importtime, return its output and {module: cumulative seconds} of the top level imports'''
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + list(args), stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        selfTime, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '): # only the modules imported directly
+            imports[name.strip()] = int(cumulative) / 1000000
+    return result.stdout, imports
+
+class OnionrStartupTests(unittest.TestCase):
+    def test_version_imports(self):
+        output, imports = run_imports('onionr.py', 'version')
+        self.assertIn('Onionr v%s' % (onionr.ONIONR_VERSION,), output)
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, imports)
+
+        # Measured against importing core on the same machine, so the budget does not depend on how fast it is
+        coreTime = run_imports('-c', 'import core')[1]['core']
+        versionTime = sum(imports.values()) - imports.get('site', 0)
+        print('version imports: %.3fs, core: %.3fs' % (versionTime, coreTime))
+        self.assertLess(versionTime, coreTime * IMPORT_FRACTION)
+
+    def test_config_command(self):
+        output, imports = run_imports('onionr.py', 'config')
+        self.assertIn('Get a value', output)
+        self.assertNotIn('core', imports)
+
+unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid, io
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import flask
+from werkzeug.test import EnvironBuilder
+import core, onionr, onionrstorage
+from httpapi import miscpublicapi
+from communicatorutils import uploadblocks
+import onionrutils
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+
+class FakeClientAPI:
+    _core = c
+
+app = flask.Flask('test')
+@app.route('/upload/<name>', methods=['post'])
+def uploadRaw(name):
+    return miscpublicapi.raw_upload(FakeClientAPI, flask.request, name)
+client = app.test_client()
+
+formUploads = []
+oldApp = flask.Flask('old') # a peer running a version without the raw route
+@oldApp.route('/upload', methods=['post'])
+def uploadForm():
+    formUploads.append(flask.request.form['block'])
+    return 'success'
+app.add_url_rule('/upload', 'upload', uploadForm, methods=['post'])
+
+class FakeResponse:
+    def __init__(self, response):
+        self.text = response.get_data(as_text=True)
+        self.status_code = response.status_code
+
+def fake_post(url, data={}, headers={}, **kwargs):
+    peer, path = url[len('http://'):].split('/', 1)
+    peerClient = {'new.onion': client, 'old.onion': oldApp.test_client()}[peer]
+    return FakeResponse(peerClient.post('/' + path, data=data, content_type=headers.get('Content-Type')))
+
+class FakeCommunicator:
+    _core = c
+
+blockHash = c.insertBlock('raw upload test', header='txt')
+raw = onionrstorage.getData(c, blockHash)
+
+class OnionrRawUploadTests(unittest.TestCase):
+
+    def test_raw_upload(self):
+        self.assertEqual(client.post('/upload/' + blockHash, data=raw, content_type='application/octet-stream').data, b'exists')
+        c.removeBlock(blockHash)
+        self.assertNotIn(blockHash, c.getBlockList())
+        self.assertEqual(client.post('/upload/' + blockHash, data=raw, content_type='application/octet-stream').data, b'success')
+        self.assertIn(blockHash, c.getBlockList())
+
+    def test_rejections(self):
+        wrongHash = c._crypto.sha3Hash('not the block')
+        self.assertEqual(client.post('/upload/' + wrongHash, data=raw).status_code, 400)
+        self.assertEqual(client.post('/upload/notahash', data=raw).status_code, 400)
+        self.assertEqual(client.post('/upload/' + wrongHash, data=b'0' * (c.maxBlockSize + 1)).status_code, 413)
+        # A body without Content-Length can't be checked for size before reading it
+        chunked = EnvironBuilder(path='/upload/' + wrongHash, method='POST', input_stream=io.BytesIO(raw), headers={'Transfer-Encoding': 'chunked'})
+        self.assertEqual(client.open(chunked).status_code, 411)
+        c._blacklist.addToDB(wrongHash)
+        self.assertEqual(client.post('/upload/' + wrongHash, data=raw).status_code, 403)
+
+    def test_post_block(self):
+        post = onionrutils.requests.post
+        onionrutils.requests.post = fake_post
+        try:
+            del formUploads[:]
+            self.assertTrue(uploadblocks._post_block(FakeCommunicator, 'new.onion', blockHash, raw, 'tor'))
+            self.assertEqual(formUploads, [])
+
+            # A block the peer refuses is not sent again through the form upload
+            refusedHash = c._crypto.sha3Hash('refused block')
+            c._blacklist.addToDB(refusedHash)
+            self.assertIsNone(uploadblocks._post_block(FakeCommunicator, 'new.onion', refusedHash, raw, 'tor'))
+            self.assertEqual(formUploads, [])
+
+            # Peers without the raw route get the form upload
+            self.assertTrue(uploadblocks._post_block(FakeCommunicator, 'old.onion', blockHash, raw, 'tor'))
+            self.assertEqual(formUploads, [raw.decode()])
+        finally:
+            onionrutils.requests.post = post
+
+unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import sys, os
+sys.path.append(".")
+import unittest, uuid
+TEST_DIR = 'testdata/%s-%s' % (uuid.uuid4(), os.path.basename(__file__)) + '/'
+print("Test directory:", TEST_DIR)
+os.environ["ONIONR_HOME"] = TEST_DIR
+import core, onionr
+from communicatorutils import uploadblocks, peerselector
+
+c = core.Core()
+onionr.Onionr.setupConfig(TEST_DIR)
+
+class FakeCommunicator:
+    def __init__(self, peers):
+        self._core = c
+        self.shutdown = False
+        self.onlinePeers = list(peers)
+        self.blocksToUpload = []
+        self.peerSelector = peerselector.PeerSelector()
+
+    def pickOnlinePeer(self, exclude=()):
+        return self.peerSelector.pick(self.onlinePeers, exclude)
+
+    def decrementThreadCount(self, name):
+        pass
+
+class OnionrUploadTests(unittest.TestCase):
+    def setUp(self):
+        self.attempts = []
+        self.stoppedHiding = []
+        self.failures = 0
+        self._post_block = uploadblocks._post_block
+        self._stop_hiding = uploadblocks._stop_hiding
+        self.retryDelay = uploadblocks.RETRY_DELAY
+        uploadblocks._post_block = self.post_block
+        uploadblocks._stop_hiding = lambda comm_inst, blockHash: self.stoppedHiding.append(blockHash)
+        uploadblocks.RETRY_DELAY = 0.01
+
+    def tearDown(self):
+        uploadblocks._post_block = self._post_block
+        uploadblocks._stop_hiding = self._stop_hiding
+        uploadblocks.RETRY_DELAY = self.retryDelay
+
+    def post_block(self, comm_inst, peer, blockHash, raw, proxyType):
+        '''Fail the first self.failures uploads'''
+        self.attempts.append(peer)
+        return len(self.attempts) > self.failures
+
+    def saveBlock(self, data):
+        blockHash = c.setData(data)
+        c.addToBlockDB(blockHash, dataSaved=True)
+        return blockHash
+
+    def test_retries(self):
+        comm = FakeCommunicator(['abcdefghijklmnop.onion'])
+        self.failures = 2
+        self.assertTrue(uploadblocks._upload_to_peer(comm, 'abcdefghijklmnop.onion', 'hash', b'raw'))
+        self.assertEqual(len(self.attempts), 3)
+
+        self.attempts = []
+        self.failures = uploadblocks.UPLOAD_ATTEMPTS
+        self.assertFalse(uploadblocks._upload_to_peer(comm, 'abcdefghijklmnop.onion', 'hash', b'raw'))
+        self.assertEqual(len(self.attempts), uploadblocks.UPLOAD_ATTEMPTS)
+        # Failed uploads are counted against the peer
+        self.assertGreater(comm.peerSelector.getStats('abcdefghijklmnop.onion').failureRate, 0)
+
+        # A block the peer refused is not tried again
+        self.attempts = []
+        uploadblocks._post_block = lambda *args: self.attempts.append(args[1])
+        self.assertFalse(uploadblocks._upload_to_peer(comm, 'abcdefghijklmnop.onion', 'hash', b'raw'))
+        self.assertEqual(len(self.attempts), 1)
+
+    def test_upload_blocks(self):
+        blockHash = self.saveBlock('upload test %s' % (uuid.uuid4(),))
+        comm = FakeCommunicator(['abcdefghijklmnop.onion'])
+        comm.blocksToUpload.append(blockHash)
+
+        # The block stays hidden and queued while no peer accepted it
+        self.failures = uploadblocks.UPLOAD_ATTEMPTS
+        uploadblocks.upload_blocks_from_communicator(comm)
+        self.assertEqual(len(self.attempts), uploadblocks.UPLOAD_ATTEMPTS)
+        self.assertEqual(self.stoppedHiding, [])
+        self.assertEqual(comm.blocksToUpload, [blockHash])
+
+        self.attempts = []
+        self.failures = 1
+        comm.onlinePeers.append('bbcdefghijklmnop.onion')
+        uploadblocks.upload_blocks_from_communicator(comm)
+        self.assertEqual(self.stoppedHiding, [blockHash])
+        self.assertEqual(comm.blocksToUpload, [])
+        self.assertEqual(sorted(set(self.attempts)), sorted(comm.onlinePeers))
+
+unittest.main()
@@ -25,22 +25,15 @@ def mergeAdders(newAdderList, coreInst):
     try:
         retVal = False
         if newAdderList != False:
-            for adder in newAdderList.split(','):
-                adder = adder.strip()
-                if not adder in coreInst.listAdders(randomOrder = False) and adder != coreInst.hsAddress and not coreInst._blacklist.inBlacklist(adder):
-                    if not coreInst.config.get('tor.v3onions') and len(adder) == 62:
-                        continue
-                    if coreInst.addAddress(adder):
-                        # Check if we have the maxmium amount of allowed stored peers
-                        if coreInst.config.get('peers.max_stored_peers') > len(coreInst.listAdders()):
-                            logger.info('Added %s to db.' % adder, timestamp = True)
-                            retVal = True
-                        else:
-                            logger.warn('Reached the maximum amount of peers in the net database as allowed by your config.')
-                else:
-                    pass
-                    #logger.debug('%s is either our address or already in our DB' % adder)
+            newAdderList = [adder.strip() for adder in newAdderList.split(',')]
+            if not coreInst.config.get('tor.v3onions'):
+                newAdderList = [adder for adder in newAdderList if len(adder) != 62]
+            newAdderList = [adder for adder, blacklisted in zip(newAdderList, coreInst._blacklist.inBlacklistMany(newAdderList)) if not blacklisted]
+            # addAddresses skips our own and already known addresses, and adds the rest in one transaction
+            for adder in coreInst.addAddresses(newAdderList, maxStored = coreInst.config.get('peers.max_stored_peers')):
+                logger.info('Added %s to db.' % adder, timestamp = True)
+                retVal = True
         return retVal
     except Exception as error:
         logger.error('Failed to merge adders.', error = error)
-        return False
\ No newline at end of file
+        return False
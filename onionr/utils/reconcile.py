@@ -0,0 +1,179 @@
+'''
+    Onionr - Private P2P Communication
+
+    Bucketed hash tree for finding the difference between two block inventories
+'''
+'''
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import bisect, hashlib, json
+
+HEX_CHARS = '0123456789abcdef'
+DIGEST_LENGTH = 16 # hex characters of each bucket digest sent over the wire
+MAX_BUCKET_SIZE = 32 # buckets with this many hashes or less are listed instead of split further
+MAX_DEPTH = 6 # never split buckets further than this many hex characters
+MAX_REQUESTS = 32 # give up on a peer (and fall back to full lists) after this many requests in one round
+MAX_PREFIXES = 64 # most prefixes asked about in a single request
+
+class HashTree:
+    '''
+        Groups sorted block hashes into buckets by hex prefix. Each bucket is summarized by
+        its size and a truncated sha3 digest of its hashes, so two nodes can compare
+        inventories one level at a time and only descend into buckets that differ.
+    '''
+    def __init__(self, hashList):
+        self.hashes = sorted(set(h.lower() for h in hashList))
+        self._children = {}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def has(self, blockHash):
+        '''Return bool of if the hash is in the tree'''
+        i = bisect.bisect_left(self.hashes, blockHash)
+        return i < len(self.hashes) and self.hashes[i] == blockHash
+
+    def _range(self, prefix):
+        start = bisect.bisect_left(self.hashes, prefix)
+        end = bisect.bisect_left(self.hashes, prefix + 'g') # 'g' sorts after every hex character
+        return (start, end)
+
+    def bucket(self, prefix):
+        '''Return the hashes that start with prefix'''
+        start, end = self._range(prefix)
+        return self.hashes[start:end]
+
+    def children(self, prefix=''):
+        '''
+            Return a dict of child prefix -> (hash count, digest) for every non-empty
+            bucket one hex character below prefix
+        '''
+        try:
+            return self._children[prefix]
+        except KeyError:
+            pass
+        retData = {}
+        start, end = self._range(prefix)
+        depth = len(prefix)
+        i = start
+        while i < end:
+            child = self.hashes[i][:depth + 1]
+            hasher = hashlib.sha3_256()
+            count = 0
+            while i < end and self.hashes[i].startswith(child):
+                hasher.update(self.hashes[i].encode())
+                count += 1
+                i += 1
+            retData[child] = (count, hasher.hexdigest()[:DIGEST_LENGTH])
+        self._children[prefix] = retData
+        return retData
+
+    def serializeChildren(self, prefixes):
+        '''JSON encoded children of each prefix, used as the response body for peers'''
+        return json.dumps({prefix: self.children(prefix) for prefix in prefixes}, separators=(',', ':'))
+
+def validate_prefix(prefix):
+    '''Return bool of if prefix is a sane hex prefix for a bucket request'''
+    if not isinstance(prefix, str) or len(prefix) > MAX_DEPTH:
+        return False
+    for char in prefix:
+        if char not in HEX_CHARS:
+            return False
+    return True
+
+def parse_prefixes(data):
+    '''Parse a comma seperated prefix list from a request, returns None if it is invalid'''
+    prefixes = data.split(',')
+    if len(prefixes) > MAX_PREFIXES:
+        return None
+    for prefix in prefixes:
+        if not validate_prefix(prefix):
+            return None
+    return prefixes
+
+def parse_children(data):
+    '''
+        Parse a peer's serialized children into a dict of prefix -> HashTree.children format,
+        returns None if the response is not usable (such as from a peer without support)
+    '''
+    retData = {}
+    try:
+        data = json.loads(data)
+        assert isinstance(data, dict)
+        for prefix, children in data.items():
+            assert validate_prefix(prefix) and isinstance(children, dict)
+            retData[prefix] = {}
+            for child, value in children.items():
+                assert validate_prefix(child) and len(child) == len(prefix) + 1 and child.startswith(prefix)
+                retData[prefix][child] = (int(value[0]), str(value[1]))
+    except (AssertionError, ValueError, TypeError, IndexError, KeyError):
+        return None
+    return retData
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def reconcile(localTree, fetchChildren, fetchBuckets, maxBucketSize=MAX_BUCKET_SIZE, maxRequests=MAX_REQUESTS):
+    '''
+        Find the symmetric difference between our tree and a remote one, one tree level per round trip
+
+        fetchChildren(prefixes) must return the remote's children of each prefix (as parsed by parse_children) or None
+        fetchBuckets(prefixes) must return a list of the remote's hashes starting with any of the prefixes or None
+
+        Returns a tuple of (hashes the remote has that we don't, hashes we have that the remote doesn't),
+        or None if the remote could not be queried
+    '''
+    missing = []
+    extra = []
+    pending = ['']
+    requests = 0
+    while len(pending) > 0:
+        listBuckets = []
+        level = pending
+        pending = []
+        for batch in _chunks(level, MAX_PREFIXES):
+            requests += 1
+            if requests > maxRequests:
+                return None
+            remote = fetchChildren(batch)
+            if remote is None:
+                return None
+            for prefix in batch:
+                local = localTree.children(prefix)
+                remoteChildren = remote.get(prefix, {})
+                for child in local:
+                    if child not in remoteChildren:
+                        extra.extend(localTree.bucket(child))
+                for child, summary in remoteChildren.items():
+                    if local.get(child) == summary:
+                        continue
+                    if summary[0] <= maxBucketSize or len(child) >= MAX_DEPTH:
+                        listBuckets.append(child)
+                    else:
+                        pending.append(child)
+        for batch in _chunks(listBuckets, MAX_PREFIXES):
+            requests += 1
+            if requests > maxRequests:
+                return None
+            remoteHashes = fetchBuckets(batch)
+            if remoteHashes is None:
+                return None
+            remoteHashes = set(remoteHashes)
+            for prefix in batch:
+                for h in remoteHashes:
+                    if h.startswith(prefix) and not localTree.has(h):
+                        missing.append(h)
+                extra.extend(h for h in localTree.bucket(prefix) if h not in remoteHashes)
+    return (missing, extra)